@@ -0,0 +1,36 @@
+'''
+    Benchmark for Generator message creation rate.
+
+    Compares the per-character `random.choice` path against
+    vectorized NumPy generation, in messages per second.
+
+    Usage: PYTHONPATH=src python bench/bench_generator.py [sizes...]
+'''
+import sys
+import time
+
+from generator.generator import Generator
+
+DEFAULT_SIZES = [10_000, 100_000]
+
+def bench_generate(generator: Generator, num_messages: int) -> float:
+    '''
+        Return messages per second for generating
+        `num_messages` in blocks of 1000
+    '''
+    start = time.perf_counter()
+    for block in range(0, num_messages, 1000):
+        generator.generate_messages(min(1000, num_messages - block))
+    return num_messages / (time.perf_counter() - start)
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or DEFAULT_SIZES
+
+    print(f"{'messages':>10} {'python (msg/s)':>16} {'numpy (msg/s)':>16} {'speedup':>8}")
+    for size in sizes:
+        python_rate = bench_generate(Generator(seed=0), size)
+        numpy_rate = bench_generate(Generator(vectorized=True, seed=0), size)
+        print(f"{size:>10} {python_rate:16,.0f} {numpy_rate:16,.0f} {numpy_rate / python_rate:7.1f}x")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
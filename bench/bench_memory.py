@@ -0,0 +1,70 @@
+'''
+    Benchmark for memory held by queued messages.
+
+    Measures bytes allocated to hold N queued messages as plain 
+    dataclasses (the original Message), `__slots__` Messages and 
+    a single compact MessageBatch.
+
+    Usage: PYTHONPATH=src python bench/bench_memory.py [num_messages]
+'''
+import sys
+import tracemalloc
+from dataclasses import dataclass
+
+from generator.generator import Generator
+from msg_queue.msg_queue import DEFAULT_PRIORITY, Message, MessageQueue
+
+DEFAULT_SIZE = 1_000_000
+
+@dataclass
+class DictMessage():
+    '''
+        The original Message, with a per-instance `__dict__`,
+        kept here only as a benchmark reference
+    '''
+    message: str
+    phone: str
+
+def measure(build) -> int:
+    '''
+        Return bytes still allocated after calling `build`,
+        while its result is alive
+    '''
+    tracemalloc.start()
+    held = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size
+
+def main(argv):
+    size = int(argv[0]) if argv else DEFAULT_SIZE
+
+    def queue_dict_messages():
+        # MessageQueue only accepts Message, so the deque is filled directly
+        queue = MessageQueue()
+        for m in Generator(seed=0, vectorized=True).generate_messages(size):
+            queue._lanes[DEFAULT_PRIORITY].append(DictMessage(m.message, m.phone))
+        return queue
+
+    def queue_slot_messages():
+        queue = MessageQueue()
+        queue.push_many(Generator(seed=0, vectorized=True).generate_messages(size))
+        return queue
+
+    def queue_batch():
+        queue = MessageQueue()
+        queue.push_batch(Generator(seed=0).generate_batch(size))
+        return queue
+
+    print(f"{'representation':>16} {'total (MB)':>12} {'bytes/msg':>10}")
+    for name, build in [
+        ("dataclass", queue_dict_messages),
+        ("slots", queue_slot_messages),
+        ("MessageBatch", queue_batch)
+    ]:
+        total = measure(build)
+        print(f"{name:>16} {total / 1e6:12.1f} {total / size:10.1f}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
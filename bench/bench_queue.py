@@ -0,0 +1,71 @@
+'''
+    Benchmark for MessageQueue drain time.
+
+    Fills a queue with N messages, then times pulling every 
+    message back out. The original list-backed queue (pop(0)) is
+    included for comparison; since it is quadratic it is skipped
+    above LEGACY_MAX messages unless asked for explicitly.
+
+    Usage: PYTHONPATH=src python bench/bench_queue.py [sizes...] [--legacy-all]
+'''
+import sys
+import time
+from threading import Lock
+
+from msg_queue.msg_queue import Message, MessageQueue
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+LEGACY_MAX = 100_000
+
+class ListMessageQueue:
+    '''
+        The original MessageQueue implementation, kept here
+        only as a benchmark reference
+    '''
+
+    def __init__(self):
+        self._queue = []
+        self.q_lock = Lock()
+
+    def length(self) -> int:
+        return len(self._queue)
+
+    def push(self, msg: Message):
+        with self.q_lock:
+            self._queue.append(msg)
+
+    def pull(self) -> Message | None:
+        with self.q_lock:
+            if self.length() > 0:
+                return self._queue.pop(0)
+        return None
+
+def bench_drain(queue, num_messages: int) -> float:
+    '''
+        Fill `queue` with `num_messages` then return the
+        number of seconds needed to pull them all
+    '''
+    msg = Message(message="benchmark message", phone="1234567890")
+    for _ in range(num_messages):
+        queue.push(msg)
+
+    start = time.perf_counter()
+    while queue.pull() is not None:
+        pass
+    return time.perf_counter() - start
+
+def main(argv):
+    legacy_all = "--legacy-all" in argv
+    sizes = [int(arg) for arg in argv if arg != "--legacy-all"] or DEFAULT_SIZES
+
+    print(f"{'messages':>10} {'deque (s)':>12} {'list (s)':>12}")
+    for size in sizes:
+        deque_time = bench_drain(MessageQueue(), size)
+        if legacy_all or size <= LEGACY_MAX:
+            list_time = f"{bench_drain(ListMessageQueue(), size):12.4f}"
+        else:
+            list_time = f"{'skipped':>12}"
+        print(f"{size:>10} {deque_time:12.4f} {list_time}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,119 @@
+'''
+    Benchmark for reporting results to the Monitor API.
+
+    Starts the Monitor backend with uvicorn on a local port, then
+    times T threads reporting N results in total, either through
+    a new connection per report (module-level `httpx.post`, as
+    MonitorService used to), through the pooled keep-alive
+    client MonitorService now shares, or buffered and posted in
+    batches of BUFFER_SIZE, either as JSON or in the compact
+    binary report format.
+
+    Usage: PYTHONPATH=src python bench/bench_report.py [num_reports] [threads...]
+'''
+import sys
+import threading
+import time
+from multiprocessing import Process
+
+import httpx
+import uvicorn
+
+from monitor.backend.main import app
+from msg_queue.msg_queue import Message
+from sender.sender import MonitorService
+
+HOST = "127.0.0.1"
+PORT = 8765
+URL = f"http://{HOST}:{PORT}"
+
+DEFAULT_REPORTS = 2_000
+DEFAULT_THREADS = [1, 4, 16]
+BUFFER_SIZE = 100
+
+class UnpooledMonitorService(MonitorService):
+    '''
+        The original MonitorService reporting, opening a new
+        connection per report, kept here only as a benchmark
+        reference
+    '''
+
+    def report_message(self, message: Message, result: bool, delay: float):
+        res = httpx.post(self.url + "/message", json={
+            "message": message.message,
+            "phone": message.phone,
+            "success": result,
+            "delay": delay
+        })
+        if res.status_code != 200:
+            raise Exception("Error reporting to Monitor API")
+
+def start_backend() -> Process:
+    '''
+        Run the Monitor backend in its own process and wait
+        until it answers
+    '''
+    proc = Process(target=uvicorn.run, args=(app,), kwargs={
+        "host": HOST,
+        "port": PORT,
+        "log_level": "error"
+    })
+    proc.start()
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(URL)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+    proc.terminate()
+    raise RuntimeError("Monitor backend did not start")
+
+def bench_reports(monitor: MonitorService, num_reports: int, num_threads: int) -> float:
+    '''
+        Return reports per second achieved by `num_threads`
+        threads sharing `num_reports` reports through `monitor`,
+        including flushing any it buffered
+    '''
+    msg = Message(message="benchmark message", phone="1234567890")
+    per_thread = num_reports // num_threads
+
+    def report():
+        for _ in range(per_thread):
+            monitor.report_message(msg, True, 0.1)
+
+    threads = [threading.Thread(target=report) for _ in range(num_threads)]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    monitor.close()
+    return per_thread * num_threads / (time.perf_counter() - start)
+
+def main(argv):
+    num_reports = int(argv[0]) if argv else DEFAULT_REPORTS
+    thread_counts = [int(arg) for arg in argv[1:]] or DEFAULT_THREADS
+
+    backend = start_backend()
+    try:
+        print(f"{'threads':>8} {'compact (/s)':>14} {'batched (/s)':>14} {'pooled (/s)':>13} {'unpooled (/s)':>15}")
+        for threads in thread_counts:
+            compact = bench_reports(
+                MonitorService(URL, buffer_size=BUFFER_SIZE, report_format="compact"), 
+                num_reports, 
+                threads
+            )
+            batched = bench_reports(MonitorService(URL, buffer_size=BUFFER_SIZE), num_reports, threads)
+            pooled = bench_reports(MonitorService(URL, pool_size=threads), num_reports, threads)
+            unpooled = bench_reports(UnpooledMonitorService(URL), num_reports, threads)
+            print(f"{threads:>8} {compact:14.0f} {batched:14.0f} {pooled:13.0f} {unpooled:15.0f}")
+    finally:
+        backend.terminate()
+        backend.join()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,300 @@
+'''
+    Benchmark suite for every simulator component.
+
+    Runs each component's benchmark at several scales and thread
+    counts, keeping the best of REPEATS runs of each case as a rate
+    per second. Results can be saved as JSON with -o, and compared
+    against results saved the same way with -b, in which case the
+    suite exits with status 1 if any case is more than the
+    tolerance (-t, a fraction) slower than its baseline.
+
+    Components:
+        queue      MessageQueue push/pull with producer and consumer threads contending
+        generator  Generator messages per second in each generation mode, and replaying a corpus file
+        sender     Sender overhead per message with no delay, recording results locally
+        endpoint   /message requests per second against the Monitor backend under uvicorn
+        e2e        Headless simulation messages per second in each execution mode
+
+    Usage: PYTHONPATH=src python bench/bench_suite.py [components...] [-q] [-r repeats]
+                                                       [-o results.json] [-b baseline.json] [-t tolerance]
+'''
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+
+import httpx
+
+from bench_report import URL, start_backend
+from generator.corpus import Corpus, write_corpus
+from generator.generator import VECTOR_BLOCK_SIZE, Generator
+from monitor.backend.store import MemoryStore
+from msg_queue.msg_queue import Message, MessageQueue
+from sender.sender import PULL_TIMEOUT, Sender
+from simulator import SenderSettings, SimulatorConfig, adjust_senders, run_headless_simulation
+
+REPEATS = 3
+DEFAULT_TOLERANCE = 0.2
+
+# Number of messages (or requests) and threads per case, in full and quick (-q) runs
+SIZES = {"full": [10_000, 100_000], "quick": [2_000]}
+THREADS = {"full": [1, 2, 4, 8], "quick": [1, 4]}
+ENDPOINT_REQUESTS = {"full": 5_000, "quick": 500}
+E2E_MESSAGES = {"full": 50_000, "quick": 5_000}
+E2E_SENDERS = 4
+
+MESSAGE = Message(message="benchmark message", phone="1234567890")
+
+def bench_queue(num_messages: int, num_threads: int) -> float:
+    '''
+        Return seconds for `num_threads` producers to push
+        `num_messages` one at a time while as many consumers pull
+        them, until the queue is drained
+    '''
+    queue = MessageQueue(producers=num_threads)
+    per_thread = num_messages // num_threads
+
+    def produce():
+        for _ in range(per_thread):
+            queue.push(MESSAGE)
+        queue.close()
+
+    def consume():
+        while queue.pull(timeout=PULL_TIMEOUT) is not None or not queue.drained:
+            pass
+
+    threads = [threading.Thread(target=produce) for _ in range(num_threads)]
+    threads += [threading.Thread(target=consume) for _ in range(num_threads)]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+def bench_generator(num_messages: int, mode: str) -> float:
+    '''
+        Return seconds to generate `num_messages` in blocks in the
+        given generation mode, or to read them back as batches from
+        a corpus file written beforehand in replay mode
+    '''
+    if mode == "replay":
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.bin")
+            write_corpus(path, Generator(seed=0), num_messages)
+            corpus = Corpus(path)
+
+            start = time.perf_counter()
+            for _ in corpus.batches(0, num_messages):
+                pass
+            elapsed = time.perf_counter() - start
+            corpus.close()
+            return elapsed
+
+    generator = Generator(vectorized=mode != "python", seed=0)
+    generate = generator.generate_batch if mode == "compact" else generator.generate_messages
+
+    start = time.perf_counter()
+    for block in range(0, num_messages, VECTOR_BLOCK_SIZE):
+        generate(min(VECTOR_BLOCK_SIZE, num_messages - block))
+    return time.perf_counter() - start
+
+def bench_sender(num_messages: int, num_threads: int) -> float:
+    '''
+        Return seconds for `num_threads` Senders with no delay to
+        send `num_messages` from a full queue, recording results
+        in one MemoryStore
+    '''
+    queue = MessageQueue()
+    queue.push_many(Generator(vectorized=True, seed=0).generate_messages(num_messages))
+    queue.close()
+
+    store = MemoryStore()
+    senders = [
+        Sender(queue, mean_delay=0, fail_rate=0.1, sender_id=i, stats_store=store)
+        for i in range(num_threads)
+    ]
+    threads = [threading.Thread(target=sender.consume_messages) for sender in senders]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+def bench_endpoint(num_requests: int, num_threads: int) -> float:
+    '''
+        Return seconds for `num_threads` threads sharing a pooled
+        client to post `num_requests` results to /message
+    '''
+    per_thread = num_requests // num_threads
+    body = {"message": MESSAGE.message, "phone": MESSAGE.phone, "success": True, "delay": 0.1}
+
+    with httpx.Client(base_url=URL, limits=httpx.Limits(max_connections=num_threads)) as client:
+        def report():
+            for _ in range(per_thread):
+                client.post("/message", json=body).raise_for_status()
+
+        threads = [threading.Thread(target=report) for _ in range(num_threads)]
+
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start
+
+def bench_e2e(num_messages: int, mode: str) -> float:
+    '''
+        Return seconds for a headless simulation of `num_messages`
+        with no delay to complete in the given execution mode
+    '''
+    config = adjust_senders(SimulatorConfig(
+        num_messages=num_messages,
+        num_senders=E2E_SENDERS,
+        sender_settings=[SenderSettings(mean_delay=0, fail_rate=0.1) for _ in range(E2E_SENDERS)],
+        generation_mode="numpy",
+        execution_mode=mode,
+        monitor_mode="headless",
+        seed=0
+    ))
+    return run_headless_simulation(config).elapsed
+
+def queue_cases(scale: str):
+    for threads in THREADS[scale]:
+        for size in SIZES[scale]:
+            yield f"queue[threads={threads},messages={size}]", size, partial(bench_queue, size, threads)
+
+def generator_cases(scale: str):
+    for mode in ["python", "numpy", "compact", "replay"]:
+        for size in SIZES[scale]:
+            yield f"generator[mode={mode},messages={size}]", size, partial(bench_generator, size, mode)
+
+def sender_cases(scale: str):
+    for threads in THREADS[scale]:
+        for size in SIZES[scale]:
+            yield f"sender[threads={threads},messages={size}]", size, partial(bench_sender, size, threads)
+
+def endpoint_cases(scale: str):
+    size = ENDPOINT_REQUESTS[scale]
+    for threads in THREADS[scale]:
+        yield f"endpoint[threads={threads},requests={size}]", size, partial(bench_endpoint, size, threads)
+
+def e2e_cases(scale: str):
+    size = E2E_MESSAGES[scale]
+    for mode in ["thread", "async", "process"]:
+        yield f"e2e[mode={mode},messages={size}]", size, partial(bench_e2e, size, mode)
+
+COMPONENTS = {
+    "queue": queue_cases,
+    "generator": generator_cases,
+    "sender": sender_cases,
+    "endpoint": endpoint_cases,
+    "e2e": e2e_cases
+}
+
+def run_component(name: str, scale: str, repeats: int) -> dict[str, dict]:
+    '''
+        Run every case of a component, returning the best of
+        `repeats` runs of each by name
+    '''
+    backend = start_backend() if name == "endpoint" else None
+    results = {}
+    try:
+        for case, count, run in COMPONENTS[name](scale):
+            seconds = min(run() for _ in range(repeats))
+            results[case] = {"count": count, "seconds": round(seconds, 6), "rate": round(count / seconds, 2)}
+            print(f"{case:<45} {results[case]['rate']:>14,.0f}/s", flush=True)
+    finally:
+        if backend:
+            backend.terminate()
+            backend.join()
+    return results
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    '''
+        Print each case's rate against its baseline, returning the
+        cases more than `tolerance` slower
+    '''
+    regressions = []
+
+    print(f"\n{'case':<45} {'baseline (/s)':>14} {'current (/s)':>14} {'change':>8}")
+    for case, result in results.items():
+        if case not in baseline:
+            print(f"{case:<45} {'-':>14} {result['rate']:14,.0f} {'new':>8}")
+            continue
+
+        change = result["rate"] / baseline[case]["rate"] - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(case)
+            flag = "  REGRESSION"
+        print(f"{case:<45} {baseline[case]['rate']:14,.0f} {result['rate']:14,.0f} {change:+8.1%}{flag}")
+
+    return regressions
+
+def parse_arguments(argv) -> dict:
+    options = {"components": [], "scale": "full", "repeats": REPEATS, "output": None, "baseline": None, "tolerance": DEFAULT_TOLERANCE}
+
+    i = 0
+    while i < len(argv):
+        match argv[i]:
+            case "-q":
+                options["scale"] = "quick"
+                i += 1
+                continue
+            case "-r":
+                options["repeats"] = int(argv[i + 1])
+            case "-o":
+                options["output"] = argv[i + 1]
+            case "-b":
+                options["baseline"] = argv[i + 1]
+            case "-t":
+                options["tolerance"] = float(argv[i + 1])
+            case component if component in COMPONENTS:
+                options["components"].append(component)
+                i += 1
+                continue
+            case other:
+                raise SystemExit(f"Unknown option or component '{other}'! Components are {list(COMPONENTS)}.")
+        i += 2
+
+    options["components"] = options["components"] or list(COMPONENTS)
+    return options
+
+def main(argv):
+    options = parse_arguments(argv)
+
+    results = {}
+    for name in options["components"]:
+        results.update(run_component(name, options["scale"], options["repeats"]))
+
+    if options["output"]:
+        with open(options["output"], "w") as output:
+            json.dump({
+                "machine": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count()
+                },
+                "scale": options["scale"],
+                "created": time.time(),
+                "results": results
+            }, output, indent=4)
+        print(f"\nResults written to {options['output']}")
+
+    if options["baseline"]:
+        with open(options["baseline"]) as baseline:
+            regressions = compare(results, json.load(baseline)["results"], options["tolerance"])
+        if regressions:
+            print(f"\n{len(regressions)} case(s) more than {options['tolerance']:.0%} slower than the baseline!")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,177 @@
+import mmap
+import os
+import struct
+from typing import Iterator, Optional
+
+import numpy as np
+
+from generator.generator import VECTOR_BLOCK_SIZE, Generator
+from instrumentation.stages import GENERATE
+from msg_queue.msg_queue import MessageBatch, MessageQueue
+
+# A corpus file holds this header, then its columns: phone numbers
+# (uint64), body offsets from the start of the bodies (int64, one more
+# than there are messages), priorities (uint8, padded to 8 bytes) and
+# the UTF-8 bodies. The magic is written last, so a file left
+# half-written is never read as a corpus.
+CORPUS_MAGIC = b"SMSCORP1"
+CORPUS_HEADER = struct.Struct("<8sQQ") # magic, messages, body bytes
+
+def column_offsets(count: int) -> tuple[int, int, int, int]:
+    '''
+        Byte offsets of the phone, offset, priority and body columns
+        of a corpus of `count` messages
+    '''
+    phones = CORPUS_HEADER.size
+    offsets = phones + 8 * count
+    priorities = offsets + 8 * (count + 1)
+    bodies = priorities + ((count + 7) & ~7)
+    return phones, offsets, priorities, bodies
+
+def write_corpus(path: str, generator: Generator, num_messages: int) -> int:
+    '''
+        Write `num_messages` from `generator`, drawn as with compact
+        generation, to a corpus file at `path`, returning the size
+        of the file in bytes
+
+        Each batch is written straight into its place in the columns,
+        so a corpus of any size is written in constant memory.
+    '''
+    phones, offsets, priorities, bodies = column_offsets(num_messages)
+    written = 0
+    body_bytes = 0
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.pwrite(fd, np.zeros(1, dtype=np.int64).tobytes(), offsets)
+        for batch in generator.generate_batches(num_messages):
+            count = len(batch)
+            os.pwrite(fd, batch.phones.tobytes(), phones + 8 * written)
+            os.pwrite(fd, (batch.offsets[1:] + body_bytes).tobytes(), offsets + 8 * (written + 1))
+            os.pwrite(fd, bytes([batch.priority]) * count, priorities + written)
+            os.pwrite(fd, batch.bodies, bodies + body_bytes)
+            written += count
+            body_bytes += len(batch.bodies)
+
+        os.ftruncate(fd, bodies + body_bytes)
+        os.fsync(fd)
+        os.pwrite(fd, CORPUS_HEADER.pack(CORPUS_MAGIC, num_messages, body_bytes), 0)
+    finally:
+        os.close(fd)
+
+    return bodies + body_bytes
+
+class Corpus():
+    '''
+        Corpus file written by `write_corpus`, memory-mapped
+        read-only, so opening one costs nothing however many
+        messages it holds.
+
+        Messages are read back as MessageBatches whose arrays and
+        bodies are views of the mapping.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, body_bytes = CORPUS_HEADER.unpack_from(self._mm) if len(self._mm) >= CORPUS_HEADER.size else (b"", 0, 0)
+        if magic != CORPUS_MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not a complete message corpus!")
+
+        phones, offsets, priorities, bodies = column_offsets(count)
+        self.phones = np.frombuffer(self._mm, dtype=np.uint64, count=count, offset=phones)
+        self.offsets = np.frombuffer(self._mm, dtype=np.int64, count=count + 1, offset=offsets)
+        self.priorities = np.frombuffer(self._mm, dtype=np.uint8, count=count, offset=priorities)
+        self.bodies = memoryview(self._mm)[bodies:bodies + body_bytes]
+
+    def __len__(self) -> int:
+        return len(self.phones)
+
+    def batches(self, start: int, stop: int, block_size: int = VECTOR_BLOCK_SIZE) -> Iterator[MessageBatch]:
+        '''
+            Messages [start, stop) as MessageBatches of at most
+            `block_size`, split wherever the priority changes
+
+            Each batch views only its own bodies, so it costs the same
+            to handle wherever in the corpus it comes from.
+        '''
+        for first in range(start, stop, block_size):
+            last = min(first + block_size, stop)
+            changes = np.flatnonzero(np.diff(self.priorities[first:last])) + first + 1
+            bounds = [first, *changes.tolist(), last]
+            for a, b in zip(bounds, bounds[1:]):
+                offsets = self.offsets[a:b + 1]
+                yield MessageBatch(
+                    self.phones[a:b],
+                    self.bodies[offsets[0]:offsets[-1]],
+                    offsets - offsets[0],
+                    int(self.priorities[a])
+                )
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            pass # batches read from it are still in use, and it is unmapped once they are gone
+
+class ReplayGenerator(Generator):
+    '''
+        Generator replaying messages from a corpus file rather than
+        creating them, so every run gets the same messages and none
+        are spent waiting for random draws
+
+        Messages keep the priority they were written with. In compact
+        mode, batches are pushed as views of the corpus; otherwise
+        they are unpacked into Messages and pushed `batch_size` at a
+        time.
+    '''
+
+    def __init__(
+            self,
+            corpus: str,
+            queue: Optional[MessageQueue] = None,
+            num_messages: Optional[int] = None,
+            batch_size: Optional[int] = 1,
+            compact: Optional[bool] = False,
+            start: Optional[int] = 0
+    ):
+        '''
+            Replay `num_messages` from the corpus file at `corpus`,
+            starting at message `start`, or every message after it
+            if not given
+        '''
+        self.corpus = Corpus(corpus)
+        if num_messages is None:
+            num_messages = max(len(self.corpus) - start, 0)
+        if start < 0 or start + num_messages > len(self.corpus):
+            self.corpus.close()
+            raise ValueError(f"Corpus '{corpus}' only holds {len(self.corpus)} messages!")
+
+        super().__init__(queue, num_messages, batch_size=batch_size, compact=compact)
+        self.start = start
+
+    def _generate(self):
+        '''
+            Push every message from the corpus
+        '''
+        block_size = max(self.batch_size, VECTOR_BLOCK_SIZE)
+        batches = self.corpus.batches(self.start, self.start + self.num_messages, block_size)
+
+        if self.compact:
+            for batch in batches:
+                self.push_batch(batch)
+            return
+
+        for batch in batches:
+            started = GENERATE.begin()
+            messages = batch.to_messages()
+            GENERATE.end(started)
+            if self.batch_size == 1:
+                for message in messages:
+                    self.push_message(message)
+                continue
+            for i in range(0, len(messages), self.batch_size):
+                self.push_messages(messages[i:i + self.batch_size])
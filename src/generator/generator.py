@@ -1,13 +1,23 @@
 import random
 import string
-from typing import Optional
+from typing import Iterator, Optional
 
-from msg_queue.msg_queue import Message, MessageQueue
+import numpy as np
+
+from instrumentation.stages import GENERATE
+from msg_queue.msg_queue import DEFAULT_PRIORITY, PRIORITIES, Message, MessageBatch, MessageQueue
 
 MAX_STRING_LEN = 100
 MIN_STRING_LEN = 1
 PHONE_LEN = 10
 
+# Number of messages drawn at once in vectorized mode
+VECTOR_BLOCK_SIZE = 1000
+
+PRINTABLE_BYTES = np.frombuffer(string.printable.encode("ascii"), dtype=np.uint8)
+DIGIT_BYTES = np.frombuffer(string.digits.encode("ascii"), dtype=np.uint8)
+PHONE_PLACES = 10 ** np.arange(PHONE_LEN - 1, -1, -1, dtype=np.uint64)
+
 class Generator():
     '''
         Class representing a Message Generator
@@ -19,14 +29,35 @@ class Generator():
     def __init__(
             self, 
             queue: Optional[MessageQueue] = None, 
-            num_messages: Optional[int] = 1000
+            num_messages: Optional[int] = 1000,
+            batch_size: Optional[int] = 1,
+            vectorized: Optional[bool] = False,
+            compact: Optional[bool] = False,
+            seed: Optional[int] = None,
+            priority_mix: Optional[list[float]] = None
     ):
         '''
             Initialize Generator class with number of messages
             to generate and a MessageQueue in which to put them
+
+            Messages are pushed `batch_size` at a time. In `vectorized`
+            mode, whole blocks of messages are drawn at once with NumPy.
+            In `compact` mode those blocks are pushed as MessageBatches
+            rather than individual Messages. Providing a `seed` makes
+            the generated messages reproducible.
+
+            Messages are normal priority unless a `priority_mix` gives
+            the share of each priority in PRIORITIES, in which case 
+            each message's priority is drawn from it.
         '''
         self.num_messages = num_messages
+        self.batch_size = batch_size
+        self.vectorized = vectorized
+        self.compact = compact
         self.queue = queue
+        self.priority_mix = priority_mix
+        self._random = random.Random(seed)
+        self._rng = np.random.default_rng(seed)
     
     @property
     def num_messages(self):
@@ -46,6 +77,52 @@ class Generator():
             raise ValueError("Number of messages must be non-negative!")
         self._num_messages = value
 
+    @property
+    def batch_size(self):
+        '''
+            Number of messages pushed to the queue at once
+        '''
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, value: int):
+        '''
+            Setter for batch size
+        '''
+        if value < 1:
+            raise ValueError("Batch size must be positive!")
+        self._batch_size = value
+
+    @property
+    def priority_mix(self):
+        '''
+            Share of messages generated at each priority, summing
+            to 1, or None if every message is normal priority
+        '''
+        return self._priority_mix
+
+    @priority_mix.setter
+    def priority_mix(self, value: Optional[list[float]]):
+        '''
+            Setter for priority mix, scaling the shares to sum to 1
+        '''
+        if value is not None:
+            if len(value) != len(PRIORITIES):
+                raise ValueError(f"Priority mix must give one share per priority {list(PRIORITIES)}!")
+            if any(share < 0 for share in value) or sum(value) <= 0:
+                raise ValueError("Priority mix shares must be non-negative and not all zero!")
+            value = [share / sum(value) for share in value]
+        self._priority_mix = value
+
+    def draw_priorities(self, count: int) -> list[int]:
+        '''
+            Priority of each of `count` messages, drawn from the 
+            priority mix
+        '''
+        if self.priority_mix is None:
+            return [DEFAULT_PRIORITY] * count
+        return self._rng.choice(len(PRIORITIES), size=count, p=self.priority_mix).tolist()
+
     def create_random_string(self) -> str:
         '''
             Create random string for message from printable
@@ -53,8 +130,8 @@ class Generator():
 
             Strings must be at least 1 and at most 100 characters.
         '''
-        string_len = random.randint(MIN_STRING_LEN, MAX_STRING_LEN)
-        return "".join([random.choice(string.printable) for _ in range(string_len)])
+        string_len = self._random.randint(MIN_STRING_LEN, MAX_STRING_LEN)
+        return "".join([self._random.choice(string.printable) for _ in range(string_len)])
 
     def create_random_phone_number(self) -> str:
         '''
@@ -64,24 +141,143 @@ class Generator():
 
             Phone number validation left out for simulation.
         '''
-        return "".join([random.choice(string.digits) for _ in range(PHONE_LEN)])
+        return "".join([self._random.choice(string.digits) for _ in range(PHONE_LEN)])
 
     def generate_message(self) -> Message:
         '''
             Create Message with random string and random phone number
         '''
-        return Message(
+        started = GENERATE.begin()
+        message = Message(
             message=self.create_random_string(),
             phone=self.create_random_phone_number()
         )
+        if self.priority_mix is not None:
+            message.priority = self._random.choices(range(len(PRIORITIES)), weights=self.priority_mix)[0]
+        GENERATE.end(started)
+        return message
+
+    def _draw_block(self, count: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+            Draw message offsets, character indices and phone digits
+            for `count` messages in three NumPy calls
+        '''
+        lengths = self._rng.integers(MIN_STRING_LEN, MAX_STRING_LEN + 1, size=count)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        chars = self._rng.integers(0, len(PRINTABLE_BYTES), size=offsets[-1])
+        digits = self._rng.integers(0, len(DIGIT_BYTES), size=(count, PHONE_LEN))
+
+        return offsets, chars, digits
+
+    def generate_messages_vectorized(self, count: int) -> list[Message]:
+        '''
+            Create `count` Messages at once
+
+            The block is drawn with NumPy and decoded into two strings,
+            one holding every message body and one every phone number.
+            Each Message is then sliced out of those.
+        '''
+        started = GENERATE.begin()
+        offsets, chars, digits = self._draw_block(count)
+        offsets = offsets.tolist()
+
+        text = PRINTABLE_BYTES[chars].tobytes().decode("ascii")
+        phones = DIGIT_BYTES[digits].tobytes().decode("ascii")
+        priorities = self.draw_priorities(count)
+
+        messages = [
+            Message(
+                message=text[offsets[i]:offsets[i + 1]],
+                phone=phones[i * PHONE_LEN:(i + 1) * PHONE_LEN],
+                priority=priorities[i]
+            )
+            for i in range(count)
+        ]
+        GENERATE.end(started)
+        return messages
+
+    def generate_batch(self, count: int, priority: int = DEFAULT_PRIORITY) -> MessageBatch:
+        '''
+            Create `count` messages of one `priority` as a single
+            MessageBatch, without creating an object per message
+        '''
+        started = GENERATE.begin()
+        offsets, chars, digits = self._draw_block(count)
+
+        batch = MessageBatch(
+            phones=digits.astype(np.uint64) @ PHONE_PLACES,
+            bodies=PRINTABLE_BYTES[chars].tobytes(),
+            offsets=offsets.astype(np.int64),
+            priority=priority
+        )
+        GENERATE.end(started)
+        return batch
+
+    def generate_batches(self, count: int) -> Iterator[MessageBatch]:
+        '''
+            Create `count` messages as MessageBatches, a block of at
+            least VECTOR_BLOCK_SIZE at a time. With a priority mix, a 
+            block is split into a batch per priority, the number of 
+            messages in each drawn from the mix.
+        '''
+        block_size = max(self.batch_size, VECTOR_BLOCK_SIZE)
+        for start in range(0, count, block_size):
+            size = min(block_size, count - start)
+            if self.priority_mix is None:
+                yield self.generate_batch(size)
+                continue
+            for priority, share in enumerate(self._rng.multinomial(size, self.priority_mix).tolist()):
+                if share:
+                    yield self.generate_batch(share, priority)
+
+    def generate_messages(self, count: int) -> list[Message]:
+        '''
+            Create `count` Messages, vectorized if configured
+        '''
+        if self.vectorized:
+            return self.generate_messages_vectorized(count)
+        return [self.generate_message() for _ in range(count)]
 
     def start_generating(self):
         '''
             Create Messages and push them onto the 
-            MessageQueue for Senders
+            MessageQueue for Senders, `batch_size` at a time
+
+            In compact mode each batch from `generate_batches` is 
+            pushed whole; the queue splits it as Senders pull.
+
+            The queue is closed once generation ends, even if it 
+            fails, so Senders and `main` are not left waiting.
+        '''
+        try:
+            self._generate()
+        finally:
+            if self.queue:
+                self.queue.close()
+
+    def _generate(self):
         '''
-        for _ in range(self.num_messages):
-            self.push_message(self.generate_message())
+            Create and push every message
+        '''
+        if self.batch_size == 1 and not (self.vectorized or self.compact):
+            for _ in range(self.num_messages):
+                self.push_message(self.generate_message())
+            return
+
+        block_size = self.batch_size
+        if self.vectorized or self.compact:
+            block_size = max(self.batch_size, VECTOR_BLOCK_SIZE)
+
+        if self.compact:
+            for batch in self.generate_batches(self.num_messages):
+                self.push_batch(batch)
+            return
+
+        for start in range(0, self.num_messages, block_size):
+            messages = self.generate_messages(min(block_size, self.num_messages - start))
+            for i in range(0, len(messages), self.batch_size):
+                self.push_messages(messages[i:i + self.batch_size])
     
     def push_message(self, message: Message):
         '''
@@ -91,3 +287,21 @@ class Generator():
             self.queue.push(message)
         else:
             print("No Message Queue Available!")
+
+    def push_messages(self, messages: list[Message]):
+        '''
+            Push a batch of messages onto Queue if one is available
+        '''
+        if self.queue:
+            self.queue.push_many(messages)
+        else:
+            print("No Message Queue Available!")
+
+    def push_batch(self, batch: MessageBatch):
+        '''
+            Push a MessageBatch onto Queue if one is available
+        '''
+        if self.queue:
+            self.queue.push_batch(batch)
+        else:
+            print("No Message Queue Available!")
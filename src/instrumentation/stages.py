@@ -0,0 +1,157 @@
+import bisect
+import os
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+# Upper bounds, in seconds, of the histogram buckets each stage's
+# timings fall into. Timings above the last go in a final bucket.
+STAGE_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 0.01, 0.1, 1.0, 10.0)
+
+# How often StagePusher sends this process's timings to the Monitor
+PUSH_INTERVAL = 1
+
+# Timing is off unless switched on here or by the environment, which
+# processes started by the simulator inherit, as is the Monitor API
+# each process pushes its timings to
+enabled = os.getenv("SMS_INSTRUMENT") == "1"
+push_url = os.getenv("SMS_INSTRUMENT_URL")
+
+def enable(on: bool = True, url: Optional[str] = None):
+    '''
+        Switch stage timing on or off for this process and any
+        process it starts afterwards, pushing timings to the 
+        Monitor API at `url` if given
+    '''
+    global enabled, push_url
+    enabled = on
+    push_url = url
+    os.environ["SMS_INSTRUMENT"] = "1" if on else "0"
+    if url:
+        os.environ["SMS_INSTRUMENT_URL"] = url
+    else:
+        os.environ.pop("SMS_INSTRUMENT_URL", None)
+
+class Stage():
+    '''
+        Count, total time and histogram of timings for one stage
+        of the simulation's hot path, in this process.
+
+        Timed code calls `begin` and passes its result, or any other
+        `time.perf_counter()` reading, to `end`. While timing is 
+        disabled `begin` returns 0 and `end` returns straight away, 
+        so an untimed stage costs two calls.
+    '''
+
+    __slots__ = ("name", "description", "count", "total", "buckets", "_lock")
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self.reset()
+
+    def begin(self) -> float:
+        return time.perf_counter() if enabled else 0.0
+
+    def end(self, started: float):
+        if enabled and started:
+            self.observe(time.perf_counter() - started)
+
+    def observe(self, seconds: float):
+        i = bisect.bisect_left(STAGE_BUCKETS, seconds)
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.buckets[i] += 1
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+            self.buckets = [0] * (len(STAGE_BUCKETS) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "description": self.description,
+                "le": list(STAGE_BUCKETS),
+                "buckets": list(self.buckets),
+                "count": self.count,
+                "sum": self.total
+            }
+
+GENERATE = Stage("generate", "Generator creating messages, per message or block")
+QUEUE_PUSH = Stage("queue_push", "MessageQueue push calls, including waits for room")
+QUEUE_PULL = Stage("queue_pull", "MessageQueue pull calls, including waits for messages")
+QUEUE_LOCK = Stage("queue_lock", "Waiting to acquire the MessageQueue lock")
+VALIDATE = Stage("validate", "Sender validating a message or batch")
+SEND = Stage("send", "Simulated send delay of each message")
+REPORT = Stage("report", "Sender reporting a result, including buffering")
+REPORT_HTTP = Stage("report_http", "HTTP requests reporting results to the Monitor API")
+
+STAGES = {stage.name: stage for stage in [
+    GENERATE, QUEUE_PUSH, QUEUE_PULL, QUEUE_LOCK, VALIDATE, SEND, REPORT, REPORT_HTTP
+]}
+
+def snapshot() -> dict[str, dict]:
+    '''
+        Timings so far of every stage in this process
+    '''
+    return {name: stage.snapshot() for name, stage in STAGES.items()}
+
+def reset():
+    for stage in STAGES.values():
+        stage.reset()
+
+def format_stages(stages: Optional[dict[str, dict]] = None) -> str:
+    '''
+        Table of calls, total and mean time for each stage that
+        has been timed, this process's by default
+    '''
+    stages = stages or snapshot()
+    lines = [f"{'stage':<12} {'calls':>10} {'total (s)':>10} {'mean (us)':>10}"]
+    for name, stage in stages.items():
+        if stage["count"]:
+            mean = stage["sum"] / stage["count"] * 1e6
+            lines.append(f"{name:<12} {stage['count']:>10} {stage['sum']:>10.3f} {mean:>10.1f}")
+    return "\n".join(lines)
+
+class StagePusher():
+    '''
+        Background thread sending this process's stage timings to
+        the Monitor API every `PUSH_INTERVAL` seconds, and once more
+        when stopped. Timings are cumulative, so the Monitor only
+        keeps the latest from each `source`.
+    '''
+
+    def __init__(self, url: str, source: Optional[str] = None):
+        self.url = url
+        self.source = source or str(os.getpid())
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._push_periodically, daemon=True)
+        self._thread.start()
+
+    def push(self):
+        try:
+            httpx.post(self.url + "/metrics/stages", json={"source": self.source, "stages": snapshot()})
+        except httpx.HTTPError:
+            pass # the Monitor may not be up yet, and the next push repeats everything
+
+    def _push_periodically(self):
+        while not self._stopped.wait(PUSH_INTERVAL):
+            self.push()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.push()
+
+def start_pushing() -> Optional[StagePusher]:
+    '''
+        Start pushing this process's timings if they are enabled
+        and there is a Monitor API to push them to
+    '''
+    return StagePusher(push_url) if enabled and push_url else None
@@ -0,0 +1,129 @@
+import math
+from typing import Optional
+
+import numpy as np
+
+from .models import LatencyStatistics
+
+# Delays are counted in log-spaced buckets, each BUCKET_GROWTH times as
+# wide as the last, from MIN_DELAY up to MAX_DELAY seconds. Reported
+# percentiles are within about 1% of the true value. Bucket 0 holds
+# delays below MIN_DELAY, the last bucket delays from MAX_DELAY up.
+MIN_DELAY = 1e-6
+MAX_DELAY = 1e4
+BUCKET_GROWTH = 1.02
+NUM_BUCKETS = math.ceil(math.log(MAX_DELAY / MIN_DELAY) / math.log(BUCKET_GROWTH)) + 2
+
+PERCENTILES = {"p50": 50, "p90": 90, "p99": 99, "p999": 99.9}
+
+# Geometric middle of each bucket, used as the value of its delays
+BUCKET_VALUES = np.concatenate((
+    [0.0],
+    MIN_DELAY * BUCKET_GROWTH ** (np.arange(NUM_BUCKETS - 1) + 0.5)
+))
+
+def bucket_indices(delays: np.ndarray) -> np.ndarray:
+    '''
+        Bucket each delay falls in
+    '''
+    delays = np.asarray(delays, dtype=np.float64)
+    indices = np.zeros(len(delays), dtype=np.int64)
+    counted = delays >= MIN_DELAY
+    indices[counted] = np.minimum(
+        np.log(delays[counted] / MIN_DELAY) // math.log(BUCKET_GROWTH) + 1,
+        NUM_BUCKETS - 1
+    )
+    return indices
+
+def bucket_index(delay: float) -> int:
+    '''
+        Bucket a single delay falls in
+    '''
+    if delay < MIN_DELAY:
+        return 0
+    return min(int(math.log(delay / MIN_DELAY) // math.log(BUCKET_GROWTH)) + 1, NUM_BUCKETS - 1)
+
+class LatencyHistogram():
+    '''
+        Streaming histogram of delays in a fixed number of log-spaced
+        buckets, plus the exact smallest and largest delay.
+
+        Histograms merge by adding their counts, so they can be kept
+        per sender or per shard and combined when read. Both arrays
+        may be views onto shared memory, in which case updates are
+        made in place.
+    '''
+
+    def __init__(self, counts: Optional[np.ndarray] = None, bounds: Optional[np.ndarray] = None):
+        self.counts = np.zeros(NUM_BUCKETS, dtype=np.int64) if counts is None else counts
+        self.bounds = np.array([np.inf, -np.inf]) if bounds is None else bounds
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def record(self, delays: np.ndarray):
+        '''
+            Count every delay in `delays`
+        '''
+        if len(delays) == 0:
+            return
+        np.add.at(self.counts, bucket_indices(delays), 1)
+        self.bounds[0] = min(self.bounds[0], np.min(delays))
+        self.bounds[1] = max(self.bounds[1], np.max(delays))
+
+    def record_one(self, delay: float):
+        '''
+            Count a single delay, without the overhead of arrays
+        '''
+        self.counts[bucket_index(delay)] += 1
+        if delay < self.bounds[0]:
+            self.bounds[0] = delay
+        if delay > self.bounds[1]:
+            self.bounds[1] = delay
+
+    def merge(self, other: "LatencyHistogram"):
+        '''
+            Add another histogram's delays to this one
+        '''
+        self.counts += other.counts
+        self.bounds[0] = min(self.bounds[0], other.bounds[0])
+        self.bounds[1] = max(self.bounds[1], other.bounds[1])
+
+    def reset(self):
+        self.counts[:] = 0
+        self.bounds[:] = [np.inf, -np.inf]
+
+    def percentile(self, q: float) -> float:
+        '''
+            Delay at or below which `q` percent of delays fall
+        '''
+        cumulative = np.cumsum(self.counts)
+        if cumulative[-1] == 0:
+            return 0.0
+        rank = max(math.ceil(q / 100 * cumulative[-1]), 1)
+        bucket = np.searchsorted(cumulative, rank)
+
+        # The exact minimum and maximum are known, so use them for
+        # delays in the lowest and highest occupied buckets
+        occupied = np.flatnonzero(self.counts)
+        if bucket == occupied[-1]:
+            return float(self.bounds[1])
+        if bucket == occupied[0]:
+            return float(self.bounds[0])
+        return float(np.clip(BUCKET_VALUES[bucket], self.bounds[0], self.bounds[1]))
+
+    def summary(self) -> LatencyStatistics:
+        '''
+            Percentiles, minimum and maximum, rounded for reporting
+        '''
+        count = self.count
+        if count == 0:
+            return LatencyStatistics(count=0, min_delay=0.0, max_delay=0.0, p50=0.0, p90=0.0, p99=0.0, p999=0.0)
+
+        return LatencyStatistics(
+            count=count,
+            min_delay=round(float(self.bounds[0]), 4),
+            max_delay=round(float(self.bounds[1]), 4),
+            **{name: round(self.percentile(q), 4) for name, q in PERCENTILES.items()}
+        )
@@ -0,0 +1,124 @@
+from typing import Optional
+
+import numpy as np
+
+from .models import HistoryBucket, HistoryReport
+
+# Seconds covered by one bucket, and how many buckets are kept:
+# an hour of per-second buckets and a day of per-minute buckets
+HISTORY_RESOLUTIONS = {
+    "second": (1, 3600),
+    "minute": (60, 1440)
+}
+
+class RingSeries():
+    '''
+        Fixed-size ring buffer of success and failure counts and
+        delay sums per time bucket.
+
+        Bucket `slot` covers `resolution` seconds from
+        `slot * resolution` seconds since the epoch, and is held at
+        position `slot % length` until a later bucket reuses that
+        position. Only the latest `length` slots are reported, and
+        results too old for the buffer are dropped.
+
+        The arrays may be views onto shared memory, in which case
+        updates are made in place.
+    '''
+
+    # slot, success count, failure count and delay sum per position
+    WORDS = 4
+
+    def __init__(
+            self,
+            resolution: int,
+            length: int,
+            slots: Optional[np.ndarray] = None,
+            counts: Optional[np.ndarray] = None,
+            delays: Optional[np.ndarray] = None
+    ):
+        self.resolution = resolution
+        self.length = length
+        self.slots = np.full(length, -1, dtype=np.int64) if slots is None else slots
+        self.counts = np.zeros((length, 2), dtype=np.int64) if counts is None else counts
+        self.delays = np.zeros(length, dtype=np.float64) if delays is None else delays
+
+    def _claim(self, slot: int):
+        '''
+            Clear the position for `slot` if it holds an older bucket
+        '''
+        position = slot % self.length
+        if self.slots[position] < slot:
+            self.slots[position] = slot
+            self.counts[position] = 0
+            self.delays[position] = 0.0
+
+    def add(self, timestamp: np.ndarray, success: np.ndarray, delay: np.ndarray):
+        '''
+            Add results reported at the given times
+        '''
+        success = np.asarray(success, dtype=bool)
+        slots = (np.asarray(timestamp) // self.resolution).astype(np.int64)
+        for slot in np.unique(slots).tolist():
+            self._claim(slot)
+
+        positions = slots % self.length
+        held = self.slots[positions] == slots
+        positions, success, delay = positions[held], success[held], delay[held]
+
+        np.add.at(self.counts[:, 0], positions, success)
+        np.add.at(self.counts[:, 1], positions, ~success)
+        np.add.at(self.delays, positions, delay)
+
+    def add_one(self, timestamp: float, success: bool, delay: float):
+        '''
+            Add a single result, without the overhead of arrays
+        '''
+        slot = int(timestamp // self.resolution)
+        self._claim(slot)
+
+        position = slot % self.length
+        if self.slots[position] == slot:
+            self.counts[position, 0 if success else 1] += 1
+            self.delays[position] += delay
+
+    def reset(self):
+        self.slots[:] = -1
+        self.counts[:] = 0
+        self.delays[:] = 0.0
+
+    def query(self, start: float, end: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+            Slots, counts and delay sums of the buckets held from
+            `start` to `end`, oldest first
+        '''
+        oldest = max(start // self.resolution, self.slots.max() - self.length + 1, 0)
+        held = (self.slots >= oldest) & (self.slots <= end // self.resolution)
+        order = np.argsort(self.slots[held])
+        return self.slots[held][order], self.counts[held][order], self.delays[held][order]
+
+def history_report(resolution: str, parts: list[tuple[np.ndarray, np.ndarray, np.ndarray]]) -> HistoryReport:
+    '''
+        Combine query results from several series at the same
+        resolution, adding up buckets for the same slot
+    '''
+    seconds = HISTORY_RESOLUTIONS[resolution][0]
+
+    slots = np.concatenate([p[0] for p in parts])
+    unique_slots, inverse = np.unique(slots, return_inverse=True)
+    counts = np.zeros((len(unique_slots), 2), dtype=np.int64)
+    delays = np.zeros(len(unique_slots), dtype=np.float64)
+    np.add.at(counts, inverse, np.concatenate([p[1] for p in parts]).reshape(-1, 2))
+    np.add.at(delays, inverse, np.concatenate([p[2] for p in parts]))
+
+    buckets = []
+    for slot, (successes, failures), total_delay in zip(unique_slots.tolist(), counts.tolist(), delays.tolist()):
+        total = successes + failures
+        buckets.append(HistoryBucket(
+            time=slot * seconds,
+            success_messages=successes,
+            failed_messages=failures,
+            average_delay=round(total_delay / total, 4) if total else 0.0
+        ))
+
+    return HistoryReport(resolution=seconds, buckets=buckets)
@@ -1,11 +1,18 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import time
 import os
 from threading import Lock
+from typing import Literal, Optional
+
+import numpy as np
 
 from .models import *
+from .history import HISTORY_RESOLUTIONS
+from .metrics import LatestReports, combine_stages, render_metrics
+from .store import StatisticsStore, open_store
+from .stream import StatisticsBroadcaster
 
 app = FastAPI(
     title='SMS Simulator Statistics Collector',
@@ -26,12 +33,49 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-stat_lock = Lock()
+store_lock = Lock()
+stats_store = None
+
+def get_store() -> StatisticsStore:
+    '''
+        Statistics store for this API process, opened on first use
+        as configured by the `SMS_STATS_STORE` and `SMS_STATS_PATH`
+        environment variables (in-memory by default)
+    '''
+    global stats_store
+
+    with store_lock:
+        if stats_store is None:
+            stats_store = open_store(
+                os.getenv("SMS_STATS_STORE", "memory"), 
+                os.getenv("SMS_STATS_PATH")
+            )
+        return stats_store
+
+def update_interval() -> float:
+    '''
+        Seconds between updates sent to the Monitor frontend
+    '''
+    return float(os.getenv("SMS_UPDATE_INTERVAL", 1))
+
+def reports_path(kind: str) -> Optional[str]:
+    '''
+        Directory reports of one kind are shared between API workers
+        through, if `SMS_METRICS_DIR` is set
+    '''
+    path = os.getenv("SMS_METRICS_DIR")
+    return os.path.join(path, kind) if path else None
 
-message_statistics = MessageStatistics(
-    success_messages=0,
-    failed_messages=0,
-    average_delay=0.0
+stage_timings = LatestReports(reports_path("stages"))
+queue_reports = LatestReports(reports_path("queue"))
+
+def latest_queue_report() -> Optional[QueueTelemetryReport]:
+    reports = queue_reports.sources()
+    return QueueTelemetryReport(**reports[0]) if reports else None
+
+broadcaster = StatisticsBroadcaster(
+    read=lambda: get_store().statistics().model_dump_json(),
+    interval=update_interval
 )
 
 @app.get("/")
@@ -50,49 +94,176 @@ def server_check():
 def get_interval():
     '''
         For Monitor frontend, return interval at which the 
-        Monitor should poll for updates.
+        Monitor is sent updates.
     '''
     return {
-        "interval": float(os.getenv("SMS_UPDATE_INTERVAL", 1))
+        "interval": update_interval()
     }
 
 @app.post("/message", response_model=None, responses={"400": {"model": ErrorResponse}})
-def report_message_result(message_result: MessageResultRequest):
+def report_message_result(
+        message_result: MessageResultRequest, 
+        store: StatisticsStore = Depends(get_store)
+):
     '''
         Receive report of a Message processing from a Sender
 
-        Update collected statistics in-memory.
+        Update collected statistics in the statistics store.
+    '''
+    store.record_one(message_result.success, message_result.delay, message_result.sender_id)
+
+    return "OK"
+
+@app.post("/messages/batch", response_model=None, responses={"400": {"model": ErrorResponse}})
+def report_message_results(
+        message_results: list[MessageResultRequest], 
+        store: StatisticsStore = Depends(get_store)
+):
+    '''
+        Receive reports of several Message processings from a Sender
+
+        Update collected statistics in a single store update.
+    '''
+    if not message_results:
+        return "OK"
+
+    store.record(
+        np.fromiter((result.success for result in message_results), dtype=bool, count=len(message_results)),
+        np.fromiter((result.delay for result in message_results), dtype=np.float64, count=len(message_results)),
+        np.fromiter((result.sender_id for result in message_results), dtype=np.int64, count=len(message_results))
+    )
+
+    return "OK"
+
+@app.post("/messages/compact", response_model=None, responses={"400": {"model": ErrorResponse}})
+async def report_compact_results(
+        request: Request, 
+        store: StatisticsStore = Depends(get_store)
+):
     '''
-    
-    # The API isn't running multiple workers - it's not
-    # necessary quite yet, so this lock is mainly
-    # to demonstrate that we want to ensure we don't miss 
-    # an update to race conditions when we do go to 
-    # multiple workers.
+        Receive compact binary reports of Message processings from
+        a Sender (see `COMPACT_RESULT` in models)
+
+        Update collected statistics in a single store update.
+    '''
+    try:
+        results = unpack_results(await request.body())
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+
+    if len(results) == 0:
+        return "OK"
 
-    with stat_lock:
-        message_statistics.success_messages += 1 if message_result.success else 0
-        message_statistics.failed_messages += 0 if message_result.success else 1
-        total_messages = message_statistics.success_messages + message_statistics.failed_messages
-        message_statistics.average_delay = round((message_statistics.average_delay * (total_messages - 1) + message_result.delay) / (total_messages), 4)
+    store.record(results["success"], results["delay"], results["sender_id"], results["timestamp"])
 
     return "OK"
 
 @app.get("/statistics", response_model=MessageStatistics)
-def retrieve_statistics():
+def retrieve_statistics(store: StatisticsStore = Depends(get_store)):
     '''
         Return collected statistics to Monitor frontend
     '''
-    return message_statistics
+    return store.statistics()
+
+@app.get("/statistics/stream")
+def stream_statistics():
+    '''
+        Stream collected statistics to Monitor frontends as 
+        Server-Sent Events, pushed whenever they change, at most 
+        once per update interval
+    '''
+    return StreamingResponse(
+        broadcaster.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.get("/statistics/latency", response_model=LatencyReport)
+def retrieve_latency(store: StatisticsStore = Depends(get_store)):
+    '''
+        Return delay percentiles, minimum and maximum, overall
+        and for each sender
+    '''
+    return store.latency()
+
+@app.get("/statistics/history", response_model=HistoryReport)
+def retrieve_history(
+        resolution: Literal["second", "minute"] = "second",
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        store: StatisticsStore = Depends(get_store)
+):
+    '''
+        Return results per second or per minute from `start` to
+        `end` seconds since the epoch, by default everything still
+        held at that resolution up to now
+    '''
+    seconds, length = HISTORY_RESOLUTIONS[resolution]
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = end - seconds * length
+
+    return store.history(resolution, start, end)
+
+@app.post("/statistics/queue", response_model=None)
+def report_queue_telemetry(telemetry: QueueTelemetryReport):
+    '''
+        Receive the message queue's depth, wait times and lock 
+        contention so far, replacing any sent before
+    '''
+    queue_reports.put("simulator", telemetry.model_dump())
+
+    return "OK"
+
+@app.get("/statistics/queue", response_model=QueueTelemetryReport, responses={"404": {"model": ErrorResponse}})
+def retrieve_queue_telemetry():
+    '''
+        Return the latest message queue telemetry, to tell Senders 
+        falling behind (long waits in a deep queue) apart from 
+        contention for the queue itself (long lock waits)
+    '''
+    report = latest_queue_report()
+    if report is None:
+        return JSONResponse(status_code=404, content={"message": "No queue telemetry has been reported yet"})
+    return report
+
+@app.post("/metrics/stages", response_model=None, responses={"400": {"model": ErrorResponse}})
+def report_stage_timings(timings: StageTimingsRequest):
+    '''
+        Receive the stage timings so far of one simulator process,
+        replacing any it sent before
+    '''
+    try:
+        stage_timings.put(timings.source, {name: stage.model_dump() for name, stage in timings.stages.items()})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+
+    return "OK"
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def retrieve_metrics(store: StatisticsStore = Depends(get_store)):
+    '''
+        Return statistics and stage timings in the Prometheus text
+        format, for scraping
+    '''
+    return PlainTextResponse(
+        render_metrics(
+            store.statistics(), 
+            store.latency().overall, 
+            combine_stages(stage_timings.sources()), 
+            latest_queue_report()
+        ),
+        media_type="text/plain; version=0.0.4"
+    )
 
 @app.post("/reset", response_model=None)
-def reset_statistics():
+def reset_statistics(store: StatisticsStore = Depends(get_store)):
     '''
         Used for testing - reset statistics to 0s
     '''
-    with stat_lock:
-        message_statistics.success_messages = 0
-        message_statistics.failed_messages = 0
-        message_statistics.average_delay = 0.0
+    store.reset()
+    stage_timings.reset()
+    queue_reports.reset()
 
     return "OK"
\ No newline at end of file
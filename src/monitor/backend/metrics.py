@@ -0,0 +1,141 @@
+import json
+import os
+import re
+from threading import Lock
+from typing import Optional
+
+from .models import LatencyStatistics, MessageStatistics, QueueTelemetryReport
+
+class LatestReports():
+    '''
+        Latest report pushed by each simulator process, such as its
+        stage timings, as plain dicts by source.
+
+        Kept in memory, or with a `path`, as one JSON file per
+        source in that directory, so every API worker sees reports
+        pushed to any of them.
+    '''
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._reports = {}
+        self._lock = Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def put(self, source: str, report: dict):
+        if not re.fullmatch(r"[\w-]+", source):
+            raise ValueError("Report source must only hold letters, digits, '_' and '-'!")
+
+        if self.path is None:
+            with self._lock:
+                self._reports[source] = report
+            return
+
+        # write then rename, so readers never see half a file
+        target = os.path.join(self.path, f"{source}.json")
+        with open(target + ".tmp", "w") as file:
+            json.dump(report, file)
+        os.replace(target + ".tmp", target)
+
+    def sources(self) -> list[dict]:
+        if self.path is None:
+            with self._lock:
+                return list(self._reports.values())
+
+        found = []
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.path, name)) as file:
+                    found.append(json.load(file))
+        return found
+
+    def reset(self):
+        with self._lock:
+            self._reports = {}
+        if self.path is not None:
+            for name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, name))
+
+def combine_stages(sources: list[dict[str, dict]]) -> dict[str, dict]:
+    '''
+        Every stage's timings added up across sources
+    '''
+    stages = {}
+    for source in sources:
+        for name, stage in source.items():
+            total = stages.get(name)
+            if total is None:
+                stages[name] = dict(stage, buckets=list(stage["buckets"]))
+            elif total["le"] == stage["le"]:
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], stage["buckets"])]
+                total["count"] += stage["count"]
+                total["sum"] += stage["sum"]
+    return stages
+
+def _metric(lines: list[str], name: str, kind: str, description: str):
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {kind}")
+
+def _histogram(lines: list[str], name: str, labels: str, le: list[float], buckets: list[int], total: float, count: int):
+    cumulative = 0
+    for bound, n in zip(le + ["+Inf"], buckets):
+        cumulative += n
+        lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+    labels = labels.rstrip(",")
+    labels = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{labels} {total}")
+    lines.append(f"{name}_count{labels} {count}")
+
+def render_metrics(
+        statistics: MessageStatistics,
+        latency: LatencyStatistics,
+        stages: dict[str, dict],
+        queue: Optional[QueueTelemetryReport] = None
+) -> str:
+    '''
+        Format statistics and stage timings in the Prometheus text
+        exposition format
+    '''
+    lines = []
+
+    _metric(lines, "sms_messages_total", "counter", "Message results reported to the Monitor.")
+    lines.append(f'sms_messages_total{{result="success"}} {statistics.success_messages}')
+    lines.append(f'sms_messages_total{{result="failed"}} {statistics.failed_messages}')
+
+    total = statistics.success_messages + statistics.failed_messages
+    _metric(lines, "sms_message_delay_seconds", "summary", "Send delay of reported messages.")
+    for quantile, value in [("0.5", latency.p50), ("0.9", latency.p90), ("0.99", latency.p99), ("0.999", latency.p999)]:
+        lines.append(f'sms_message_delay_seconds{{quantile="{quantile}"}} {value}')
+    lines.append(f"sms_message_delay_seconds_sum {statistics.average_delay * total}")
+    lines.append(f"sms_message_delay_seconds_count {total}")
+
+    if stages:
+        _metric(lines, "sms_stage_seconds", "histogram", "Time spent in each stage of the simulation, across simulator processes.")
+    for name, stage in stages.items():
+        _histogram(lines, "sms_stage_seconds", f'stage="{name}",', stage["le"], stage["buckets"], stage["sum"], stage["count"])
+
+    if queue is not None:
+        _metric(lines, "sms_queue_depth", "gauge", "Messages waiting in the message queue.")
+        lines.append(f"sms_queue_depth {queue.depth}")
+        _metric(lines, "sms_queue_peak_depth", "gauge", "Most messages ever waiting in the message queue.")
+        lines.append(f"sms_queue_peak_depth {queue.peak_depth}")
+        _metric(lines, "sms_queue_wait_seconds", "histogram", "Time messages waited in the queue before a Sender pulled them.")
+        _histogram(lines, "sms_queue_wait_seconds", "", queue.wait_le, queue.wait_buckets, queue.wait_sum, queue.dequeued)
+        _metric(lines, "sms_queue_wait_seconds_max", "gauge", "Longest time a message waited in the queue.")
+        lines.append(f"sms_queue_wait_seconds_max {queue.wait_max}")
+        _metric(lines, "sms_queue_lock_wait_seconds", "summary", "Time spent waiting to acquire the queue's lock.")
+        lines.append(f"sms_queue_lock_wait_seconds_sum {queue.lock_wait_sum}")
+        lines.append(f"sms_queue_lock_wait_seconds_count {queue.lock_acquisitions}")
+        _metric(lines, "sms_queue_lock_wait_seconds_max", "gauge", "Longest wait to acquire the queue's lock.")
+        lines.append(f"sms_queue_lock_wait_seconds_max {queue.lock_wait_max}")
+
+    if queue is not None and queue.priorities:
+        _metric(lines, "sms_queue_priority_depth", "gauge", "Messages of each priority waiting in the message queue.")
+        for lane in queue.priorities:
+            lines.append(f'sms_queue_priority_depth{{priority="{lane.priority}"}} {lane.depth}')
+        _metric(lines, "sms_queue_priority_wait_seconds", "histogram", "Time messages of each priority waited in the queue.")
+        for lane in queue.priorities:
+            _histogram(lines, "sms_queue_priority_wait_seconds", f'priority="{lane.priority}",', queue.wait_le, lane.wait_buckets, lane.wait_sum, lane.dequeued)
+
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,8 @@
-from sqlmodel import SQLModel
+import struct
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Field, SQLModel
 
 # Obviously this codebase doesn't use a database, but SQLModel is essentially just a wrapper around
 # Pydantic and SQLAlchemy, so if there was a _need_ to move to a database, we're most of the way 
@@ -7,15 +11,138 @@ from sqlmodel import SQLModel
 # It also interoperates quite nicely with FastAPI (same developer!)
 
 class MessageResultRequest(SQLModel):
-    message: str
-    phone: str
+    message: Optional[str] = None # not used by the statistics, so Senders may leave them out
+    phone: Optional[str] = None
     success: bool
     delay: float
+    sender_id: int = 0
+
+# Compact result report: success flag, delay, sender id and timestamp, 
+# packed little-endian with no padding. Several reports are sent as one 
+# body of back-to-back records.
+COMPACT_RESULT = struct.Struct("<?dId")
+COMPACT_RESULT_DTYPE = np.dtype([
+    ("success", "?"),
+    ("delay", "<f8"),
+    ("sender_id", "<u4"),
+    ("timestamp", "<f8")
+])
+
+def pack_result(success: bool, delay: float, sender_id: int, timestamp: float) -> bytes:
+    '''
+        Encode one compact result report
+    '''
+    return COMPACT_RESULT.pack(success, delay, sender_id, timestamp)
+
+def unpack_results(body: bytes) -> np.ndarray:
+    '''
+        Decode a body of compact result reports into a structured 
+        array with one row per report
+    '''
+    if len(body) % COMPACT_RESULT.size != 0:
+        raise ValueError(f"Compact report body must be a multiple of {COMPACT_RESULT.size} bytes!")
+    return np.frombuffer(body, dtype=COMPACT_RESULT_DTYPE)
 
 class MessageStatistics(SQLModel):
     success_messages: int
     failed_messages: int
     average_delay: float
 
+class LatencyStatistics(SQLModel):
+    count: int
+    min_delay: float
+    max_delay: float
+    p50: float
+    p90: float
+    p99: float
+    p999: float
+
+class LatencyReport(SQLModel):
+    overall: LatencyStatistics
+    senders: dict[int, LatencyStatistics]
+
+class HistoryBucket(SQLModel):
+    time: int # start of the bucket, in seconds since the epoch
+    success_messages: int
+    failed_messages: int
+    average_delay: float
+
+class HistoryReport(SQLModel):
+    resolution: int # seconds covered by each bucket
+    buckets: list[HistoryBucket]
+
+class PriorityWaitReport(SQLModel):
+    # Queue waits of the messages in one priority lane, with 
+    # histogram buckets bounded by the report's `wait_le`
+    priority: str
+    depth: int
+    dequeued: int
+    wait_sum: float
+    wait_max: float
+    wait_buckets: list[int]
+
+class QueueTelemetryReport(SQLModel):
+    depth: int
+    peak_depth: int
+    dequeued: int
+    wait_sum: float # seconds pulled messages waited in the queue, in total
+    wait_max: float
+    wait_le: list[float] # upper bound of each wait histogram bucket but the last, in seconds
+    wait_buckets: list[int] # pulled messages in each bucket, not cumulative
+    lock_acquisitions: int
+    lock_wait_sum: float # seconds spent waiting for the queue lock, in total
+    lock_wait_max: float
+    priorities: list[PriorityWaitReport] = []
+
+class SimulationReport(SQLModel):
+    # Final statistics of a run without the Monitor. `duration` is in
+    # simulated seconds, `elapsed` in wall clock seconds, which are 
+    # the same outside of virtual time.
+    statistics: MessageStatistics
+    latency: LatencyReport
+    history: HistoryReport
+    duration: float
+    elapsed: float
+    throughput: float # messages per simulated second
+    queue: Optional[QueueTelemetryReport] = None # not set in virtual time, which has no queue
+
+class StatisticsRecord(SQLModel, table=True):
+    # Running totals for stores shared between API workers
+    id: Optional[int] = Field(default=None, primary_key=True)
+    success_messages: int = 0
+    failed_messages: int = 0
+    total_delay: float = 0.0
+
+class LatencyBucket(SQLModel, table=True):
+    # Count of one sender's delays in one histogram bucket
+    sender_id: int = Field(primary_key=True)
+    bucket: int = Field(primary_key=True)
+    count: int = 0
+
+class SenderLatency(SQLModel, table=True):
+    # Smallest and largest delay reported by one sender
+    sender_id: int = Field(primary_key=True)
+    min_delay: float
+    max_delay: float
+
+class HistoryRecord(SQLModel, table=True):
+    # Results in one time bucket of the throughput history
+    resolution: int = Field(primary_key=True)
+    slot: int = Field(primary_key=True)
+    success_messages: int = 0
+    failed_messages: int = 0
+    total_delay: float = 0.0
+
 class ErrorResponse(SQLModel):
-    message: str
\ No newline at end of file
+    message: str
+
+class StageTimings(SQLModel):
+    description: str
+    le: list[float] # upper bound of each histogram bucket but the last, in seconds
+    buckets: list[int] # timings in each bucket, not cumulative
+    count: int
+    sum: float
+
+class StageTimingsRequest(SQLModel):
+    source: str # one per simulator process, whose latest timings replace its earlier ones
+    stages: dict[str, StageTimings]
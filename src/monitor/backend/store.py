@@ -0,0 +1,630 @@
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from itertools import count
+from threading import Lock, local
+from typing import Iterator, Optional
+
+import numpy as np
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, SQLModel, create_engine
+
+from .histogram import NUM_BUCKETS, LatencyHistogram, bucket_indices
+from .history import HISTORY_RESOLUTIONS, RingSeries, history_report
+from .models import (
+    HistoryRecord,
+    HistoryReport,
+    LatencyBucket,
+    LatencyReport,
+    MessageStatistics,
+    SenderLatency,
+    SimulationReport,
+    StatisticsRecord
+)
+
+STATS_STORES = ["memory", "shared", "sqlite"]
+# Default number of sets of running totals in a MemoryStore
+NUM_SHARDS = 16
+
+class StatisticsStore():
+    '''
+        Where the Monitor backend keeps the statistics it collects.
+
+        Stores keep running totals and compute the average delay
+        only when statistics are read, so it is rounded just once.
+        They also keep a LatencyHistogram of delays per sender, and a
+        throughput history at each of the HISTORY_RESOLUTIONS.
+
+        `memory` only works within one API process. `shared` and
+        `sqlite` stores are opened by name in every worker process,
+        so the API can run several uvicorn workers and still report
+        correct totals.
+    '''
+
+    def record(
+            self, 
+            success: np.ndarray, 
+            delay: np.ndarray, 
+            sender_id: np.ndarray, 
+            timestamp: Optional[np.ndarray] = None
+    ):
+        '''
+            Add results, given as one array per field, to the 
+            collected statistics. Results without a `timestamp` 
+            count as reported now.
+        '''
+        raise NotImplementedError
+
+    def record_one(self, success: bool, delay: float, sender_id: int):
+        '''
+            Add a single result, reported now, to the collected 
+            statistics
+        '''
+        self.record(np.array([success]), np.array([delay]), np.array([sender_id]))
+
+    def statistics(self) -> MessageStatistics:
+        '''
+            Return the collected statistics
+        '''
+        raise NotImplementedError
+
+    def latency(self) -> LatencyReport:
+        '''
+            Return delay percentiles overall and per sender
+        '''
+        raise NotImplementedError
+
+    def history(self, resolution: str, start: float, end: float) -> HistoryReport:
+        '''
+            Return the throughput history from `start` to `end`
+            seconds since the epoch, in buckets of `resolution`
+        '''
+        raise NotImplementedError
+
+    def reset(self):
+        '''
+            Reset statistics to 0s
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''
+            Release the store. Whoever created a shared store also
+            removes it.
+        '''
+        pass
+
+def average(total_delay: float, total_messages: int) -> float:
+    '''
+        Average delay, rounded for reporting
+    '''
+    if total_messages == 0:
+        return 0.0
+    return round(total_delay / total_messages, 4)
+
+def timestamps(timestamp: Optional[np.ndarray], count: int) -> np.ndarray:
+    '''
+        Report times for `count` results, now if not given
+    '''
+    if timestamp is None:
+        return np.full(count, time.time())
+    return timestamp
+
+def delays_by_sender(delay: np.ndarray, sender_id: np.ndarray) -> Iterator[tuple[int, np.ndarray]]:
+    '''
+        Split delays by the sender that reported them
+    '''
+    if len(sender_id) == 0:
+        return
+    if (sender_id == sender_id[0]).all():
+        yield int(sender_id[0]), delay
+        return
+    for sid in np.unique(sender_id):
+        yield int(sid), delay[sender_id == sid]
+
+def latency_report(histograms: dict[int, LatencyHistogram], overall: Optional[LatencyHistogram] = None) -> LatencyReport:
+    '''
+        Summarize per-sender histograms, merging them for the 
+        overall figures unless those are kept separately
+    '''
+    if overall is None:
+        overall = LatencyHistogram()
+        for histogram in histograms.values():
+            overall.merge(histogram)
+
+    return LatencyReport(
+        overall=overall.summary(),
+        senders={sid: histograms[sid].summary() for sid in sorted(histograms)}
+    )
+
+class Shard():
+    '''
+        One set of running totals and the lock guarding them
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.success_messages = 0
+        self.failed_messages = 0
+        self.total_delay = 0.0
+        self.histograms = {}
+        self.history = {
+            name: RingSeries(seconds, length) 
+            for name, (seconds, length) in HISTORY_RESOLUTIONS.items()
+        }
+
+class MemoryStore(StatisticsStore):
+    '''
+        Statistics held in this process as `num_shards` sets of 
+        running totals. Threads are handed shards in turn as they 
+        first report and keep adding to theirs, so concurrent 
+        reports rarely wait on each other; the shards are only 
+        combined, and the average only computed and rounded, when 
+        statistics are read.
+    '''
+
+    def __init__(self, num_shards: int = NUM_SHARDS):
+        if num_shards < 1:
+            raise ValueError("Number of shards must be >= 1!")
+        self.shards = [Shard() for _ in range(num_shards)]
+        self._next_shard = count()
+        self._thread = local()
+
+    def _shard(self) -> Shard:
+        '''
+            Shard the calling thread adds to
+        '''
+        try:
+            return self._thread.shard
+        except AttributeError:
+            self._thread.shard = self.shards[next(self._next_shard) % len(self.shards)]
+            return self._thread.shard
+
+    def record(
+            self, 
+            success: np.ndarray, 
+            delay: np.ndarray, 
+            sender_id: np.ndarray, 
+            timestamp: Optional[np.ndarray] = None
+    ):
+        if len(delay) == 1 and timestamp is None:
+            self.record_one(bool(success[0]), float(delay[0]), int(sender_id[0]))
+            return
+
+        successes = int(np.count_nonzero(success))
+        total_delay = float(delay.sum())
+        timestamp = timestamps(timestamp, len(delay))
+
+        shard = self._shard()
+        with shard.lock:
+            shard.success_messages += successes
+            shard.failed_messages += len(success) - successes
+            shard.total_delay += total_delay
+            for sid, delays in delays_by_sender(delay, sender_id):
+                if sid not in shard.histograms:
+                    shard.histograms[sid] = LatencyHistogram()
+                shard.histograms[sid].record(delays)
+            for series in shard.history.values():
+                series.add(timestamp, success, delay)
+
+    def record_one(self, success: bool, delay: float, sender_id: int):
+        now = time.time()
+
+        shard = self._shard()
+        with shard.lock:
+            if success:
+                shard.success_messages += 1
+            else:
+                shard.failed_messages += 1
+            shard.total_delay += delay
+            if sender_id not in shard.histograms:
+                shard.histograms[sender_id] = LatencyHistogram()
+            shard.histograms[sender_id].record_one(delay)
+            for series in shard.history.values():
+                series.add_one(now, success, delay)
+
+    def statistics(self) -> MessageStatistics:
+        successes, failures, total_delay = 0, 0, 0.0
+        for shard in self.shards:
+            with shard.lock:
+                successes += shard.success_messages
+                failures += shard.failed_messages
+                total_delay += shard.total_delay
+
+        return MessageStatistics(
+            success_messages=successes,
+            failed_messages=failures,
+            average_delay=average(total_delay, successes + failures)
+        )
+
+    def latency(self) -> LatencyReport:
+        histograms = {}
+        for shard in self.shards:
+            with shard.lock:
+                for sid, histogram in shard.histograms.items():
+                    histograms.setdefault(sid, LatencyHistogram()).merge(histogram)
+        return latency_report(histograms)
+
+    def history(self, resolution: str, start: float, end: float) -> HistoryReport:
+        parts = []
+        for shard in self.shards:
+            with shard.lock:
+                parts.append(shard.history[resolution].query(start, end))
+        return history_report(resolution, parts)
+
+    def reset(self):
+        for shard in self.shards:
+            with shard.lock:
+                shard.success_messages = 0
+                shard.failed_messages = 0
+                shard.total_delay = 0.0
+                shard.histograms = {}
+                for series in shard.history.values():
+                    series.reset()
+
+class SharedMemoryStore(StatisticsStore):
+    '''
+        Statistics counters in a named shared memory block, so
+        every process that opens the same `name` sees the same
+        totals.
+
+        The block holds an overall LatencyHistogram and one for each
+        of `num_senders` senders, fixed when the block is created;
+        delays from senders beyond those only count overall. The 
+        throughput history series follow the histograms.
+
+        Counters are updated under an exclusive `flock` on a lock
+        file next to the block, which works across processes that
+        don't share a parent to inherit a lock from.
+    '''
+
+    # success and failure counts, number of senders, then the sum of 
+    # all delays, followed by the histograms' bounds and bucket counts
+    # and the history series
+    HEADER_SIZE = 4 * 8
+    HISTOGRAM_WORDS = 2 + NUM_BUCKETS
+    HISTORY_SIZE = sum(length * RingSeries.WORDS * 8 for _, length in HISTORY_RESOLUTIONS.values())
+
+    def __init__(self, name: str, create: bool = False, num_senders: int = 1):
+        self.name = name
+        self.created = create
+
+        if create:
+            size = self.HEADER_SIZE + (num_senders + 1) * self.HISTOGRAM_WORDS * 8 + self.HISTORY_SIZE
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            # Only the creator should remove the block when it exits
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        self._counts = np.ndarray((3,), dtype=np.int64, buffer=self._shm.buf)
+        self._total_delay = np.ndarray((1,), dtype=np.float64, buffer=self._shm.buf, offset=24)
+        if create:
+            self._counts[2] = num_senders
+        self.num_senders = int(self._counts[2])
+
+        shape = (self.num_senders + 1, self.HISTOGRAM_WORDS)
+        words = np.ndarray(shape, dtype=np.int64, buffer=self._shm.buf, offset=self.HEADER_SIZE)
+        floats = np.ndarray(shape, dtype=np.float64, buffer=self._shm.buf, offset=self.HEADER_SIZE)
+        self._histograms = [LatencyHistogram(words[i, 2:], floats[i, :2]) for i in range(shape[0])]
+
+        self._history = {}
+        offset = self.HEADER_SIZE + shape[0] * shape[1] * 8
+        for resolution, (seconds, length) in HISTORY_RESOLUTIONS.items():
+            self._history[resolution] = RingSeries(
+                seconds,
+                length,
+                slots=np.ndarray((length,), dtype=np.int64, buffer=self._shm.buf, offset=offset),
+                counts=np.ndarray((length, 2), dtype=np.int64, buffer=self._shm.buf, offset=offset + length * 8),
+                delays=np.ndarray((length,), dtype=np.float64, buffer=self._shm.buf, offset=offset + length * 24)
+            )
+            offset += length * RingSeries.WORDS * 8
+
+        self._lock_file = open(f"/tmp/{name}.lock", "a+")
+
+        if create:
+            self.reset()
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def record(
+            self, 
+            success: np.ndarray, 
+            delay: np.ndarray, 
+            sender_id: np.ndarray, 
+            timestamp: Optional[np.ndarray] = None
+    ):
+        successes = int(np.count_nonzero(success))
+        total_delay = float(delay.sum())
+        timestamp = timestamps(timestamp, len(delay))
+
+        with self._locked():
+            self._counts[0] += successes
+            self._counts[1] += len(success) - successes
+            self._total_delay[0] += total_delay
+            self._histograms[0].record(delay)
+            for sid, delays in delays_by_sender(delay, sender_id):
+                if 0 <= sid < self.num_senders:
+                    self._histograms[sid + 1].record(delays)
+            for series in self._history.values():
+                series.add(timestamp, success, delay)
+
+    def statistics(self) -> MessageStatistics:
+        with self._locked():
+            successes, failures = self._counts[:2].tolist()
+            total_delay = float(self._total_delay[0])
+
+        return MessageStatistics(
+            success_messages=successes,
+            failed_messages=failures,
+            average_delay=average(total_delay, successes + failures)
+        )
+
+    def latency(self) -> LatencyReport:
+        with self._locked():
+            overall, *senders = [
+                LatencyHistogram(h.counts.copy(), h.bounds.copy()) for h in self._histograms
+            ]
+
+        return latency_report(
+            {sid: h for sid, h in enumerate(senders) if h.count > 0},
+            overall
+        )
+
+    def history(self, resolution: str, start: float, end: float) -> HistoryReport:
+        with self._locked():
+            part = self._history[resolution].query(start, end)
+        return history_report(resolution, [part])
+
+    def reset(self):
+        with self._locked():
+            self._counts[:2] = 0
+            self._total_delay[:] = 0.0
+            for histogram in self._histograms:
+                histogram.reset()
+            for series in self._history.values():
+                series.reset()
+
+    def close(self):
+        del self._counts, self._total_delay, self._histograms, self._history
+        self._shm.close()
+        self._lock_file.close()
+        if self.created:
+            # Attachers forked from this process share its resource 
+            # tracker and may have unregistered the block from it, 
+            # so register it again for unlink to unregister
+            resource_tracker.register(self._shm._name, "shared_memory")
+            self._shm.unlink()
+            os.remove(f"/tmp/{self.name}.lock")
+
+class SQLiteStore(StatisticsStore):
+    '''
+        Statistics kept as a single StatisticsRecord row in a SQLite
+        database in WAL mode, with histogram buckets as LatencyBucket
+        rows and history buckets as HistoryRecord rows, pruned to the
+        same length as the in-memory ring buffers. Each report is applied in one transaction of atomic
+        updates, so any number of processes can report concurrently.
+    '''
+
+    def __init__(self, path: str, create: bool = False):
+        self.path = path
+        self.created = create
+        self.engine = create_engine(
+            f"sqlite:///{path}",
+            connect_args={"timeout": 30, "check_same_thread": False}
+        )
+        event.listen(self.engine, "connect", self._configure)
+
+        if create:
+            SQLModel.metadata.create_all(self.engine, tables=[
+                StatisticsRecord.__table__,
+                LatencyBucket.__table__,
+                SenderLatency.__table__,
+                HistoryRecord.__table__
+            ])
+            with Session(self.engine) as session:
+                if session.get(StatisticsRecord, 1) is None:
+                    session.add(StatisticsRecord(id=1))
+                    session.commit()
+
+    @staticmethod
+    def _configure(connection, _):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    def record(
+            self, 
+            success: np.ndarray, 
+            delay: np.ndarray, 
+            sender_id: np.ndarray, 
+            timestamp: Optional[np.ndarray] = None
+    ):
+        successes = int(np.count_nonzero(success))
+        timestamp = timestamps(timestamp, len(delay))
+
+        buckets, bounds = [], []
+        for sid, delays in delays_by_sender(delay, sender_id):
+            indices, counts = np.unique(bucket_indices(delays), return_counts=True)
+            buckets += [
+                {"sender_id": sid, "bucket": i, "count": c} 
+                for i, c in zip(indices.tolist(), counts.tolist())
+            ]
+            bounds.append({"sender_id": sid, "min_delay": float(delays.min()), "max_delay": float(delays.max())})
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(StatisticsRecord).where(StatisticsRecord.id == 1).values(
+                    success_messages=StatisticsRecord.success_messages + successes,
+                    failed_messages=StatisticsRecord.failed_messages + len(success) - successes,
+                    total_delay=StatisticsRecord.total_delay + float(delay.sum())
+                )
+            )
+
+            if buckets:
+                stmt = insert(LatencyBucket)
+                connection.execute(stmt.on_conflict_do_update(
+                    index_elements=["sender_id", "bucket"],
+                    set_={"count": LatencyBucket.count + stmt.excluded.count}
+                ), buckets)
+
+                stmt = insert(SenderLatency)
+                connection.execute(stmt.on_conflict_do_update(
+                    index_elements=["sender_id"],
+                    set_={
+                        "min_delay": func.min(SenderLatency.min_delay, stmt.excluded.min_delay),
+                        "max_delay": func.max(SenderLatency.max_delay, stmt.excluded.max_delay)
+                    }
+                ), bounds)
+
+            for name, (seconds, length) in HISTORY_RESOLUTIONS.items():
+                self._record_history(connection, seconds, length, timestamp, success, delay)
+
+    @staticmethod
+    def _record_history(connection, seconds: int, length: int, timestamp: np.ndarray, success: np.ndarray, delay: np.ndarray):
+        '''
+            Add results to the history at one resolution, then drop
+            buckets that have fallen out of its window
+        '''
+        slots, inverse = np.unique((timestamp // seconds).astype(np.int64), return_inverse=True)
+        successes = np.bincount(inverse, weights=success, minlength=len(slots))
+        delays = np.bincount(inverse, weights=delay, minlength=len(slots))
+        totals = np.bincount(inverse, minlength=len(slots))
+
+        stmt = insert(HistoryRecord)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=["resolution", "slot"],
+            set_={
+                "success_messages": HistoryRecord.success_messages + stmt.excluded.success_messages,
+                "failed_messages": HistoryRecord.failed_messages + stmt.excluded.failed_messages,
+                "total_delay": HistoryRecord.total_delay + stmt.excluded.total_delay
+            }
+        ), [
+            {
+                "resolution": seconds,
+                "slot": slot,
+                "success_messages": int(s),
+                "failed_messages": int(t - s),
+                "total_delay": d
+            }
+            for slot, s, t, d in zip(slots.tolist(), successes.tolist(), totals.tolist(), delays.tolist())
+        ])
+
+        newest = select(func.max(HistoryRecord.slot)).where(HistoryRecord.resolution == seconds).scalar_subquery()
+        connection.execute(delete(HistoryRecord).where(
+            HistoryRecord.resolution == seconds,
+            HistoryRecord.slot <= newest - length
+        ))
+
+    def statistics(self) -> MessageStatistics:
+        with Session(self.engine) as session:
+            record = session.get(StatisticsRecord, 1)
+
+        return MessageStatistics(
+            success_messages=record.success_messages,
+            failed_messages=record.failed_messages,
+            average_delay=average(record.total_delay, record.success_messages + record.failed_messages)
+        )
+
+    def latency(self) -> LatencyReport:
+        histograms = {}
+        with self.engine.connect() as connection:
+            for sid, min_delay, max_delay in connection.execute(select(
+                SenderLatency.sender_id, SenderLatency.min_delay, SenderLatency.max_delay
+            )):
+                histograms[sid] = LatencyHistogram(bounds=np.array([min_delay, max_delay]))
+
+            for sid, bucket, count in connection.execute(select(
+                LatencyBucket.sender_id, LatencyBucket.bucket, LatencyBucket.count
+            )):
+                histograms[sid].counts[bucket] = count
+
+        return latency_report(histograms)
+
+    def history(self, resolution: str, start: float, end: float) -> HistoryReport:
+        seconds, _ = HISTORY_RESOLUTIONS[resolution]
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(
+                HistoryRecord.slot, 
+                HistoryRecord.success_messages, 
+                HistoryRecord.failed_messages, 
+                HistoryRecord.total_delay
+            ).where(
+                HistoryRecord.resolution == seconds,
+                HistoryRecord.slot >= start // seconds,
+                HistoryRecord.slot <= end // seconds
+            )).all()
+
+        return history_report(resolution, [(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1:3] for row in rows], dtype=np.int64).reshape(-1, 2),
+            np.array([row[3] for row in rows], dtype=np.float64)
+        )])
+
+    def reset(self):
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(StatisticsRecord).where(StatisticsRecord.id == 1).values(
+                    success_messages=0, failed_messages=0, total_delay=0.0
+                )
+            )
+            connection.execute(delete(LatencyBucket))
+            connection.execute(delete(SenderLatency))
+            connection.execute(delete(HistoryRecord))
+
+    def close(self):
+        self.engine.dispose()
+        if self.created:
+            for suffix in ["", "-wal", "-shm"]:
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+
+def simulation_report(store: StatisticsStore, start: float, end: float, elapsed: float) -> SimulationReport:
+    '''
+        Summarise a run from `start` to `end`, with its history per
+        second if it fits in the second ring buffer, else per minute
+    '''
+    statistics = store.statistics()
+    duration = end - start
+    resolution = "second" if duration <= HISTORY_RESOLUTIONS["second"][1] else "minute"
+    total = statistics.success_messages + statistics.failed_messages
+
+    return SimulationReport(
+        statistics=statistics,
+        latency=store.latency(),
+        history=store.history(resolution, start, end),
+        duration=duration,
+        elapsed=elapsed,
+        throughput=round(total / duration, 4) if duration else 0.0
+    )
+
+def open_store(
+        kind: str = "memory", 
+        path: Optional[str] = None, 
+        create: bool = False, 
+        num_senders: int = 1
+) -> StatisticsStore:
+    '''
+        Open the statistics store of the given kind. `shared` and
+        `sqlite` stores are found by `path`, and must be opened
+        with `create` once before any worker uses them. A `shared`
+        store keeps latency for up to `num_senders` senders.
+    '''
+    match kind:
+        case "memory":
+            return MemoryStore()
+        case "shared":
+            return SharedMemoryStore(path, create=create, num_senders=num_senders)
+        case "sqlite":
+            return SQLiteStore(path, create=create)
+    raise ValueError(f"Statistics store must be one of {STATS_STORES}!")
@@ -0,0 +1,75 @@
+import asyncio
+from typing import AsyncIterator, Callable
+
+# How often an idle stream sends a comment, so proxies and
+# clients can tell a quiet connection from a dead one
+KEEPALIVE_INTERVAL = 15
+
+class StatisticsBroadcaster():
+    '''
+        Fans statistics out to every open Server-Sent Events stream.
+
+        While anyone is subscribed, a single task calls `read` every
+        `interval()` seconds. When the result has changed since the
+        last push, it is formatted as an event once and handed to
+        every subscriber. Each subscriber only ever holds the newest
+        event, so a slow client skips stale updates rather than
+        queueing them.
+    '''
+
+    def __init__(self, read: Callable[[], str], interval: Callable[[], float]):
+        self.read = read
+        self.interval = interval
+        self.subscribers = set()
+        self.latest = None
+        self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        '''
+            Register a new stream, starting the broadcast task if
+            needed. The latest event is waiting for it straight away.
+        '''
+        queue = asyncio.Queue(maxsize=1)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.subscribers.add(queue)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._broadcast())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event: str):
+        '''
+            Replace whatever each subscriber has waiting with `event`
+        '''
+        self.latest = event
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _broadcast(self):
+        while self.subscribers:
+            # Stores may block on disk or a lock, so read off the loop
+            event = f"data: {await asyncio.to_thread(self.read)}\n\n"
+            if event != self.latest:
+                self.publish(event)
+            await asyncio.sleep(self.interval())
+
+    async def events(self) -> AsyncIterator[str]:
+        '''
+            Server-Sent Events for one client, until it disconnects
+        '''
+        queue = self.subscribe()
+        try:
+            yield f"retry: {int(self.interval() * 1000)}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(queue)
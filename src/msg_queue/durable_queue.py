@@ -0,0 +1,386 @@
+import mmap
+import os
+import shutil
+import struct
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from msg_queue.msg_queue import (
+    PRIORITIES,
+    Message,
+    MessageBatch,
+    MessageQueue,
+    check_phone,
+    count_messages
+)
+
+# Size of each segment file. A block too large for one gets a segment
+# of its own.
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Every push is written as one block: this header, then the phone
+# numbers (uint64), body offsets from the start of the bodies (int64)
+# and the UTF-8 bodies, padded to 8 bytes. The message count is
+# written last, so a block only becomes visible once it is complete.
+BLOCK_HEADER = struct.Struct("<IIB7x") # messages, body bytes, priority
+BLOCK_COUNT = struct.Struct("<I")
+SINGLE_MESSAGE = struct.Struct("<Qqq") # phone and body offsets of a one message block
+SEGMENT_END = 0xFFFFFFFF # count marking the rest of a segment unused
+
+# Saved state: whether the queue was closed, then for each lane the
+# position of its first unacknowledged message (segment, byte offset
+# and messages into that block) and how many it has acknowledged
+STATE_HEADER = struct.Struct("<Q")
+LANE_STATE = struct.Struct("<QQQQ")
+
+def block_size(count: int, body_bytes: int) -> int:
+    '''
+        Bytes taken by a block, padded to 8 bytes
+    '''
+    size = BLOCK_HEADER.size + 8 * (2 * count + 1) + body_bytes
+    return (size + 7) & ~7
+
+def map_file(path: str, size: Optional[int] = None) -> mmap.mmap:
+    '''
+        Memory-map a whole file, first creating it filled with
+        zeros if a `size` is given
+    '''
+    with open(path, "r+b" if size is None else "w+b") as file:
+        if size is not None:
+            file.truncate(size)
+        return mmap.mmap(file.fileno(), 0)
+
+class SegmentLog():
+    '''
+        Append-only log of message blocks for one priority lane,
+        held in memory-mapped segment files in `path`.
+
+        Blocks are read back as MessageBatches whose arrays and
+        bodies are views of the mapping, so nothing is copied.
+        The position of the first unacknowledged message is saved
+        in `state`, a mapped file shared by every lane, at `offset`,
+        and segments behind it are deleted. Reopening a log carries
+        on from that position.
+    '''
+
+    def __init__(self, path: str, state: mmap.mmap, offset: int):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._state = state
+        self._state_offset = offset
+        self._segments = {}
+
+        segment, position, skip, self.acknowledged = LANE_STATE.unpack_from(state, offset)
+        for name in sorted(n for n in os.listdir(path) if n.endswith(".seg")):
+            number = int(name.split(".")[0])
+            if number < segment:
+                os.remove(os.path.join(path, name))
+            else:
+                self._segments[number] = map_file(os.path.join(path, name))
+        if not self._segments:
+            self._segments[segment] = map_file(self._segment_path(segment), SEGMENT_SIZE)
+
+        self.read_position = (segment, position, skip)
+        self.unread, self._write_position = self._scan()
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.path, f"{number:08d}.seg")
+
+    def _next_block(self, segment: int, position: int) -> tuple[int, int] | None:
+        '''
+            Segment and offset of the first block at or after
+            `position`, or None if no more have been written
+        '''
+        mm = self._segments[segment]
+        if position < len(mm) and BLOCK_COUNT.unpack_from(mm, position)[0] != SEGMENT_END:
+            return segment, position
+        if segment + 1 in self._segments:
+            return segment + 1, 0
+        return None
+
+    def _scan(self) -> tuple[int, tuple[int, int]]:
+        '''
+            Count the messages after the read position, returning
+            that count and the position the next block goes at
+        '''
+        segment, position, skip = self.read_position
+        unread = -skip
+        while (block := self._next_block(segment, position)) is not None:
+            segment, position = block
+            count, body_bytes, _ = BLOCK_HEADER.unpack_from(self._segments[segment], position)
+            if count == 0:
+                break
+            unread += count
+            position += block_size(count, body_bytes)
+        return unread, (segment, position)
+
+    def _reserve(self, size: int) -> tuple[mmap.mmap, int]:
+        '''
+            Segment and offset to write a block of `size` bytes at,
+            starting a new segment if the current one is too full
+        '''
+        segment, position = self._write_position
+        mm = self._segments[segment]
+        if position + size <= len(mm):
+            return mm, position
+
+        if position < len(mm):
+            BLOCK_COUNT.pack_into(mm, position, SEGMENT_END)
+        segment += 1
+        self._segments[segment] = map_file(self._segment_path(segment), max(SEGMENT_SIZE, size))
+        self._write_position = (segment, 0)
+        return self._segments[segment], 0
+
+    def append(self, entry: Message | MessageBatch):
+        '''
+            Write a Message or MessageBatch as one block
+        '''
+        if type(entry) == MessageBatch:
+            self._write_batch(entry)
+            return
+
+        check_phone(entry.phone)
+        body = entry.message.encode("utf-8")
+        size = block_size(1, len(body))
+        mm, position = self._reserve(size)
+
+        BLOCK_HEADER.pack_into(mm, position, 0, len(body), entry.priority)
+        start = position + BLOCK_HEADER.size
+        SINGLE_MESSAGE.pack_into(mm, start, int(entry.phone), 0, len(body))
+        mm[start + SINGLE_MESSAGE.size:start + SINGLE_MESSAGE.size + len(body)] = body
+        self._written(mm, position, 1, size)
+
+    def extend(self, msgs: list[Message]):
+        '''
+            Write Messages of the same priority as one block
+        '''
+        self._write_batch(MessageBatch.from_messages(msgs))
+
+    def _write_batch(self, batch: MessageBatch):
+        '''
+            Write a MessageBatch as one block, copying its arrays 
+            and bodies straight into the mapping
+        '''
+        count = len(batch)
+        first, last = int(batch.offsets[0]), int(batch.offsets[-1])
+        size = block_size(count, last - first)
+        mm, position = self._reserve(size)
+
+        BLOCK_HEADER.pack_into(mm, position, 0, last - first, batch.priority)
+        start = position + BLOCK_HEADER.size
+        np.frombuffer(mm, dtype=np.uint64, count=count, offset=start)[:] = batch.phones
+        np.frombuffer(mm, dtype=np.int64, count=count + 1, offset=start + 8 * count)[:] = batch.offsets - first
+        start += 8 * (2 * count + 1)
+        mm[start:start + last - first] = batch.bodies[first:last]
+        self._written(mm, position, count, size)
+
+    def _written(self, mm: mmap.mmap, position: int, count: int, size: int):
+        '''
+            Make a block of `count` messages visible by writing its
+            count, and move the write position past it
+        '''
+        BLOCK_COUNT.pack_into(mm, position, count)
+        self._write_position = (self._write_position[0], position + size)
+        self.unread += count
+
+    def take(self, max_n: int) -> list[MessageBatch]:
+        '''
+            Read up to `max_n` messages from the read position as
+            views of the mapping, one batch per block
+        '''
+        taken = []
+        remaining = max_n
+        segment, position, skip = self.read_position
+
+        while remaining > 0 and (block := self._next_block(segment, position)) is not None:
+            segment, position = block
+            mm = self._segments[segment]
+            count, body_bytes, priority = BLOCK_HEADER.unpack_from(mm, position)
+            if count == 0:
+                break
+
+            start = position + BLOCK_HEADER.size
+            bodies = start + 8 * (2 * count + 1)
+            batch = MessageBatch(
+                np.frombuffer(mm, dtype=np.uint64, count=count, offset=start),
+                memoryview(mm)[bodies:bodies + body_bytes],
+                np.frombuffer(mm, dtype=np.int64, count=count + 1, offset=start + 8 * count),
+                priority
+            )
+
+            n = min(count - skip, remaining)
+            taken.append(batch if n == count else batch.slice(skip, skip + n))
+            remaining -= n
+            skip += n
+            if skip == count:
+                position += block_size(count, body_bytes)
+                skip = 0
+
+        self.read_position = (segment, position, skip)
+        self.unread -= max_n - remaining
+        return taken
+
+    def commit(self, position: tuple[int, int, int], count: int):
+        '''
+            Save `position` as the first unacknowledged message,
+            after `count` more were acknowledged, and delete the
+            segments before it
+        '''
+        self.acknowledged += count
+        LANE_STATE.pack_into(self._state, self._state_offset, *position, self.acknowledged)
+
+        for number in [n for n in self._segments if n < position[0]]:
+            self._unmap(self._segments.pop(number))
+            os.remove(self._segment_path(number))
+
+    def _unmap(self, mm: mmap.mmap):
+        try:
+            mm.close()
+        except BufferError:
+            pass # batches pulled from it are still in use, and it is unmapped once they are gone
+
+    def flush(self):
+        for mm in self._segments.values():
+            mm.flush()
+
+    def unmap(self):
+        for mm in self._segments.values():
+            self._unmap(mm)
+        self._segments = {}
+
+class DurableMessageQueue(MessageQueue):
+    '''
+        MessageQueue kept in memory-mapped files in the directory
+        `path`, so a run can hold more messages than fit in memory
+        and carry on where it stopped after the simulator dies.
+
+        Each priority lane is an append-only SegmentLog. Every push
+        is written straight into the mapping, and pulls hand out
+        MessageBatches viewing it without copying. The position of
+        each lane's first unacknowledged message is saved as
+        messages are acknowledged.
+
+        Opening a queue in a directory that already holds one
+        resumes it: every message pushed but not acknowledged is
+        queued again, and the queue stays closed if it was.
+        Acknowledgements only give a count, so they are credited to
+        the oldest pulls first. When Senders finish out of order, a
+        message in flight when the simulator died may be skipped or
+        sent again on resuming, at most one pull per Sender.
+
+        Messages are safe from the simulator process dying once
+        pushed. `flush` also writes them to disk, so they are safe
+        from the machine going down. Otherwise this queue behaves
+        as MessageQueue, in the threads of one process.
+    '''
+
+    def __init__(
+            self,
+            path: str,
+            max_size: Optional[int] = None,
+            producers: Optional[int] = 1,
+            lane_weights: Optional[list[float]] = None
+    ):
+        '''
+            Open or create the queue in `path`, queueing any messages
+            left unacknowledged from an earlier run
+        '''
+        super().__init__(max_size, producers, lane_weights)
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        state_path = os.path.join(path, "state")
+        state_size = STATE_HEADER.size + LANE_STATE.size * len(PRIORITIES)
+        self._state = map_file(state_path, None if os.path.exists(state_path) else state_size)
+        self._lanes = [
+            SegmentLog(os.path.join(path, name), self._state, STATE_HEADER.size + lane * LANE_STATE.size)
+            for lane, name in enumerate(PRIORITIES)
+        ]
+        self._pulls = deque() # [lane, position after, messages left to acknowledge, messages] per pull, oldest first
+
+        # Messages left to send from earlier runs, and every message
+        # those runs pushed
+        self.resumed = sum(log.unread for log in self._lanes)
+        self.previously_pushed = sum(log.acknowledged for log in self._lanes) + self.resumed
+
+        with self.q_lock:
+            for lane, log in enumerate(self._lanes):
+                if log.unread:
+                    self._added(log.unread, lane)
+            if STATE_HEADER.unpack_from(self._state)[0]:
+                self._producers = 0
+                self._check_complete()
+
+    def close(self):
+        '''
+            Signal that one producer has pushed all of its messages,
+            saving that the queue is closed once all have
+        '''
+        super().close()
+        with self.q_lock:
+            if self._producers == 0:
+                STATE_HEADER.pack_into(self._state, 0, 1)
+
+    def ack(self, count: int = 1):
+        '''
+            Acknowledge that `count` pulled messages have been fully
+            processed, saving the position of each lane's first
+            unacknowledged message once every message of the pulls
+            before it is acknowledged
+        '''
+        with self.q_lock:
+            self._acknowledged += count
+            while count and self._pulls:
+                pull = self._pulls[0]
+                n = min(count, pull[2])
+                pull[2] -= n
+                count -= n
+                if pull[2] == 0:
+                    self._pulls.popleft()
+                    self._lanes[pull[0]].commit(pull[1], pull[3])
+            self._check_complete()
+
+    def _take(self, max_n: int) -> list[MessageBatch]:
+        '''
+            Read up to `max_n` messages from the lane the scheduler
+            picks. Caller must hold `q_lock`.
+        '''
+        lane = self._scheduler.choose(self._lane_lengths)
+        if lane is None:
+            return []
+        log = self._lanes[lane]
+        batches = log.take(max_n)
+        count = count_messages(batches)
+        self._pulls.append([lane, log.read_position, count, count])
+        self._removed(count, lane)
+        return batches
+
+    def pull(self, timeout: Optional[float] = 0) -> Message | None:
+        '''
+            If available, retrieve a message from queue. `timeout`
+            behaves as in MessageQueue.
+        '''
+        batch = self.pull_batch(1, timeout)
+        return batch[0] if batch is not None else None
+
+    def flush(self):
+        '''
+            Write every pushed message and saved position to disk
+        '''
+        with self.q_lock:
+            for log in self._lanes:
+                log.flush()
+            self._state.flush()
+
+    def destroy(self):
+        '''
+            Unmap the queue and delete its files, once it is no
+            longer needed to resume from
+        '''
+        with self.q_lock:
+            for log in self._lanes:
+                log.unmap()
+            self._state.close()
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -1,10 +1,358 @@
+import bisect
+import time
+from collections import deque
 from dataclasses import dataclass
-from threading import Lock
+from threading import Condition, Event, Lock
+from typing import Iterable, Iterator, Optional
 
-@dataclass
+import numpy as np
+
+from instrumentation.stages import QUEUE_LOCK, QUEUE_PULL, QUEUE_PUSH
+
+PHONE_LEN = 10
+
+# Message priorities, most urgent first. Each priority has its own
+# lane in the queues, and messages are normal priority by default.
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = 1
+
+# Upper bounds, in seconds, of the histogram buckets for how long
+# messages wait in the queue. Longer waits go in a final bucket.
+QUEUE_WAIT_BUCKETS = (1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+@dataclass(slots=True)
 class Message():
     message: str
     phone: str
+    priority: int = DEFAULT_PRIORITY # index into PRIORITIES
+
+def check_priority(priority: int):
+    '''
+        Validate a message priority is an index into PRIORITIES
+    '''
+    if type(priority) != int or not 0 <= priority < len(PRIORITIES):
+        raise ValueError(f"Message priority must be an integer in [0, {len(PRIORITIES) - 1}]!")
+
+def check_phone(phone: str):
+    '''
+        Validate a phone number can be packed as an integer
+    '''
+    if not (len(phone) == PHONE_LEN and phone.isdigit() and phone.isascii()):
+        raise ValueError("Phone numbers in a MessageBatch must be exactly 10 digits!")
+
+class MessageBatch:
+    '''
+        Compact, struct-of-arrays block of Messages
+
+        Phone numbers are stored as a uint64 array and message 
+        bodies as one contiguous UTF-8 buffer, with message `i`
+        held in `bodies[offsets[i]:offsets[i+1]]`. Slicing a batch
+        shares the underlying buffers rather than copying them, and 
+        `bodies` may be any bytes-like object, such as a view of a
+        memory-mapped file.
+        Every message in a batch has the same `priority`.
+    '''
+
+    __slots__ = ("phones", "bodies", "offsets", "priority")
+
+    def __init__(
+            self, 
+            phones: np.ndarray, 
+            bodies: bytes, 
+            offsets: np.ndarray, 
+            priority: int = DEFAULT_PRIORITY
+    ):
+        self.phones = phones
+        self.bodies = bodies
+        self.offsets = offsets
+        self.priority = priority
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Message]) -> "MessageBatch":
+        '''
+            Pack Messages into a batch
+        '''
+        messages = list(messages)
+        encoded = [m.message.encode("utf-8") for m in messages]
+
+        priorities = {m.priority for m in messages} or {DEFAULT_PRIORITY}
+        if len(priorities) > 1:
+            raise ValueError("Messages in a MessageBatch must all have the same priority!")
+
+        for m in messages:
+            check_phone(m.phone)
+        phones = np.array([int(m.phone) for m in messages], dtype=np.uint64)
+
+        offsets = np.zeros(len(messages) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+
+        return cls(phones, b"".join(encoded), offsets, priorities.pop())
+
+    @classmethod
+    def concat(cls, batches: list["MessageBatch"]) -> "MessageBatch":
+        '''
+            Join several batches of the same priority into one
+        '''
+        if len(batches) == 1:
+            return batches[0]
+
+        bodies = b"".join(b.bodies[b.offsets[0]:b.offsets[-1]] for b in batches)
+        offsets = [np.zeros(1, dtype=np.int64)]
+        for b in batches:
+            offsets.append(b.offsets[1:] - b.offsets[0] + offsets[-1][-1])
+
+        return cls(
+            np.concatenate([b.phones for b in batches]),
+            bodies,
+            np.concatenate(offsets),
+            batches[0].priority
+        )
+
+    def __len__(self) -> int:
+        return len(self.phones)
+
+    def __reduce__(self):
+        # Pickle only this batch's own bodies, as bytes, rather than
+        # the whole buffer a slice shares, which may be a memory map
+        first, last = int(self.offsets[0]), int(self.offsets[-1])
+        return MessageBatch, (self.phones, bytes(self.bodies[first:last]), self.offsets - first, self.priority)
+
+    def __getitem__(self, i: int) -> Message:
+        return Message(message=self.body(i), phone=self.phone(i), priority=self.priority)
+
+    def __iter__(self) -> Iterator[Message]:
+        return (self[i] for i in range(len(self)))
+
+    def slice(self, start: int, stop: int) -> "MessageBatch":
+        '''
+            Return messages [start, stop) as a batch sharing
+            this batch's buffers
+        '''
+        stop = min(stop, len(self))
+        return MessageBatch(self.phones[start:stop], self.bodies, self.offsets[start:stop + 1], self.priority)
+
+    def body(self, i: int) -> str:
+        return str(self.bodies[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def phone(self, i: int) -> str:
+        return f"{int(self.phones[i]):0{PHONE_LEN}d}"
+
+    def lengths(self) -> np.ndarray:
+        '''
+            Length in characters of every message body
+
+            Counted from the UTF-8 buffer by skipping continuation
+            bytes, so no body is decoded.
+        '''
+        buffer = np.frombuffer(self.bodies, dtype=np.uint8, count=self.offsets[-1])
+        char_starts = np.zeros(len(buffer) + 1, dtype=np.int64)
+        np.cumsum((buffer & 0xC0) != 0x80, out=char_starts[1:])
+        return char_starts[self.offsets[1:]] - char_starts[self.offsets[:-1]]
+
+    def to_messages(self) -> list[Message]:
+        return list(self)
+
+def take_entries(entries: deque, max_n: int) -> list[Message | MessageBatch]:
+    '''
+        Remove up to `max_n` messages from the front of a deque of 
+        Messages and MessageBatches, splitting a batch if needed
+    '''
+    taken = []
+    remaining = max_n
+
+    while remaining > 0 and entries:
+        head = entries[0]
+        if type(head) == Message:
+            taken.append(entries.popleft())
+            remaining -= 1
+        elif len(head) <= remaining:
+            taken.append(entries.popleft())
+            remaining -= len(head)
+        else:
+            taken.append(head.slice(0, remaining))
+            entries[0] = head.slice(remaining, len(head))
+            remaining = 0
+
+    return taken
+
+def take_stamps(stamps: deque, count: int) -> list[tuple[float, int]]:
+    '''
+        Remove `count` messages from the front of a deque of 
+        [time queued, messages left] pairs, one per push, returning
+        the time and number of messages taken from each
+    '''
+    taken = []
+    while count:
+        stamp = stamps[0]
+        n = min(stamp[1], count)
+        taken.append((stamp[0], n))
+        count -= n
+        stamp[1] -= n
+        if stamp[1] == 0:
+            stamps.popleft()
+    return taken
+
+def count_messages(entries: list[Message | MessageBatch]) -> int:
+    '''
+        Number of messages held in a list of entries
+    '''
+    return sum(1 if type(entry) == Message else len(entry) for entry in entries)
+
+def entries_to_messages(entries: list[Message | MessageBatch]) -> list[Message]:
+    '''
+        Flatten entries into a list of Messages
+    '''
+    messages = []
+    for entry in entries:
+        if type(entry) == Message:
+            messages.append(entry)
+        else:
+            messages.extend(entry.to_messages())
+    return messages
+
+def entries_to_batch(entries: list[Message | MessageBatch]) -> MessageBatch | None:
+    '''
+        Join entries into one MessageBatch, packing runs of
+        single Messages
+    '''
+    if not entries:
+        return None
+
+    batches = []
+    singles = []
+    for entry in entries:
+        if type(entry) == Message:
+            singles.append(entry)
+            continue
+        if singles:
+            batches.append(MessageBatch.from_messages(singles))
+            singles = []
+        batches.append(entry)
+    if singles:
+        batches.append(MessageBatch.from_messages(singles))
+
+    return MessageBatch.concat(batches)
+
+class LaneScheduler():
+    '''
+        Picks which priority lane each pull takes messages from.
+
+        By default the most urgent lane holding messages always goes
+        first. Given `weights`, one per priority, lanes holding 
+        messages instead take turns in proportion to their weights
+        (smooth weighted round robin), so a busy high priority lane
+        can't starve the others. Turns are counted per pull, and a 
+        pull only takes messages from one lane.
+    '''
+
+    __slots__ = ("weights", "_credit")
+
+    def __init__(self, weights: Optional[list[float]] = None):
+        if weights is not None:
+            if len(weights) != len(PRIORITIES):
+                raise ValueError(f"Lane weights must give one weight per priority {list(PRIORITIES)}!")
+            if any(weight <= 0 for weight in weights):
+                raise ValueError("Lane weights must be positive!")
+        self.weights = weights
+        self._credit = [0.0] * len(PRIORITIES)
+
+    def choose(self, lengths: list[int]) -> int | None:
+        '''
+            Lane the next pull should take from, given how many 
+            messages each holds, or None if all are empty
+        '''
+        if self.weights is None:
+            lane = 0
+            for length in lengths:
+                if length:
+                    return lane
+                lane += 1
+            return None
+
+        chosen = None
+        total = 0.0
+        for lane, length in enumerate(lengths):
+            if length > 0:
+                self._credit[lane] += self.weights[lane]
+                total += self.weights[lane]
+                if chosen is None or self._credit[lane] > self._credit[chosen]:
+                    chosen = lane
+        if chosen is not None:
+            self._credit[chosen] -= total
+        return chosen
+
+class QueueTelemetry():
+    '''
+        How long messages of each priority waited in a queue before
+        being pulled, and how long callers waited to acquire the 
+        queue's lock.
+
+        Totals are kept in one flat sequence of floats, `values`, 
+        which may be shared between processes. The queue updates it
+        while holding its lock.
+    '''
+
+    # Position of each lock total in `values`, followed by a block 
+    # per priority of the wait totals, then the wait histogram
+    LOCK_ACQUISITIONS, LOCK_WAIT_SUM, LOCK_WAIT_MAX = range(3)
+    DEQUEUED, WAIT_SUM, WAIT_MAX = range(3)
+    LANE_SIZE = 3 + len(QUEUE_WAIT_BUCKETS) + 1
+    SIZE = 3 + LANE_SIZE * len(PRIORITIES)
+
+    def __init__(self, values: Optional[list[float]] = None):
+        self.values = values if values is not None else [0.0] * self.SIZE
+
+    def add_wait(self, wait: float, count: int = 1, priority: int = DEFAULT_PRIORITY):
+        '''
+            Count `count` messages of `priority` pulled after waiting 
+            `wait` seconds
+        '''
+        values = self.values
+        lane = 3 + priority * self.LANE_SIZE
+        values[lane + self.DEQUEUED] += count
+        values[lane + self.WAIT_SUM] += wait * count
+        if wait > values[lane + self.WAIT_MAX]:
+            values[lane + self.WAIT_MAX] = wait
+        values[lane + 3 + bisect.bisect_left(QUEUE_WAIT_BUCKETS, wait)] += count
+
+    def add_lock_wait(self, wait: float):
+        values = self.values
+        values[self.LOCK_ACQUISITIONS] += 1
+        values[self.LOCK_WAIT_SUM] += wait
+        if wait > values[self.LOCK_WAIT_MAX]:
+            values[self.LOCK_WAIT_MAX] = wait
+
+    def snapshot(self, depth: int, peak_depth: int, lane_depths: list[int]) -> dict:
+        '''
+            Totals so far, across priorities and for each, with the
+            queue's current and peak depth and the depth of each lane
+        '''
+        values = list(self.values)
+        lanes = []
+        for priority, name in enumerate(PRIORITIES):
+            lane = values[3 + priority * self.LANE_SIZE:3 + (priority + 1) * self.LANE_SIZE]
+            lanes.append({
+                "priority": name,
+                "depth": lane_depths[priority],
+                "dequeued": int(lane[self.DEQUEUED]),
+                "wait_sum": lane[self.WAIT_SUM],
+                "wait_max": lane[self.WAIT_MAX],
+                "wait_buckets": [int(v) for v in lane[3:]]
+            })
+
+        return {
+            "depth": depth,
+            "peak_depth": peak_depth,
+            "dequeued": sum(lane["dequeued"] for lane in lanes),
+            "wait_sum": sum(lane["wait_sum"] for lane in lanes),
+            "wait_max": max(lane["wait_max"] for lane in lanes),
+            "wait_le": list(QUEUE_WAIT_BUCKETS),
+            "wait_buckets": [sum(counts) for counts in zip(*(lane["wait_buckets"] for lane in lanes))],
+            "lock_acquisitions": int(values[self.LOCK_ACQUISITIONS]),
+            "lock_wait_sum": values[self.LOCK_WAIT_SUM],
+            "lock_wait_max": values[self.LOCK_WAIT_MAX],
+            "priorities": lanes
+        }
 
 class MessageQueue:
     '''
@@ -18,36 +366,373 @@ class MessageQueue:
         needed to scale out.
     '''
 
-    def __init__(self):
+    def __init__(
+            self, 
+            max_size: Optional[int] = None, 
+            producers: Optional[int] = 1, 
+            lane_weights: Optional[list[float]] = None
+    ):
         '''
             Create queue and lock for avoiding 
             concurrency errors
+
+            Backed by a deque so both ends are O(1), with conditions
+            on the lock so Senders can wait for Messages instead of
+            polling, and producers can wait for room when the queue
+            is bounded by `max_size`.
+
+            Entries are single Messages or whole MessageBatches, so 
+            the number of queued messages is tracked separately.
+
+            Each priority has its own lane, a deque of entries, and a
+            LaneScheduler picks the lane each pull takes from: the 
+            most urgent holding messages, or in turns by 
+            `lane_weights` if given. Order is kept within a lane.
+
+            Each of the `producers` calls `close` once it has pushed
+            everything. Consumers `ack` messages once they are done
+            with them, and the queue is complete when it is closed 
+            and every pushed message has been acknowledged.
+
+            Each push is stamped with the time it was queued, kept
+            alongside the lane's entries as (time, count) pairs, so 
+            the wait of every pulled message is counted by priority
+            in `telemetry` along with waits for the lock.
         '''
-        self._queue = []
+        if max_size is not None and max_size < 1:
+            raise ValueError("Max queue size must be positive!")
+        if producers < 1:
+            raise ValueError("Number of producers must be positive!")
+
+        self.max_size = max_size
+        self.high_water_mark = 0 # largest length the queue has reached
+        self._lanes = [deque() for _ in PRIORITIES]
+        self._stamps = [deque() for _ in PRIORITIES] # [time queued, messages left] per push, oldest first
+        self._lane_lengths = [0] * len(PRIORITIES)
+        self._length = 0
+        self._scheduler = LaneScheduler(lane_weights)
+        self._producers = producers # producers yet to close the queue
+        self._pushed = 0
+        self._acknowledged = 0
+        self._complete = Event()
         self.q_lock = Lock()
+        self._not_empty = Condition(self.q_lock)
+        self._not_full = Condition(self.q_lock)
+        self._telemetry = QueueTelemetry()
 
     def length(self) -> int:
         '''
             Return current length of queue
         '''
-        return len(self._queue)
+        return self._length
+
+    @property
+    def closed(self) -> bool:
+        '''
+            Whether every producer has finished pushing
+        '''
+        return self._producers == 0
+
+    @property
+    def drained(self) -> bool:
+        '''
+            Whether the queue is closed and every message has been 
+            pulled, so consumers can stop
+        '''
+        return self.closed and self._length == 0
+
+    @property
+    def acknowledged(self) -> int:
+        '''
+            Number of messages consumers have acknowledged
+        '''
+        return self._acknowledged
+
+    def telemetry(self) -> dict:
+        '''
+            Current and peak depth, how long pulled messages waited
+            in the queue and how long callers waited for its lock
+        '''
+        with self.q_lock:
+            return self._telemetry.snapshot(self._length, self.high_water_mark, self._lane_lengths)
+
+    def _lock_acquired(self, started: float):
+        '''
+            Count the wait for `q_lock` since `started`, a 
+            `time.perf_counter()` reading. Caller must hold `q_lock`.
+        '''
+        self._telemetry.add_lock_wait(time.perf_counter() - started)
+        QUEUE_LOCK.end(started)
+
+    def close(self):
+        '''
+            Signal that one producer has pushed all of its messages.
+            Once all have, waiting consumers are woken and further
+            pushes are refused.
+        '''
+        with self.q_lock:
+            if self._producers == 0:
+                return
+            self._producers -= 1
+            if self._producers == 0:
+                self._not_empty.notify_all()
+                self._check_complete()
+
+    def ack(self, count: int = 1):
+        '''
+            Acknowledge that `count` pulled messages have been fully 
+            processed
+        '''
+        with self.q_lock:
+            self._acknowledged += count
+            self._check_complete()
+
+    def _check_complete(self):
+        '''
+            Set the completion event if the queue is closed and every
+            pushed message is acknowledged. Caller must hold `q_lock`.
+        '''
+        if self._producers == 0 and self._acknowledged >= self._pushed:
+            self._complete.set()
+
+    def wait_until_complete(self, timeout: Optional[float] = None) -> bool:
+        '''
+            Block until the queue is complete, for up to `timeout` 
+            seconds (indefinitely if `None`). Returns whether it is.
+        '''
+        return self._complete.wait(timeout)
+
+    def _free_space(self) -> int | float:
+        '''
+            Return number of messages that can be pushed before
+            the queue is full. Caller must hold `q_lock`.
+        '''
+        if self.max_size is None:
+            return float("inf")
+        return self.max_size - self._length
+
+    def _check_open(self):
+        '''
+            Refuse pushes once the queue is closed. Caller must hold 
+            `q_lock`.
+        '''
+        if self._producers == 0:
+            raise ValueError("Message queue is closed!")
+
+    def _has_messages_or_closed(self) -> bool:
+        return self._length > 0 or self._producers == 0
+
+    def _wait_for_space(self, deadline: Optional[float]):
+        '''
+            Block until there is room in the queue, raising TimeoutError
+            if `deadline` passes first. Caller must hold `q_lock`.
+        '''
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if not self._not_full.wait_for(lambda: self._free_space() > 0, remaining):
+            raise TimeoutError("Message queue is full!")
+
+    def _added(self, count: int, priority: int):
+        '''
+            Account for `count` messages pushed to the `priority` lane,
+            stamped with the time they were queued, update high water
+            mark and wake consumers. Caller must hold `q_lock`.
+        '''
+        self._stamps[priority].append([time.perf_counter(), count])
+        self._lane_lengths[priority] += count
+        self._length += count
+        self._pushed += count
+        if self._length > self.high_water_mark:
+            self.high_water_mark = self._length
+        self._not_empty.notify(count)
+
+    def _removed(self, count: int, priority: int):
+        '''
+            Account for `count` messages pulled from the `priority` lane,
+            counting how long each waited, and wake blocked producers.
+            Caller must hold `q_lock`.
+        '''
+        now = time.perf_counter()
+        for stamp, taken in take_stamps(self._stamps[priority], count):
+            self._telemetry.add_wait(now - stamp, taken, priority)
+
+        self._lane_lengths[priority] -= count
+        self._length -= count
+        if self.max_size is not None:
+            self._not_full.notify(count)
+
+    def _take(self, max_n: int) -> list[Message | MessageBatch]:
+        '''
+            Remove up to `max_n` messages from the front of the lane
+            the scheduler picks. Caller must hold `q_lock`.
+        '''
+        lane = self._scheduler.choose(self._lane_lengths)
+        if lane is None:
+            return []
+        entries = take_entries(self._lanes[lane], max_n)
+        self._removed(count_messages(entries), lane)
+        return entries
     
-    def push(self, msg: Message):
+    def push(self, msg: Message, timeout: Optional[float] = None):
         '''
-            Add a message to the queue
+            Add a message to the queue and wake one 
+            waiting consumer
+
+            If the queue is full, wait up to `timeout` seconds
+            (indefinitely if `None`) for room, then raise TimeoutError.
         '''
 
         if type(msg) != Message or msg == None:
             raise ValueError("Message pushed to queue is not of type `Message`")
+        check_priority(msg.priority)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
         
-        with self.q_lock:
-            self._queue.append(msg)
+        started = time.perf_counter()
+        with self._not_empty:
+            self._lock_acquired(started)
+            self._check_open()
+            self._wait_for_space(deadline)
+            self._lanes[msg.priority].append(msg)
+            self._added(1, msg.priority)
+        QUEUE_PUSH.end(started)
 
-    def pull(self) -> Message | None:
+    def push_many(self, msgs: Iterable[Message], timeout: Optional[float] = None):
+        '''
+            Add several messages to the queue under a single
+            lock acquisition, preserving their order within each
+            priority
+
+            On a bounded queue, messages are added as room frees up.
+            If `timeout` seconds pass before all of them fit, 
+            TimeoutError is raised and only the earlier messages 
+            will have been pushed.
+        '''
+        msgs = list(msgs)
+
+        for msg in msgs:
+            if type(msg) != Message or msg == None:
+                raise ValueError("Message pushed to queue is not of type `Message`")
+        priorities = {msg.priority for msg in msgs}
+        for priority in priorities:
+            check_priority(priority)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        started = time.perf_counter()
+        with self._not_empty:
+            self._lock_acquired(started)
+            self._check_open()
+            pushed = 0
+            while pushed < len(msgs):
+                self._wait_for_space(deadline)
+                count = min(self._free_space(), len(msgs) - pushed)
+                if len(priorities) == 1:
+                    priority = msgs[0].priority
+                    self._lanes[priority].extend(msgs[pushed:pushed + count])
+                    self._added(count, priority)
+                else:
+                    self._add_mixed(msgs[pushed:pushed + count])
+                pushed += count
+        QUEUE_PUSH.end(started)
+
+    def _add_mixed(self, msgs: list[Message]):
+        '''
+            Add messages of several priorities, each to its own lane.
+            Caller must hold `q_lock`.
+        '''
+        counts = [0] * len(PRIORITIES)
+        for msg in msgs:
+            self._lanes[msg.priority].append(msg)
+            counts[msg.priority] += 1
+        for priority, count in enumerate(counts):
+            if count:
+                self._added(count, priority)
+
+    def push_batch(self, batch: MessageBatch, timeout: Optional[float] = None):
+        '''
+            Add a MessageBatch to the queue as a single entry, 
+            without creating a Message per item
+
+            Bounded queues and `timeout` behave as in `push_many`.
+        '''
+        if type(batch) != MessageBatch:
+            raise ValueError("Batch pushed to queue is not of type `MessageBatch`")
+        check_priority(batch.priority)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        started = time.perf_counter()
+        with self._not_empty:
+            self._lock_acquired(started)
+            self._check_open()
+            pushed = 0
+            while pushed < len(batch):
+                self._wait_for_space(deadline)
+                count = min(self._free_space(), len(batch) - pushed)
+                self._lanes[batch.priority].append(batch.slice(pushed, pushed + count))
+                self._added(count, batch.priority)
+                pushed += count
+        QUEUE_PUSH.end(started)
+
+    def pull(self, timeout: Optional[float] = 0) -> Message | None:
         '''
             If available, retrieve a message from queue.
+
+            By default this does not wait. A positive `timeout` waits
+            up to that many seconds for a message to be pushed, and 
+            `None` waits indefinitely. Waiting ends early once the
+            queue is closed.
         '''
-        with self.q_lock:
+        msg = None
+        started = time.perf_counter()
+        with self._not_empty:
+            self._lock_acquired(started)
+            if timeout != 0:
+                self._not_empty.wait_for(self._has_messages_or_closed, timeout)
             if self.length() > 0:
-                return self._queue.pop(0)
-        return None
+                lane = self._scheduler.choose(self._lane_lengths)
+                entries = self._lanes[lane]
+                if type(entries[0]) == Message:
+                    msg = entries.popleft()
+                else:
+                    msg = take_entries(entries, 1)[0][0]
+                self._removed(1, lane)
+        QUEUE_PULL.end(started)
+        return msg
+
+    def pull_many(self, max_n: int, timeout: Optional[float] = 0) -> list[Message]:
+        '''
+            Retrieve up to `max_n` messages of one priority from queue
+            under a single lock acquisition, oldest first.
+
+            `timeout` behaves as in `pull`; an empty list is returned
+            if no message became available.
+        '''
+        started = time.perf_counter()
+        with self._not_empty:
+            self._lock_acquired(started)
+            if timeout != 0:
+                self._not_empty.wait_for(self._has_messages_or_closed, timeout)
+            entries = self._take(max_n)
+        QUEUE_PULL.end(started)
+
+        return entries_to_messages(entries)
+
+    def pull_batch(self, max_n: int, timeout: Optional[float] = 0) -> MessageBatch | None:
+        '''
+            Retrieve up to `max_n` messages of one priority from queue
+            as a single MessageBatch, oldest first.
+
+            Batches pushed with `push_batch` are handed over without 
+            copying; single Messages are packed into a batch. 
+            `timeout` behaves as in `pull`.
+        '''
+        started = time.perf_counter()
+        with self._not_empty:
+            self._lock_acquired(started)
+            if timeout != 0:
+                self._not_empty.wait_for(self._has_messages_or_closed, timeout)
+            entries = self._take(max_n)
+        QUEUE_PULL.end(started)
+
+        return entries_to_batch(entries)
@@ -0,0 +1,374 @@
+import multiprocessing
+import queue
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+from instrumentation.stages import QUEUE_LOCK, QUEUE_PULL, QUEUE_PUSH
+from msg_queue.msg_queue import (
+    PRIORITIES,
+    LaneScheduler,
+    Message,
+    MessageBatch,
+    QueueTelemetry,
+    check_priority,
+    count_messages,
+    entries_to_batch,
+    entries_to_messages,
+    take_entries,
+    take_stamps
+)
+
+class ProcessMessageQueue:
+    '''
+        MessageQueue that can be shared between processes.
+
+        Provides the same push/pull/length interface as MessageQueue,
+        backed by a `multiprocessing.Queue` per priority lane. Pushed
+        messages travel between processes in chunks of at most 
+        `chunk_size` messages, which should match how many a consumer
+        pulls at once. If a consumer takes less than a whole chunk, 
+        the rest goes back onto its lane for any process to pull, so
+        nothing is held by a single consumer. Those leftovers rejoin
+        at the back of the lane, so ordering across chunks is not 
+        strict.
+
+        The message count, and the count in each lane not yet claimed
+        by a pull, are kept in shared memory. A pull first claims 
+        messages from the lane its LaneScheduler picks, waiting on a
+        condition until some are pushed, then fetches them. Each 
+        process has its own scheduler, so `lane_weights` are shared 
+        out per process. Closing, acknowledgements and completion 
+        work as in MessageQueue, with the counts in shared memory too.
+
+        Entries travel with the wall clock time they were first
+        queued, so `telemetry` counts how long pulled messages 
+        waited whichever processes pushed and pulled them.
+    '''
+
+    def __init__(
+            self, 
+            max_size: Optional[int] = None, 
+            chunk_size: Optional[int] = 1, 
+            producers: Optional[int] = 1,
+            lane_weights: Optional[list[float]] = None
+    ):
+        '''
+            Create the shared lanes and counters, the condition 
+            producers wait on when the queue is bounded by `max_size`
+            and the one consumers wait on for messages
+        '''
+        if max_size is not None and max_size < 1:
+            raise ValueError("Max queue size must be positive!")
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive!")
+        if producers < 1:
+            raise ValueError("Number of producers must be positive!")
+
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.q_lock = multiprocessing.Lock()
+        self._not_full = multiprocessing.Condition(self.q_lock)
+        self._not_empty = multiprocessing.Condition(self.q_lock)
+        self._lanes = [multiprocessing.Queue() for _ in PRIORITIES]
+        self._unclaimed = multiprocessing.Array("q", len(PRIORITIES), lock=False) # messages per lane no pull has claimed
+        self._scheduler = LaneScheduler(lane_weights)
+        self._length = multiprocessing.Value("q", 0, lock=False)
+        self._high_water_mark = multiprocessing.Value("q", 0, lock=False)
+        self._producers = multiprocessing.Value("q", producers, lock=False)
+        self._pushed = multiprocessing.Value("q", 0, lock=False)
+        self._acknowledged = multiprocessing.Value("q", 0, lock=False)
+        self._complete = multiprocessing.Event()
+        self._telemetry = QueueTelemetry(multiprocessing.Array("d", QueueTelemetry.SIZE, lock=False))
+
+    @property
+    def high_water_mark(self) -> int:
+        '''
+            Largest length the queue has reached
+        '''
+        return self._high_water_mark.value
+
+    def length(self) -> int:
+        '''
+            Return current length of queue
+        '''
+        return self._length.value
+
+    @property
+    def closed(self) -> bool:
+        '''
+            Whether every producer has finished pushing
+        '''
+        return self._producers.value == 0
+
+    @property
+    def drained(self) -> bool:
+        '''
+            Whether the queue is closed and every message has been 
+            pulled, so consumers can stop
+        '''
+        return self.closed and self._length.value == 0
+
+    @property
+    def acknowledged(self) -> int:
+        '''
+            Number of messages consumers have acknowledged
+        '''
+        return self._acknowledged.value
+
+    def close(self):
+        '''
+            Signal that one producer has pushed all of its messages.
+            Once all have, waiting consumers are woken and further 
+            pushes are refused.
+        '''
+        with self.q_lock:
+            if self._producers.value == 0:
+                return
+            self._producers.value -= 1
+            if self._producers.value == 0:
+                self._not_empty.notify_all()
+            self._check_complete()
+
+    def ack(self, count: int = 1):
+        '''
+            Acknowledge that `count` pulled messages have been fully 
+            processed
+        '''
+        with self.q_lock:
+            self._acknowledged.value += count
+            self._check_complete()
+
+    def _check_complete(self):
+        '''
+            Set the completion event if the queue is closed and every
+            pushed message is acknowledged. Caller must hold `q_lock`.
+        '''
+        if self._producers.value == 0 and self._acknowledged.value >= self._pushed.value:
+            self._complete.set()
+
+    def wait_until_complete(self, timeout: Optional[float] = None) -> bool:
+        '''
+            Block until the queue is complete, for up to `timeout` 
+            seconds (indefinitely if `None`). Returns whether it is.
+        '''
+        return self._complete.wait(timeout)
+
+    def _free_space(self) -> int | float:
+        '''
+            Return number of messages that can be pushed before
+            the queue is full. Caller must hold `q_lock`.
+        '''
+        if self.max_size is None:
+            return float("inf")
+        return self.max_size - self._length.value
+
+    def telemetry(self) -> dict:
+        '''
+            Current and peak depth, how long pulled messages waited
+            in the queue and how long callers waited for its lock
+        '''
+        with self.q_lock:
+            return self._telemetry.snapshot(self._length.value, self._high_water_mark.value, list(self._unclaimed))
+
+    def _lock_acquired(self, started: float):
+        '''
+            Count the wait for `q_lock` since `started`, a 
+            `time.perf_counter()` reading. Caller must hold `q_lock`.
+        '''
+        self._telemetry.add_lock_wait(time.perf_counter() - started)
+        QUEUE_LOCK.end(started)
+
+    def _has_messages_or_closed(self) -> bool:
+        return any(self._unclaimed) or self._producers.value == 0
+
+    def _reserve(self, count: int, deadline: Optional[float], priority: int) -> int:
+        '''
+            Wait for room in the queue, then count up to `count`
+            messages as pushed to the `priority` lane and wake 
+            consumers. Returns how many were reserved.
+        '''
+        started = time.perf_counter()
+        with self._not_full:
+            self._lock_acquired(started)
+            if self._producers.value == 0:
+                raise ValueError("Message queue is closed!")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not self._not_full.wait_for(lambda: self._free_space() > 0, remaining):
+                raise TimeoutError("Message queue is full!")
+
+            count = min(self._free_space(), count)
+            self._length.value += count
+            self._pushed.value += count
+            self._unclaimed[priority] += count
+            if self._length.value > self._high_water_mark.value:
+                self._high_water_mark.value = self._length.value
+            self._not_empty.notify(count)
+            return count
+
+    def _claim(self, max_n: int, timeout: Optional[float]) -> tuple[int, int]:
+        '''
+            Wait up to `timeout` for messages, then claim up to 
+            `max_n` from the lane the scheduler picks. Returns the
+            lane and how many were claimed.
+        '''
+        started = time.perf_counter()
+        with self._not_empty:
+            self._lock_acquired(started)
+            if timeout != 0:
+                self._not_empty.wait_for(self._has_messages_or_closed, timeout)
+            lane = self._scheduler.choose(self._unclaimed)
+            if lane is None:
+                return 0, 0
+            count = min(max_n, self._unclaimed[lane])
+            self._unclaimed[lane] -= count
+            return lane, count
+
+    def _release(self, count: int, waits: list[tuple[float, int]], priority: int):
+        '''
+            Count `count` messages of `priority` as pulled, with how 
+            long each group of them waited, and wake blocked producers
+        '''
+        started = time.perf_counter()
+        with self._not_full:
+            self._lock_acquired(started)
+            for wait, n in waits:
+                self._telemetry.add_wait(wait, n, priority)
+            self._length.value -= count
+            if self.max_size is not None:
+                self._not_full.notify_all()
+
+    def push(self, msg: Message, timeout: Optional[float] = None):
+        '''
+            Add a message to the queue
+
+            If the queue is full, wait up to `timeout` seconds
+            (indefinitely if `None`) for room, then raise TimeoutError.
+        '''
+        if type(msg) != Message or msg == None:
+            raise ValueError("Message pushed to queue is not of type `Message`")
+        check_priority(msg.priority)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = QUEUE_PUSH.begin()
+        self._reserve(1, deadline, msg.priority)
+        self._lanes[msg.priority].put((time.time(), msg))
+        QUEUE_PUSH.end(started)
+
+    def push_many(self, msgs: Iterable[Message], timeout: Optional[float] = None):
+        '''
+            Add several messages to the queue, preserving their order
+            within each priority
+
+            Messages are sent between processes in chunks of at most
+            `chunk_size`. Bounded queues and `timeout` behave as in
+            MessageQueue.
+        '''
+        msgs = list(msgs)
+
+        for msg in msgs:
+            if type(msg) != Message or msg == None:
+                raise ValueError("Message pushed to queue is not of type `Message`")
+        priorities = {msg.priority for msg in msgs}
+        for priority in priorities:
+            check_priority(priority)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        started = QUEUE_PUSH.begin()
+        for priority in sorted(priorities):
+            lane = msgs if len(priorities) == 1 else [msg for msg in msgs if msg.priority == priority]
+            pushed = 0
+            while pushed < len(lane):
+                count = self._reserve(min(self.chunk_size, len(lane) - pushed), deadline, priority)
+                self._lanes[priority].put((time.time(), lane[pushed:pushed + count]))
+                pushed += count
+        QUEUE_PUSH.end(started)
+
+    def push_batch(self, batch: MessageBatch, timeout: Optional[float] = None):
+        '''
+            Add a MessageBatch to the queue in slices of at most
+            `chunk_size` messages
+
+            Bounded queues and `timeout` behave as in MessageQueue.
+        '''
+        if type(batch) != MessageBatch:
+            raise ValueError("Batch pushed to queue is not of type `MessageBatch`")
+        check_priority(batch.priority)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        started = QUEUE_PUSH.begin()
+        pushed = 0
+        while pushed < len(batch):
+            count = self._reserve(min(self.chunk_size, len(batch) - pushed), deadline, batch.priority)
+            self._lanes[batch.priority].put((time.time(), batch.slice(pushed, pushed + count)))
+            pushed += count
+        QUEUE_PUSH.end(started)
+
+    def _take(self, max_n: int, timeout: Optional[float]) -> list[Message | MessageBatch]:
+        '''
+            Claim up to `max_n` messages, waiting up to `timeout` for
+            any to be pushed, then fetch entries from the claimed lane
+            until they hold that many. Claimed messages are always on
+            their way, pushed or put back by another pull, so fetching
+            blocks until they arrive. Anything fetched beyond the 
+            claim is put back on the lane.
+        '''
+        started = QUEUE_PULL.begin()
+        lane, claimed = self._claim(max_n, timeout)
+        if claimed == 0:
+            QUEUE_PULL.end(started)
+            return []
+
+        fetched = deque()
+        stamps = deque() # [time queued, messages left] per entry fetched
+        fetched_count = 0
+        while fetched_count < claimed:
+            stamp, entry = self._lanes[lane].get()
+            entry = entry if type(entry) == list else [entry]
+            fetched.extend(entry)
+            stamps.append([stamp, count_messages(entry)])
+            fetched_count += stamps[-1][1]
+
+        entries = take_entries(fetched, claimed)
+        now = time.time()
+        waits = [(now - stamp, n) for stamp, n in take_stamps(stamps, claimed)]
+
+        # Leftovers go back with the time they were first queued
+        for stamp, n in take_stamps(stamps, fetched_count - claimed):
+            self._lanes[lane].put((stamp, take_entries(fetched, n)))
+
+        self._release(claimed, waits, lane)
+        QUEUE_PULL.end(started)
+        return entries
+
+    def pull(self, timeout: Optional[float] = 0) -> Message | None:
+        '''
+            If available, retrieve a message from queue.
+
+            By default this does not wait. A positive `timeout` waits
+            up to that many seconds for a message to be pushed, and
+            `None` waits indefinitely. Waiting ends early once the
+            queue is closed.
+        '''
+        entries = self._take(1, timeout)
+        if not entries:
+            return None
+        return entries[0] if type(entries[0]) == Message else entries[0][0]
+
+    def pull_many(self, max_n: int, timeout: Optional[float] = 0) -> list[Message]:
+        '''
+            Retrieve up to `max_n` messages of one priority from queue.
+
+            `timeout` behaves as in `pull`; an empty list is returned
+            if no message became available.
+        '''
+        return entries_to_messages(self._take(max_n, timeout))
+
+    def pull_batch(self, max_n: int, timeout: Optional[float] = 0) -> MessageBatch | None:
+        '''
+            Retrieve up to `max_n` messages of one priority from queue
+            as a single MessageBatch. `timeout` behaves as in `pull`.
+        '''
+        return entries_to_batch(self._take(max_n, timeout))
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import random
+from typing import Optional
+
+import httpx
+
+from instrumentation.stages import REPORT, REPORT_HTTP, SEND
+from monitor.backend.store import StatisticsStore
+from msg_queue.msg_queue import Message, MessageQueue
+from sender.sender import LocalMonitorService, MonitorService, PULL_TIMEOUT, Sender
+
+class AsyncMonitorService(MonitorService):
+    '''
+        Interface between AsyncSenders and the Monitor backend API,
+        reporting through an `httpx.AsyncClient`.
+
+        The client is usually shared by every AsyncSender in the
+        event loop; one is created on first use otherwise.
+    '''
+
+    def __init__(
+            self,
+            url: str = None,
+            client: Optional[httpx.AsyncClient] = None,
+            sender_id: int = 0
+    ):
+        '''
+            Validates Monitor API URL if provided
+        '''
+        super().__init__(url, sender_id=sender_id)
+        self.client = client
+
+    async def report_message(self, message: Message, result: bool, delay: float):
+        '''
+            Updates Monitor API with recently processed message result
+            and delay
+        '''
+        if self.url:
+            if self.client is None:
+                self.client = httpx.AsyncClient()
+
+            started = REPORT_HTTP.begin()
+            res = await self.client.post(self.url + "/message", json={
+                "message": message.message,
+                "phone": message.phone,
+                "success": result,
+                "delay": delay,
+                "sender_id": self.sender_id
+            })
+            REPORT_HTTP.end(started)
+
+            if res.status_code != 200:
+                raise Exception(f"Error reporting to Monitor API: {json.loads(res.content)}")
+
+class AsyncLocalMonitorService(LocalMonitorService):
+    '''
+        LocalMonitorService for AsyncSenders, recording results
+        into a StatisticsStore in this process
+    '''
+
+    async def report_message(self, message: Message, result: bool, delay: float):
+        self.store.record_one(result, delay, self.sender_id)
+
+class AsyncSender(Sender):
+    '''
+        Sender that keeps up to `concurrency` messages in flight
+        at once on an asyncio event loop.
+
+        Delay and failure semantics match Sender, but the simulated
+        send waits with `asyncio.sleep`, so one process can run a very
+        large number of concurrent sends. `send_message`,
+        `report_result` and `consume_messages` are coroutines.
+    '''
+
+    def __init__(
+        self,
+        queue: Optional[MessageQueue] = None,
+        mean_delay: Optional[float] = 1,
+        fail_rate: Optional[float] = 0.1,
+        monitor_url: Optional[str] = None,
+        concurrency: Optional[int] = 1,
+        client: Optional[httpx.AsyncClient] = None,
+        sender_id: Optional[int] = 0,
+        stats_store: Optional[StatisticsStore] = None
+    ):
+        '''
+            Validates configuration as Sender does, plus the
+            concurrency limit, then sets up AsyncMonitorService
+            for reporting, or records results in `stats_store` 
+            if given.
+        '''
+        if concurrency < 1:
+            raise ValueError("Concurrency must be >= 1!")
+
+        super().__init__(queue, mean_delay, fail_rate)
+        self.concurrency = concurrency
+        if stats_store is not None:
+            self.monitor = AsyncLocalMonitorService(stats_store, sender_id)
+        else:
+            self.monitor = AsyncMonitorService(monitor_url, client, sender_id)
+
+    async def send_message(
+        self,
+        msg: Message
+    ) -> tuple[bool, float]:
+        '''
+            Wait for a random number of seconds in range without
+            blocking the event loop, then determine if message is
+            sent or failed.
+        '''
+        self._validate_message(msg)
+
+        delay = random.uniform(0, 2 * self.mean_delay)
+        started = SEND.begin()
+        await asyncio.sleep(delay)
+        SEND.end(started)
+        result = not (random.random() <= self.fail_rate)
+
+        return result, delay
+
+    async def report_result(self, message: Message, result: bool, delay: float):
+        '''
+            Report message result to Monitor
+        '''
+        started = REPORT.begin()
+        await self.monitor.report_message(message, result, delay)
+        REPORT.end(started)
+
+    async def _process(self, message: Message):
+        '''
+            Send a single message, report its result and acknowledge
+            it to the queue
+        '''
+        result, delay = await self.send_message(message)
+        await self.report_result(message, result, delay)
+        self.queue.ack()
+
+    async def consume_messages(self):
+        '''
+            Until told to stop, or the MessageQueue is closed and
+            empty, pull messages from it and start sending them, 
+            keeping at most `concurrency` in flight. Messages already
+            in flight are finished before returning.
+
+            The queue is only polled without blocking, so the event
+            loop stays free while it is empty.
+        '''
+        in_flight = set()
+
+        while not self.finish_consuming:
+            free = self.concurrency - len(in_flight)
+            if free == 0:
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            messages = self.pull_messages(free)
+            if not messages:
+                if self.queue and self.queue.drained:
+                    break
+                await asyncio.sleep(PULL_TIMEOUT)
+                continue
+
+            for message in messages:
+                task = asyncio.create_task(self._process(message))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+async def run_async_senders(senders: list[AsyncSender], max_connections: Optional[int] = None):
+    '''
+        Run every AsyncSender on the current event loop, reporting
+        through one shared `httpx.AsyncClient`
+    '''
+    limits = httpx.Limits(max_connections=max_connections)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        for sender in senders:
+            sender.monitor.client = client
+        await asyncio.gather(*(sender.consume_messages() for sender in senders))
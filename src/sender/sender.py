@@ -1,35 +1,118 @@
+import os
 import random
+import threading
 import time
 import httpx
 import json
-from typing import Optional
+from typing import Callable, Optional
 
-from msg_queue.msg_queue import Message, MessageQueue
+import numpy as np
+
+from instrumentation.stages import REPORT, REPORT_HTTP, SEND, VALIDATE
+from monitor.backend.models import pack_result
+from monitor.backend.store import StatisticsStore
+from msg_queue.msg_queue import Message, MessageBatch, MessageQueue
+
+# Longest a Sender waits on an empty queue before
+# re-checking whether it has been told to stop
+PULL_TIMEOUT = 0.1
+
+# Default number of pooled connections to the Monitor API
+DEFAULT_POOL_SIZE = 10
+# Default longest wait, in seconds, before buffered reports are posted
+DEFAULT_FLUSH_INTERVAL = 0.25
+# Available encodings for reports to the Monitor API
+REPORT_FORMATS = ["json", "compact"]
+
+_clients = {}
+_clients_lock = threading.Lock()
 
 def _check_range(val, min, max) -> bool:
     return val >= min and val <= max
 
+def shared_client(pool_size: int = DEFAULT_POOL_SIZE) -> httpx.Client:
+    '''
+        Return the keep-alive `httpx.Client` shared by every 
+        MonitorService in this process with the same pool size.
+
+        Clients are kept per process, since pooled connections 
+        can't be used from both sides of a fork.
+    '''
+    key = (os.getpid(), pool_size)
+
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = httpx.Client(limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            ))
+        return _clients[key]
+
 class MonitorService():
     '''
         Serves as the interface between Senders and the 
         Monitor backend API.
+
+        With a `buffer_size` above 1, results are buffered and 
+        posted to the batch endpoint by a background flusher thread,
+        once `buffer_size` results are waiting or every 
+        `flush_interval` seconds, so reporting never waits on the 
+        network. `close` flushes anything still buffered.
+
+        Reports are JSON by default. The `compact` report format 
+        instead sends fixed-size binary records carrying only the 
+        success flag, delay, `sender_id` and a timestamp.
     '''
 
     def __init__(
             self,
-            url: str = None
+            url: str = None,
+            pool_size: int = DEFAULT_POOL_SIZE,
+            client: Optional[httpx.Client] = None,
+            buffer_size: int = 1,
+            flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+            report_format: str = "json",
+            sender_id: int = 0
     ):
         '''
             Validates Monitor API URL if provided
+
+            Reports go over a persistent `client`; by default the 
+            client shared by every MonitorService in this process,
+            keeping up to `pool_size` connections alive.
         '''
+        if pool_size < 1:
+            raise ValueError("Pool size must be >= 1!")
+        if buffer_size < 1:
+            raise ValueError("Buffer size must be >= 1!")
+        if flush_interval <= 0:
+            raise ValueError("Flush interval must be > 0!")
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"Report format must be one of {REPORT_FORMATS}!")
+
+        self.client = client
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.report_format = report_format
+        self.sender_id = sender_id
+        self._buffer = []
+        self._buffer_ready = threading.Condition()
+        self._closing = False
+        self._flush_error = None
+        self._flusher = None
+
         if url:
+            if self.client is None:
+                self.client = shared_client(pool_size)
+
             attempts = 3
             while attempts > 0:
                 attempts -= 1
                 try:
-                    chk = httpx.get(url)
+                    chk = self.client.get(url)
                     if chk.status_code == 200:
                         self.url = url
+                        self._start_flusher()
                         return
                 except Exception as e:
                     time.sleep(1)
@@ -37,21 +120,151 @@ class MonitorService():
         else:
             self.url = None    
 
+    def _start_flusher(self):
+        '''
+            Start the background flusher thread if results are buffered
+        '''
+        if self.buffer_size > 1:
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+
+    def _post(self, path: str, **body):
+        '''
+            Post a report to the Monitor API
+        '''
+        started = REPORT_HTTP.begin()
+        res = self.client.post(self.url + path, **body)
+        REPORT_HTTP.end(started)
+
+        if res.status_code != 200:
+            raise Exception(f"Error reporting to Monitor API: {json.loads(res.content)}")
+
+    def _send(self, reports: list[dict | bytes], batched: bool):
+        '''
+            Post reports to the route matching the report format
+        '''
+        if self.report_format == "compact":
+            self._post("/messages/compact", content=b"".join(reports))
+        elif batched:
+            self._post("/messages/batch", json=reports)
+        else:
+            self._post("/message", json=reports[0])
+
+    def _encode(self, result: bool, delay: float, message: Optional[Message] = None) -> dict | bytes:
+        '''
+            Build the report for one result in the report format
+        '''
+        if self.report_format == "compact":
+            return pack_result(result, delay, self.sender_id, time.time())
+
+        if message is None:
+            return {"success": result, "delay": delay, "sender_id": self.sender_id}
+        return {
+            "message": message.message,
+            "phone": message.phone,
+            "success": result,
+            "delay": delay,
+            "sender_id": self.sender_id
+        }
+
+    def _report(self, report: dict | bytes):
+        '''
+            Post a report right away, or buffer it for the flusher
+        '''
+        if self._flusher is None:
+            self._send([report], batched=False)
+            return
+
+        with self._buffer_ready:
+            self._buffer.append(report)
+            if len(self._buffer) >= self.buffer_size:
+                self._buffer_ready.notify()
+
+    def _flush_periodically(self):
+        '''
+            Flusher thread: post buffered reports, at most 
+            `buffer_size` per request, once enough are waiting or 
+            `flush_interval` has passed, until closed
+        '''
+        while True:
+            with self._buffer_ready:
+                self._buffer_ready.wait_for(
+                    lambda: self._closing or len(self._buffer) >= self.buffer_size,
+                    self.flush_interval
+                )
+                reports, self._buffer = self._buffer, []
+                closing = self._closing
+
+            for i in range(0, len(reports), self.buffer_size):
+                try:
+                    self._send(reports[i:i + self.buffer_size], batched=True)
+                except Exception as e:
+                    self._flush_error = self._flush_error or e
+
+            if closing:
+                return
+
+    def close(self):
+        '''
+            Stop the flusher thread once everything buffered has been
+            posted. Later reports are posted right away.
+
+            Raises the first error the flusher hit, if any.
+        '''
+        if self._flusher is not None:
+            with self._buffer_ready:
+                self._closing = True
+                self._buffer_ready.notify()
+            self._flusher.join()
+            self._flusher = None
+
+        if self._flush_error is not None:
+            error, self._flush_error = self._flush_error, None
+            raise error
+
     def report_message(self, message: Message, result: bool, delay: float):
         '''
             Updates Monitor API with recently processed message result
             and delay
         '''
         if self.url:
-            res = httpx.post(self.url + "/message", json={
-                "message": message.message,
-                "phone": message.phone,
-                "success": result,
-                "delay": delay
-            })
+            self._report(self._encode(result, delay, message))
 
-            if res.status_code != 200:
-                raise Exception(f"Error reporting to Monitor API: {json.loads(res.content)}")
+    def report_outcome(self, result: bool, delay: float):
+        '''
+            Updates Monitor API with a processed message's result
+            and delay, without its body or phone number
+        '''
+        if self.url:
+            self._report(self._encode(result, delay))
+
+    def report_queue(self, telemetry: dict):
+        '''
+            Updates Monitor API with the message queue's depth, wait
+            times and lock contention so far
+        '''
+        if self.url:
+            self._post("/statistics/queue", json=telemetry)
+
+class LocalMonitorService():
+    '''
+        Stand-in for MonitorService in headless runs, recording 
+        results straight into a StatisticsStore in this process, as
+        the Monitor API's /message endpoint would.
+    '''
+
+    def __init__(self, store: StatisticsStore, sender_id: int = 0):
+        self.store = store
+        self.sender_id = sender_id
+
+    def report_message(self, message: Message, result: bool, delay: float):
+        self.store.record_one(result, delay, self.sender_id)
+
+    def report_outcome(self, result: bool, delay: float):
+        self.store.record_one(result, delay, self.sender_id)
+
+    def close(self):
+        pass
 
 class Sender():
     '''
@@ -66,22 +279,51 @@ class Sender():
         mean_delay: Optional[float] = 1,
         fail_rate: Optional[float] = 0.1,
         monitor_url: Optional[str] = None,
+        batch_size: Optional[int] = 1,
+        compact: Optional[bool] = False,
+        monitor_pool_size: Optional[int] = DEFAULT_POOL_SIZE,
+        report_buffer_size: Optional[int] = 1,
+        report_flush_interval: Optional[float] = DEFAULT_FLUSH_INTERVAL,
+        report_format: Optional[str] = "json",
+        sender_id: Optional[int] = 0,
+        stats_store: Optional[StatisticsStore] = None
     ):
         '''
-            Validates configuration for delay and failure rate,
-            then sets up MonitorService for reporting.
+            Validates configuration for delay, failure rate and 
+            batch size, then sets up MonitorService for reporting.
+
+            In `compact` mode Messages are pulled and sent as 
+            MessageBatches. With a `report_buffer_size` above 1, 
+            results are reported to Monitor in batches, in the
+            given `report_format`, identified by `sender_id`.
+
+            Given a `stats_store`, results are recorded there instead
+            and the Monitor API is never contacted.
         '''
-        self._validate_config(mean_delay, fail_rate)
+        self._validate_config(mean_delay, fail_rate, batch_size)
         self.mean_delay = mean_delay
         self.fail_rate = fail_rate
+        self.batch_size = batch_size
+        self.compact = compact
         self.finish_consuming = False # used to tell Sender to stop checking Queue
         self.queue = queue
 
-        self.monitor = MonitorService(monitor_url)
+        if stats_store is not None:
+            self.monitor = LocalMonitorService(stats_store, sender_id)
+            return
 
-    def _validate_config(self, mean_delay: float, fail_rate: float):
+        self.monitor = MonitorService(
+            monitor_url, 
+            pool_size=monitor_pool_size,
+            buffer_size=report_buffer_size,
+            flush_interval=report_flush_interval,
+            report_format=report_format,
+            sender_id=sender_id
+        )
+
+    def _validate_config(self, mean_delay: float, fail_rate: float, batch_size: int = 1):
         '''
-            Validate delay and fail rate values are in appropriate ranges.
+            Validate delay, fail rate and batch size values are in appropriate ranges.
         '''
 
         if mean_delay < 0:
@@ -89,17 +331,36 @@ class Sender():
         
         if not _check_range(fail_rate, 0, 1):
             raise ValueError("Fail Rate must be in range [0,1]")
+
+        if batch_size < 1:
+            raise ValueError("Batch size must be >= 1!")
         
     def _validate_message(self, msg: Message):
         '''
             Validate message is valid and sendable.
         '''
 
+        started = VALIDATE.begin()
         if not _check_range(len(msg.message), 1, 100):
             raise ValueError("Message length must be in range [0,100])!")
         
         if not len(msg.phone) == 10:
             raise ValueError("Phone number must contain 10 digits!")
+        VALIDATE.end(started)
+
+    def _validate_batch(self, batch: MessageBatch):
+        '''
+            Validate every message in a batch is valid and sendable.
+        '''
+
+        started = VALIDATE.begin()
+        lengths = batch.lengths()
+        if not ((lengths >= 1) & (lengths <= 100)).all():
+            raise ValueError("Message length must be in range [0,100])!")
+
+        if (batch.phones >= 10 ** 10).any():
+            raise ValueError("Phone number must contain 10 digits!")
+        VALIDATE.end(started)
 
     def send_message(
         self,
@@ -112,40 +373,132 @@ class Sender():
         self._validate_message(msg)
         
         delay = random.uniform(0, 2 * self.mean_delay)
+        started = SEND.begin()
         time.sleep(delay)
+        SEND.end(started)
         result = not (random.random() <= self.fail_rate)
 
         return result, delay
     
-    def pull_message(self) -> Message | None:
+    def send_batch(
+        self,
+        batch: MessageBatch,
+        on_result: Optional[Callable[[bool, float], None]] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        '''
+            Draw a delay and result for every message in the batch
+            at once, then wait out each message's delay in turn, 
+            calling `on_result` as each message finishes.
+        '''
+        self._validate_batch(batch)
+
+        delays = np.random.uniform(0, 2 * self.mean_delay, size=len(batch))
+        results = np.random.random(size=len(batch)) > self.fail_rate
+
+        for result, delay in zip(results.tolist(), delays.tolist()):
+            started = SEND.begin()
+            time.sleep(delay)
+            SEND.end(started)
+            if on_result:
+                on_result(result, delay)
+
+        return results, delays
+
+    def pull_message(self, timeout: Optional[float] = 0) -> Message | None:
         '''
             Retrieve Message from MessageQueue if one 
-            is available
+            is available, waiting up to `timeout` seconds
         '''
         if self.queue:
-            return self.queue.pull()
+            return self.queue.pull(timeout=timeout)
         else:
             print("No Message Queue Available!")
     
+    def pull_messages(self, max_n: int, timeout: Optional[float] = 0) -> list[Message]:
+        '''
+            Retrieve up to `max_n` Messages from MessageQueue,
+            waiting up to `timeout` seconds for the first
+        '''
+        if self.queue:
+            return self.queue.pull_many(max_n, timeout=timeout)
+        else:
+            print("No Message Queue Available!")
+            return []
+
+    def pull_batch(self, max_n: int, timeout: Optional[float] = 0) -> MessageBatch | None:
+        '''
+            Retrieve up to `max_n` Messages from MessageQueue as one
+            MessageBatch, waiting up to `timeout` seconds for the first
+        '''
+        if self.queue:
+            return self.queue.pull_batch(max_n, timeout=timeout)
+        else:
+            print("No Message Queue Available!")
+
+    def _next_messages(self) -> list[Message]:
+        '''
+            Retrieve the next `batch_size` Messages to send. 
+            Single messages go through `pull_message`.
+        '''
+        if self.batch_size > 1:
+            return self.pull_messages(self.batch_size, timeout=PULL_TIMEOUT)
+
+        message = self.pull_message(timeout=PULL_TIMEOUT)
+        return [message] if message else []
+
     def report_result(self, message: Message, result: bool, delay: float):
         '''
             Report message result to Monitor
         '''
+        started = REPORT.begin()
         self.monitor.report_message(message, result, delay)
+        REPORT.end(started)
+
+    def report_outcome(self, result: bool, delay: float):
+        '''
+            Report a result from a MessageBatch to Monitor
+        '''
+        started = REPORT.begin()
+        self.monitor.report_outcome(result, delay)
+        REPORT.end(started)
 
     def consume_messages(self):
         '''
-            Until told to stop, pull and send 
-            messages from MessageQueue.
+            Until told to stop, or the MessageQueue is closed and 
+            empty, pull and send messages from it.
 
-            Report results to Monitor API as they happen.
+            Report results to Monitor API as they happen, 
+            acknowledging messages to the queue once reported, and 
+            flush any results still buffered once stopped.
         '''
 
         while not self.finish_consuming:
-            message = self.pull_message()
-
-            if message:
-                result, delay = self.send_message(message)
-                self.report_result(message, result, delay)
+            if self.compact:
+                count = self._consume_batch()
             else:
-                time.sleep(self.mean_delay)
\ No newline at end of file
+                messages = self._next_messages()
+                for message in messages:
+                    result, delay = self.send_message(message)
+                    self.report_result(message, result, delay)
+                count = len(messages)
+
+            if count and self.queue:
+                self.queue.ack(count)
+            elif not count and not self.queue:
+                time.sleep(PULL_TIMEOUT)
+            elif not count and self.queue.drained:
+                break
+
+        self.monitor.close()
+
+    def _consume_batch(self) -> int:
+        '''
+            Pull, send and report one MessageBatch, returning how
+            many messages it held
+        '''
+        batch = self.pull_batch(self.batch_size, timeout=PULL_TIMEOUT)
+
+        if batch:
+            self.send_batch(batch, on_result=self.report_outcome)
+            return len(batch)
+        return 0
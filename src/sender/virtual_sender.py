@@ -0,0 +1,131 @@
+import heapq
+import time
+from itertools import islice
+from typing import Iterator, Optional
+
+import numpy as np
+
+from generator.generator import VECTOR_BLOCK_SIZE, Generator
+from monitor.backend.models import SimulationReport
+from monitor.backend.store import MemoryStore, simulation_report
+from sender.sender import Sender
+
+# Number of outcomes a VirtualSender draws from its random stream at once
+DRAW_BLOCK_SIZE = 4096
+# Number of results gathered before they are added to the statistics
+RECORD_CHUNK_SIZE = 100_000
+
+class VirtualSender(Sender):
+    '''
+        Sender for virtual time simulations.
+
+        Validates configuration and messages as Sender does, but
+        never sleeps: the delay and result for each message are
+        drawn from the sender's own seeded random stream, with the
+        same distributions as Sender, and the simulation clock is
+        advanced instead.
+    '''
+
+    def __init__(
+        self,
+        mean_delay: Optional[float] = 1,
+        fail_rate: Optional[float] = 0.1,
+        batch_size: Optional[int] = 1,
+        sender_id: Optional[int] = 0,
+        seed: Optional[np.random.SeedSequence | int] = None
+    ):
+        super().__init__(None, mean_delay, fail_rate, batch_size=batch_size, sender_id=sender_id)
+        self.sender_id = sender_id
+        self.free_at = 0.0 # virtual time the Sender finishes its current messages
+        self._rng = np.random.default_rng(seed)
+
+    def outcomes(self) -> Iterator[tuple[bool, float]]:
+        '''
+            Endless result and delay of each message sent in turn, 
+            drawn `DRAW_BLOCK_SIZE` at a time
+        '''
+        while True:
+            delays = self._rng.uniform(0, 2 * self.mean_delay, size=DRAW_BLOCK_SIZE)
+            results = self._rng.random(size=DRAW_BLOCK_SIZE) > self.fail_rate
+            yield from zip(results.tolist(), delays.tolist())
+
+def run_virtual_simulation(
+        generator: Generator,
+        senders: list[VirtualSender],
+        store: Optional[MemoryStore] = None
+) -> SimulationReport:
+    '''
+        Simulate `senders` working through every message from
+        `generator` on a virtual clock starting at 0.
+
+        Whenever a Sender is free, its next `batch_size` messages go
+        to whichever Sender became free first (ties to the first
+        listed), as they would from a shared queue that is never 
+        empty, and it is busy until it has sent each in turn. Free times
+        are kept in a heap, so the run costs one heap operation per
+        batch however long the delays are.
+
+        Results are recorded with their simulated completion times
+        in `store`, a new MemoryStore by default, so history bucket
+        times count simulated seconds from the start.
+    '''
+    if not senders:
+        raise ValueError("Virtual simulation needs at least one Sender!")
+
+    store = store or MemoryStore()
+    start = time.perf_counter()
+    total = generator.num_messages
+
+    free = [(0.0, i) for i in range(len(senders))]
+    outcomes = [sender.outcomes() for sender in senders]
+
+    # Results are gathered in lists, which are cheap to append to one
+    # at a time, and added to the statistics in chunks
+    success, delay, sender_id, finished = [], [], [], []
+
+    def record():
+        store.record(
+            np.array(success, dtype=bool), 
+            np.array(delay, dtype=np.float64), 
+            np.array(sender_id, dtype=np.int64), 
+            np.array(finished, dtype=np.float64)
+        )
+        for results in (success, delay, sender_id, finished):
+            results.clear()
+
+    assigned = 0
+    validated = 0
+    duration = 0.0
+
+    while assigned < total:
+        now, i = heapq.heappop(free)
+        sender = senders[i]
+        count = min(sender.batch_size, total - assigned)
+
+        # Messages only need to exist to be validated as a real
+        # Sender would, so they are generated a block at a time
+        while validated < assigned + count:
+            block = generator.generate_batch(min(max(VECTOR_BLOCK_SIZE, count), total - validated))
+            sender._validate_batch(block)
+            validated += len(block)
+
+        for result, d in islice(outcomes[i], count):
+            now += d
+            success.append(result)
+            delay.append(d)
+            finished.append(now)
+        sender_id.extend([sender.sender_id] * count)
+        assigned += count
+
+        sender.free_at = now
+        if now > duration:
+            duration = now
+        heapq.heappush(free, (now, i))
+
+        if len(delay) >= RECORD_CHUNK_SIZE:
+            record()
+
+    if delay:
+        record()
+
+    return simulation_report(store, 0, duration, time.perf_counter() - start)
@@ -1,4 +1,8 @@
+import asyncio
+import cProfile
+import shutil
 import threading
+import multiprocessing
 from multiprocessing import Process
 import subprocess
 import uvicorn
@@ -7,17 +11,42 @@ import os
 import time
 import json
 import signal
+import tempfile
+import numpy as np
 from dataclasses import dataclass, field, asdict
-from typing import Optional, List
+from typing import Callable, Optional, List
 
+from generator.corpus import Corpus, ReplayGenerator, write_corpus
 from generator.generator import Generator
-from sender.sender import Sender
-from msg_queue.msg_queue import MessageQueue
+from instrumentation import stages
+from sender.sender import PULL_TIMEOUT, REPORT_FORMATS, MonitorService, Sender
+from sender.async_sender import AsyncSender, run_async_senders
+from sender.virtual_sender import VirtualSender, run_virtual_simulation
+from msg_queue.durable_queue import DurableMessageQueue
+from msg_queue.msg_queue import PRIORITIES, MessageQueue
+from msg_queue.process_queue import ProcessMessageQueue
 from monitor.backend.main import app
+from monitor.backend.models import QueueTelemetryReport, SimulationReport
+from monitor.backend.store import (
+    STATS_STORES,
+    MemoryStore,
+    SharedMemoryStore,
+    StatisticsStore,
+    open_store,
+    simulation_report
+)
 
-OPTIONS = ["-h", "-c", "-m", "-s", "-S", "-u"]
+OPTIONS = ["-h", "-c", "-m", "-s", "-S", "-u", "-b", "-q", "-g", "-r", "-x", "-P", "-G", "-C", "-k", "-B", "-F", "-f", "-W", "-T", "-M", "-J", "-I", "-p", "-y", "-w", "-D", "-R"]
+GENERATION_MODES = ["python", "numpy", "compact"]
+EXECUTION_MODES = ["thread", "process", "async", "virtual"]
+MONITOR_MODES = ["web", "headless"]
+# How often `main` checks the Senders are still running while it 
+# waits for the simulation to complete
+LIVENESS_INTERVAL = 1
 monitor = None
 api = None
+stats_store = None
+metrics_dir = None
 
 # Signal handler for the end of the simulation
 # Cleanly kill processes rather than let the 
@@ -25,8 +54,12 @@ api = None
 def finish_handler(signum, frame):
     print("\nExiting...")
     monitor.kill()
-    api.kill()
+    api.terminate()
     api.join()
+    if stats_store:
+        stats_store.close()
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
 
 # --- Config Classes ---
 @dataclass
@@ -41,6 +74,28 @@ class SimulatorConfig:
     sender_settings: Optional[list[SenderSettings]] = field(default_factory=list)
     monitor_url: Optional[str] = "http://localhost:8000" # potentially configurable in the future!
     monitor_update_interval: Optional[int] = 1
+    batch_size: Optional[int] = 1
+    max_queue_size: Optional[int] = None # unbounded when not set
+    generation_mode: Optional[str] = "python"
+    seed: Optional[int] = None
+    execution_mode: Optional[str] = "thread"
+    num_processes: Optional[int] = None # one per CPU when not set
+    generator_shards: Optional[int] = 1
+    sender_concurrency: Optional[int] = 1
+    monitor_pool_size: Optional[int] = 10
+    report_buffer_size: Optional[int] = 100
+    report_flush_interval: Optional[float] = 0.25
+    report_format: Optional[str] = "compact"
+    monitor_workers: Optional[int] = 1
+    stats_store: Optional[str] = None # in memory for one worker, shared memory otherwise
+    monitor_mode: Optional[str] = "web"
+    summary_path: Optional[str] = None # summary is only printed when not set
+    instrument: Optional[bool] = False
+    profile_path: Optional[str] = None # not profiled when not set
+    priority_mix: Optional[list[float]] = None # every message normal priority when not set
+    lane_weights: Optional[list[float]] = None # strict priority when not set
+    queue_path: Optional[str] = None # queue kept in memory when not set
+    corpus_path: Optional[str] = None # messages generated afresh when not set
 
 # --- Helper functions for Simulation Main ---
 
@@ -51,6 +106,10 @@ def print_help_message(code: Optional[int] = 0):
 
     print("SMS Simulator CLI")
     print("Usage: python simulator.py <OPTIONS>")
+    print("       python simulator.py generate <path/to/corpus> <OPTIONS>")
+    print("")
+    print("The generate command writes a corpus file of 'num_messages' messages, drawn with the 'seed', 'priority_mix'")
+    print("and 'batch_size' options as in compact mode, for runs to replay with -R.")
     print("")
     print("Options:")
     print("\t-h:                            Print this help message and exit")
@@ -69,6 +128,68 @@ def print_help_message(code: Optional[int] = 0):
     print("\t                                 Senders which are not explicitly provided configuration values will use default")
     print("\t                                 values of 0.5s mean delay and 0.5 failure rate.")
     print("\t-u  <monitor_update_interval>: Set 'monitor_update_interval' to floating point number greater than 0.5")
+    print("\t-b  <batch_size>:              Set 'batch_size' to positive integer number of messages the Generator")
+    print("\t                                 pushes and each Sender pulls from the queue at once.")
+    print("\t-q  <max_queue_size>:          Set 'max_queue_size' to positive integer maximum number of messages held")
+    print("\t                                 in the queue. The Generator waits for room once the queue is full.")
+    print("\t                                 The queue is unbounded if not set.")
+    print("\t-g  <generation_mode>:         Set 'generation_mode' for how the Generator creates messages")
+    print("\t                                 python: one character at a time (default)")
+    print("\t                                 numpy: whole blocks of messages at once with NumPy")
+    print("\t                                 compact: as numpy, but messages stay packed in MessageBatches")
+    print("\t                                          from the Generator through to the Senders")
+    print("\t-r  <seed>:                    Set 'seed' to integer random seed so generated messages are reproducible")
+    print("\t-x  <execution_mode>:          Set 'execution_mode' for how Senders and the Generator are run")
+    print("\t                                 thread: all in threads of this process (default)")
+    print("\t                                 process: Senders spread across a pool of worker processes")
+    print("\t                                 async: all Senders on one asyncio event loop")
+    print("\t                                 virtual: on a simulated clock, without waiting out delays or")
+    print("\t                                          starting the Monitor, then print the statistics")
+    print("\t-P  <num_processes>:           Set 'num_processes' to positive integer number of Sender worker processes")
+    print("\t                                 used in process mode. Defaults to the number of CPUs.")
+    print("\t-G  <generator_shards>:        Set 'generator_shards' to positive integer number of Generator processes")
+    print("\t                                 used in process mode, each generating a share of the messages.")
+    print("\t-C  <sender_concurrency>:      Set 'sender_concurrency' to positive integer number of messages each Sender")
+    print("\t                                 keeps in flight at once in async mode.")
+    print("\t-k  <monitor_pool_size>:       Set 'monitor_pool_size' to positive integer number of keep-alive connections")
+    print("\t                                 Senders in a process share for reporting to the Monitor API.")
+    print("\t-B  <report_buffer_size>:      Set 'report_buffer_size' to positive integer number of results each Sender")
+    print("\t                                 buffers before reporting them to the Monitor API in one request.")
+    print("\t                                 A value of 1 reports every result as it happens.")
+    print("\t-F  <report_flush_interval>:   Set 'report_flush_interval' to positive number of seconds buffered results")
+    print("\t                                 wait at most before being reported.")
+    print("\t-f  <report_format>:           Set 'report_format' for how results are reported to the Monitor API")
+    print("\t                                 compact: binary records of only the result, delay, sender and time (default)")
+    print("\t                                 json: JSON objects including the message body and phone number")
+    print("\t-W  <monitor_workers>:         Set 'monitor_workers' to positive integer number of Monitor API worker processes")
+    print("\t-T  <stats_store>:             Set 'stats_store' for where the Monitor API keeps statistics")
+    print("\t                                 memory: in the API process, only with a single worker")
+    print("\t                                 shared: in shared memory between API workers")
+    print("\t                                 sqlite: in a SQLite database in WAL mode")
+    print("\t                                 Defaults to memory for one worker, shared for more.")
+    print("\t-M  <monitor_mode>:            Set 'monitor_mode' for how results are collected")
+    print("\t                                 web: reported to the Monitor API, viewable on the Monitor frontend (default)")
+    print("\t                                 headless: recorded in this process without starting the Monitor,")
+    print("\t                                           then summarised once every message is sent")
+    print("\t-J  <path/to/summary.json>:    Set 'summary_path' to also write the final summary of a headless or")
+    print("\t                                 virtual run to a JSON file.")
+    print("\t-I  <on|off>:                  Set 'instrument' to time each stage of the Generator, queue and Senders.")
+    print("\t                                 Timings are served in Prometheus format from the Monitor API's /metrics,")
+    print("\t                                 or printed after a headless run.")
+    print("\t-p  <path/to/profile>:         Set 'profile_path' to profile this process with cProfile and write the stats")
+    print("\t                                 to that file, or with pyinstrument to an HTML report if it ends in .html.")
+    print("\t-y  <high>,<normal>,<low>:     Set 'priority_mix' to the share of messages the Generator creates at each priority,")
+    print("\t                                 such as 0.1,0.8,0.1. Every message is normal priority if not set.")
+    print("\t-w  <high>,<normal>,<low>:     Set 'lane_weights' to positive weights for how often Senders pull from each")
+    print("\t                                 priority's lane in the queue while it holds messages, so lower priorities")
+    print("\t                                 get a fair share. Higher priorities always go first if not set.")
+    print("\t-D  <path/to/queue>:           Set 'queue_path' to keep the message queue in memory-mapped files in that directory,")
+    print("\t                                 so runs can exceed memory, and a run that stops early resumes from its")
+    print("\t                                 unacknowledged messages when started again. Not available in process mode.")
+    print("\t-R  <path/to/corpus>:          Set 'corpus_path' to replay the first 'num_messages' messages, with their priorities,")
+    print("\t                                 from a corpus file written by the generate command rather than generating them.")
+    print("\t                                 The generation mode only decides if they are pushed compact. Not available in")
+    print("\t                                 virtual mode.")
     sys.exit(code)
 
 def adjust_senders(config: SimulatorConfig):
@@ -84,6 +205,99 @@ def adjust_senders(config: SimulatorConfig):
             config.sender_settings.append(SenderSettings())
     return config
 
+def check_positive(name: str, value: int) -> int:
+    '''
+        Validate an integer config value is positive
+    '''
+    if value < 1:
+        raise ValueError(f"'{name}' must be a positive integer!")
+    return value
+
+def check_interval(name: str, value: float) -> float:
+    '''
+        Validate a time interval config value is positive
+    '''
+    if value <= 0:
+        raise ValueError(f"'{name}' must be a positive number of seconds!")
+    return value
+
+def check_generation_mode(mode: str) -> str:
+    '''
+        Validate requested Generator mode
+    '''
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Generation mode must be one of {GENERATION_MODES}!")
+    return mode
+
+def check_execution_mode(mode: str) -> str:
+    '''
+        Validate requested execution mode
+    '''
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Execution mode must be one of {EXECUTION_MODES}!")
+    return mode
+
+def check_report_format(report_format: str) -> str:
+    '''
+        Validate requested report format
+    '''
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Report format must be one of {REPORT_FORMATS}!")
+    return report_format
+
+def check_monitor_mode(mode: str) -> str:
+    '''
+        Validate requested monitor mode
+    '''
+    if mode not in MONITOR_MODES:
+        raise ValueError(f"Monitor mode must be one of {MONITOR_MODES}!")
+    return mode
+
+def check_switch(name: str, value: str | bool) -> bool:
+    '''
+        Validate an on/off config value
+    '''
+    if value in ["on", True]:
+        return True
+    if value in ["off", False]:
+        return False
+    raise ValueError(f"'{name}' must be 'on' or 'off'!")
+
+def check_shares(name: str, values: str | list, positive: bool = False) -> list[float]:
+    '''
+        Validate one value per message priority, given as a list 
+        or comma separated text
+    '''
+    if isinstance(values, str):
+        values = values.split(",")
+    values = [float(value) for value in values]
+
+    if len(values) != len(PRIORITIES):
+        raise ValueError(f"'{name}' must give one value per priority {list(PRIORITIES)}!")
+    if positive and any(value <= 0 for value in values):
+        raise ValueError(f"'{name}' values must be positive!")
+    if any(value < 0 for value in values) or sum(values) == 0:
+        raise ValueError(f"'{name}' values must be non-negative and not all zero!")
+    return values
+
+def check_stats_store(kind: str) -> str:
+    '''
+        Validate requested statistics store
+    '''
+    if kind not in STATS_STORES:
+        raise ValueError(f"Statistics store must be one of {STATS_STORES}!")
+    return kind
+
+def check_corpus(path: str, num_messages: int):
+    '''
+        Validate a corpus file holds at least `num_messages`
+    '''
+    corpus = Corpus(path)
+    size = len(corpus)
+    corpus.close()
+    if size < num_messages:
+        raise ValueError(f"Corpus '{path}' only holds {size} messages!")
+
 def set_config_from_file(config: SimulatorConfig, filepath: str):
     '''
         Load in configuration values from json file
@@ -100,6 +314,50 @@ def set_config_from_file(config: SimulatorConfig, filepath: str):
                 config.num_senders = int(config_dict[key])
             case "monitor_update_interval":
                 config.monitor_update_interval = float(config_dict[key])
+            case "batch_size":
+                config.batch_size = check_positive("batch_size", int(config_dict[key]))
+            case "max_queue_size":
+                config.max_queue_size = check_positive("max_queue_size", int(config_dict[key]))
+            case "generation_mode":
+                config.generation_mode = check_generation_mode(config_dict[key])
+            case "seed":
+                config.seed = int(config_dict[key])
+            case "execution_mode":
+                config.execution_mode = check_execution_mode(config_dict[key])
+            case "num_processes":
+                config.num_processes = check_positive("num_processes", int(config_dict[key]))
+            case "generator_shards":
+                config.generator_shards = check_positive("generator_shards", int(config_dict[key]))
+            case "sender_concurrency":
+                config.sender_concurrency = check_positive("sender_concurrency", int(config_dict[key]))
+            case "monitor_pool_size":
+                config.monitor_pool_size = check_positive("monitor_pool_size", int(config_dict[key]))
+            case "report_buffer_size":
+                config.report_buffer_size = check_positive("report_buffer_size", int(config_dict[key]))
+            case "report_flush_interval":
+                config.report_flush_interval = check_interval("report_flush_interval", float(config_dict[key]))
+            case "report_format":
+                config.report_format = check_report_format(config_dict[key])
+            case "monitor_workers":
+                config.monitor_workers = check_positive("monitor_workers", int(config_dict[key]))
+            case "stats_store":
+                config.stats_store = check_stats_store(config_dict[key])
+            case "monitor_mode":
+                config.monitor_mode = check_monitor_mode(config_dict[key])
+            case "summary_path":
+                config.summary_path = config_dict[key]
+            case "instrument":
+                config.instrument = check_switch("instrument", config_dict[key])
+            case "profile_path":
+                config.profile_path = config_dict[key]
+            case "priority_mix":
+                config.priority_mix = check_shares("priority_mix", config_dict[key])
+            case "lane_weights":
+                config.lane_weights = check_shares("lane_weights", config_dict[key], positive=True)
+            case "queue_path":
+                config.queue_path = config_dict[key]
+            case "corpus_path":
+                config.corpus_path = config_dict[key]
             case "sender_settings":
                 config.sender_settings = [SenderSettings(**obj) for obj in config_dict[key]]
             case _:
@@ -147,6 +405,50 @@ def process_arguments(argv) -> SimulatorConfig:
                     config.sender_settings.append(SenderSettings(mean_delay=float(mean_delay), fail_rate=float(fail_rate)))
                 case "-u":
                     config.monitor_update_interval = float(argv[i])
+                case "-b":
+                    config.batch_size = check_positive("batch_size", int(argv[i]))
+                case "-q":
+                    config.max_queue_size = check_positive("max_queue_size", int(argv[i]))
+                case "-g":
+                    config.generation_mode = check_generation_mode(argv[i])
+                case "-r":
+                    config.seed = int(argv[i])
+                case "-x":
+                    config.execution_mode = check_execution_mode(argv[i])
+                case "-P":
+                    config.num_processes = check_positive("num_processes", int(argv[i]))
+                case "-G":
+                    config.generator_shards = check_positive("generator_shards", int(argv[i]))
+                case "-C":
+                    config.sender_concurrency = check_positive("sender_concurrency", int(argv[i]))
+                case "-k":
+                    config.monitor_pool_size = check_positive("monitor_pool_size", int(argv[i]))
+                case "-B":
+                    config.report_buffer_size = check_positive("report_buffer_size", int(argv[i]))
+                case "-F":
+                    config.report_flush_interval = check_interval("report_flush_interval", float(argv[i]))
+                case "-f":
+                    config.report_format = check_report_format(argv[i])
+                case "-W":
+                    config.monitor_workers = check_positive("monitor_workers", int(argv[i]))
+                case "-T":
+                    config.stats_store = check_stats_store(argv[i])
+                case "-M":
+                    config.monitor_mode = check_monitor_mode(argv[i])
+                case "-J":
+                    config.summary_path = argv[i]
+                case "-I":
+                    config.instrument = check_switch("instrument", argv[i])
+                case "-p":
+                    config.profile_path = argv[i]
+                case "-y":
+                    config.priority_mix = check_shares("priority_mix", argv[i])
+                case "-w":
+                    config.lane_weights = check_shares("lane_weights", argv[i], positive=True)
+                case "-D":
+                    config.queue_path = argv[i]
+                case "-R":
+                    config.corpus_path = argv[i]
             
             i += 1
             used_options.append(option)
@@ -161,20 +463,72 @@ def process_arguments(argv) -> SimulatorConfig:
             print("Error retrieving configuration values from file! {e}")
             print_help_message(code=1)
 
+    if config.stats_store == "memory" and config.monitor_workers > 1:
+        print("Error while setting configuration values! The memory statistics store only supports one Monitor API worker!")
+        print_help_message(code=1)
+    if config.queue_path and config.execution_mode == "process":
+        print("Error while setting configuration values! A queue kept in files can only be shared by threads of one process!")
+        print_help_message(code=1)
+    if config.corpus_path:
+        if config.execution_mode == "virtual":
+            print("Error while setting configuration values! Virtual mode does not replay messages from a corpus!")
+            print_help_message(code=1)
+        try:
+            check_corpus(config.corpus_path, config.num_messages)
+        except (OSError, ValueError) as e:
+            print(f"Error while setting configuration values! {e}")
+            print_help_message(code=1)
+
     return config
 
+def run_monitor_api(workers: int):
+    '''
+        Monitor API process entry point
+    '''
+    if workers == 1:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="error")
+        return
+
+    # Workers are fresh interpreters, so they import the app by name.
+    # uvicorn reopens stdin in each worker, but multiprocessing has 
+    # already swapped ours for a file they don't inherit.
+    sys.stdin = None
+    uvicorn.run(
+        "monitor.backend.main:app", 
+        host="0.0.0.0", 
+        port=8000, 
+        log_level="error", 
+        workers=workers
+    )
+
 def launch_monitor(config: SimulatorConfig) -> tuple[Process, subprocess.Popen]:
     '''
         Launch both front and backend for Monitor component 
         in separate processes
+
+        With more than one API worker, statistics are kept in a 
+        shared store created here, and stage timings in a directory
+        of files, both of which `finish_handler` removes.
     '''
-    
+    global stats_store, metrics_dir
+
+    store_kind = config.stats_store or ("memory" if config.monitor_workers == 1 else "shared")
+    if store_kind == "memory" and config.monitor_workers > 1:
+        raise ValueError("The memory statistics store only supports a single Monitor API worker!")
+
     os.environ["SMS_UPDATE_INTERVAL"] = str(config.monitor_update_interval)
-    api_proc = Process(target=uvicorn.run, args=(app,), kwargs={
-        "host": "0.0.0.0",
-        "port": 8000,
-        "log_level": "error"
-    })
+    os.environ["SMS_STATS_STORE"] = store_kind
+    if store_kind != "memory":
+        path = f"sms_stats_{os.getpid()}"
+        if store_kind == "sqlite":
+            path = os.path.join(tempfile.gettempdir(), path + ".db")
+        os.environ["SMS_STATS_PATH"] = path
+        stats_store = open_store(store_kind, path, create=True, num_senders=config.num_senders)
+    if config.monitor_workers > 1:
+        metrics_dir = tempfile.mkdtemp(prefix=f"sms_metrics_{os.getpid()}_")
+        os.environ["SMS_METRICS_DIR"] = metrics_dir
+
+    api_proc = Process(target=run_monitor_api, args=(config.monitor_workers,))
     api_proc.start()
 
     monitor_dir = str(os.path.dirname(os.path.abspath(__file__))) + "/monitor/frontend"
@@ -182,33 +536,514 @@ def launch_monitor(config: SimulatorConfig) -> tuple[Process, subprocess.Popen]:
 
     return api_proc, monitor_proc
 
+class SenderWorker:
+    '''
+        Worker process running a group of Senders, 
+        each in its own thread.
+
+        Exposes `finish_consuming` and `join` like a Sender and
+        its thread, so `main` handles both execution modes the same.
+
+        In headless runs, Senders record results in the shared 
+        memory statistics store named `stats_name`.
+    '''
+
+    def __init__(self, queue: ProcessMessageQueue, sender_kwargs: list[dict], stats_name: Optional[str] = None):
+        self._finish = multiprocessing.Event()
+        self.process = Process(target=run_sender_worker, args=(queue, sender_kwargs, self._finish, stats_name))
+
+    @property
+    def finish_consuming(self) -> bool:
+        return self._finish.is_set()
+
+    @finish_consuming.setter
+    def finish_consuming(self, value: bool):
+        if value:
+            self._finish.set()
+
+    def start(self):
+        self.process.start()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def join(self):
+        self.process.join()
+
+def run_sender_worker(
+        queue: ProcessMessageQueue, 
+        sender_kwargs: list[dict], 
+        finish, 
+        stats_name: Optional[str] = None
+):
+    '''
+        Worker process entry point: consume messages with a 
+        thread per Sender until the queue is drained or `finish` 
+        is set
+    '''
+    store = open_store("shared", stats_name) if stats_name else None
+    pusher = stages.start_pushing()
+    senders = [Sender(queue, stats_store=store, **kwargs) for kwargs in sender_kwargs]
+    threads = [threading.Thread(target=sender.consume_messages) for sender in senders]
+
+    for thread in threads:
+        thread.start()
+
+    while any(thread.is_alive() for thread in threads) and not finish.wait(PULL_TIMEOUT):
+        pass
+
+    for sender in senders:
+        sender.finish_consuming = True
+
+    for thread in threads:
+        thread.join()
+
+    if pusher:
+        pusher.stop()
+    if store:
+        store.close()
+
+class GeneratorShards:
+    '''
+        Group of Generator processes, each generating a share 
+        of the messages. Exposes `is_alive` and `join` like the 
+        Generator thread.
+    '''
+
+    def __init__(
+            self, 
+            queue: ProcessMessageQueue, 
+            num_messages: int, 
+            num_shards: int, 
+            generator_kwargs: dict
+    ):
+        self.processes = []
+        start = 0
+        for shard in range(num_shards):
+            kwargs = dict(generator_kwargs)
+            if kwargs.get("seed") is not None:
+                kwargs["seed"] += shard
+
+            shard_messages = num_messages // num_shards + (1 if shard < num_messages % num_shards else 0)
+            self.processes.append(
+                Process(target=run_generator_shard, args=(queue, shard_messages, kwargs, start))
+            )
+            start += shard_messages
+
+    def start(self):
+        for proc in self.processes:
+            proc.start()
+
+    def is_alive(self) -> bool:
+        return any(proc.is_alive() for proc in self.processes)
+
+    def join(self):
+        for proc in self.processes:
+            proc.join()
+
+def run_generator_shard(queue: ProcessMessageQueue, num_messages: int, generator_kwargs: dict, start: int):
+    '''
+        Generator process entry point
+    '''
+    pusher = stages.start_pushing()
+    create_generator(queue, num_messages, generator_kwargs, start).start_generating()
+    if pusher:
+        pusher.stop()
+
+def sender_arguments(config: SimulatorConfig) -> list[dict]:
+    '''
+        Keyword arguments for each configured Sender
+    '''
+    return [
+        dict(
+            monitor_url=config.monitor_url, 
+            batch_size=config.batch_size, 
+            compact=config.generation_mode == "compact",
+            monitor_pool_size=config.monitor_pool_size,
+            report_buffer_size=config.report_buffer_size,
+            report_flush_interval=config.report_flush_interval,
+            report_format=config.report_format,
+            sender_id=sender_id,
+            **asdict(sender)
+        )
+        for sender_id, sender in enumerate(config.sender_settings)
+    ]
+
+def generator_arguments(config: SimulatorConfig) -> dict:
+    '''
+        Keyword arguments for the configured Generator, or for a
+        ReplayGenerator if there is a corpus to replay
+    '''
+    if config.corpus_path:
+        return dict(
+            corpus=config.corpus_path,
+            batch_size=config.batch_size,
+            compact=config.generation_mode == "compact"
+        )
+    return dict(
+        batch_size=config.batch_size,
+        vectorized=config.generation_mode == "numpy",
+        compact=config.generation_mode == "compact",
+        seed=config.seed,
+        priority_mix=config.priority_mix
+    )
+
+def create_generator(
+        queue: MessageQueue | ProcessMessageQueue, 
+        num_messages: int, 
+        generator_kwargs: dict, 
+        start: int = 0
+) -> Generator:
+    '''
+        Generator for `num_messages`, replaying them from message
+        `start` of the corpus if `generator_kwargs` give one
+    '''
+    if "corpus" in generator_kwargs:
+        return ReplayGenerator(queue=queue, num_messages=num_messages, start=start, **generator_kwargs)
+    return Generator(queue, num_messages, **generator_kwargs)
+
+def create_queue(config: SimulatorConfig) -> MessageQueue | ProcessMessageQueue:
+    '''
+        Create the message queue suited to the execution mode, 
+        expecting each Generator shard to close it, or open the 
+        queue kept in files at `queue_path`, resuming it if an 
+        earlier run left messages there
+    '''
+    if config.queue_path:
+        queue = DurableMessageQueue(config.queue_path, max_size=config.max_queue_size, lane_weights=config.lane_weights)
+        if queue.previously_pushed:
+            print(f"Resuming the queue in {config.queue_path}: {queue.resumed} messages left to send")
+        return queue
+    if config.execution_mode == "process":
+        return ProcessMessageQueue(
+            max_size=config.max_queue_size, 
+            chunk_size=config.batch_size, 
+            producers=config.generator_shards,
+            lane_weights=config.lane_weights
+        )
+    return MessageQueue(max_size=config.max_queue_size, lane_weights=config.lane_weights)
+
+def messages_to_generate(config: SimulatorConfig, queue: MessageQueue | ProcessMessageQueue) -> int:
+    '''
+        Number of messages the Generator still has to push, fewer 
+        than configured if a resumed queue already holds some
+    '''
+    if not isinstance(queue, DurableMessageQueue):
+        return config.num_messages
+    if queue.closed:
+        return 0
+    return max(config.num_messages - queue.previously_pushed, 0)
+
+def finish_queue(queue: MessageQueue | ProcessMessageQueue, completed: bool):
+    '''
+        Delete a queue kept in files once every message is sent,
+        or flush it to disk to resume from if not
+    '''
+    if not isinstance(queue, DurableMessageQueue):
+        return
+    if completed:
+        queue.destroy()
+    else:
+        queue.flush()
+        print(f"Unsent messages are kept in {queue.path}; run again with the same options to resume.")
+
+def wait_for_completion(
+        queue: MessageQueue | ProcessMessageQueue, 
+        sender_threads: list, 
+        on_interval: Optional[Callable[[], None]] = None
+) -> bool:
+    '''
+        Block until every generated message has been sent and 
+        reported, returning True, or until every Sender has stopped
+        without finishing them, returning False. `on_interval` is 
+        called every `LIVENESS_INTERVAL` seconds while waiting.
+    '''
+    while not queue.wait_until_complete(timeout=LIVENESS_INTERVAL):
+        if on_interval:
+            on_interval()
+        if not any(st.is_alive() for st in sender_threads):
+            return queue.wait_until_complete(timeout=0)
+    return True
+
 def launch_simulation(
         config: SimulatorConfig, 
-        queue: MessageQueue
+        queue: MessageQueue,
+        stats_store: Optional[StatisticsStore] = None
 ) -> tuple[list[Sender], list[threading.Thread], threading.Thread]:
     '''
         Launch Generator and requested Senders in their own
         threads to start simulation. All threads reference the 
         same message queue.
+
+        Given a `stats_store`, Senders record their results there
+        rather than reporting them to the Monitor API.
     '''
 
+    if config.execution_mode == "process":
+        return launch_process_simulation(config, queue, stats_store)
+    if config.execution_mode == "async":
+        return launch_async_simulation(config, queue, stats_store)
+
     senders = []
     sender_threads = []
 
-    for sender in config.sender_settings:
-        senders.append(Sender(queue, monitor_url=config.monitor_url, **asdict(sender)))
+    for kwargs in sender_arguments(config):
+        senders.append(Sender(queue, stats_store=stats_store, **kwargs))
         sender_threads.append(
             threading.Thread(target=senders[-1].consume_messages)
         )
         sender_threads[-1].start()
     
-    generator = Generator(queue, config.num_messages)
+    remaining = messages_to_generate(config, queue)
+    generator = create_generator(queue, remaining, generator_arguments(config), config.num_messages - remaining)
     
     generator_thread = threading.Thread(target=generator.start_generating)
     generator_thread.start()
 
     return senders, sender_threads, generator_thread
 
+def launch_process_simulation(
+        config: SimulatorConfig,
+        queue: ProcessMessageQueue,
+        stats_store: Optional[SharedMemoryStore] = None
+) -> tuple[list[SenderWorker], list[SenderWorker], threading.Thread | GeneratorShards]:
+    '''
+        Launch Senders spread across a pool of worker processes, 
+        and the Generator either in a thread of this process or 
+        as several shard processes. All reference the same 
+        cross-process message queue, and `stats_store` if given.
+    '''
+
+    num_processes = min(config.num_processes or os.cpu_count(), len(config.sender_settings))
+    all_kwargs = sender_arguments(config)
+    stats_name = stats_store.name if stats_store else None
+
+    workers = []
+    for i in range(num_processes):
+        workers.append(SenderWorker(queue, all_kwargs[i::num_processes], stats_name))
+        workers[-1].start()
+
+    if config.generator_shards > 1:
+        generator_proc = GeneratorShards(
+            queue, 
+            config.num_messages, 
+            config.generator_shards, 
+            generator_arguments(config)
+        )
+        generator_proc.start()
+    else:
+        generator = create_generator(queue, config.num_messages, generator_arguments(config))
+        generator_proc = threading.Thread(target=generator.start_generating)
+        generator_proc.start()
+
+    return workers, workers, generator_proc
+
+def launch_async_simulation(
+        config: SimulatorConfig,
+        queue: MessageQueue,
+        stats_store: Optional[StatisticsStore] = None
+) -> tuple[list[AsyncSender], list[threading.Thread], threading.Thread]:
+    '''
+        Launch every Sender as an AsyncSender on one asyncio event 
+        loop, run in its own thread, and the Generator in another.
+        All reference the same message queue, and `stats_store` if
+        given.
+    '''
+
+    senders = [
+        AsyncSender(
+            queue,
+            monitor_url=config.monitor_url,
+            concurrency=config.sender_concurrency,
+            sender_id=sender_id,
+            stats_store=stats_store,
+            **asdict(sender)
+        )
+        for sender_id, sender in enumerate(config.sender_settings)
+    ]
+
+    loop_thread = threading.Thread(
+        target=asyncio.run,
+        args=(run_async_senders(senders, config.num_senders * config.sender_concurrency),)
+    )
+    loop_thread.start()
+
+    remaining = messages_to_generate(config, queue)
+    generator = create_generator(queue, remaining, generator_arguments(config), config.num_messages - remaining)
+
+    generator_thread = threading.Thread(target=generator.start_generating)
+    generator_thread.start()
+
+    return senders, [loop_thread], generator_thread
+
+def launch_virtual_simulation(config: SimulatorConfig) -> SimulationReport:
+    '''
+        Run the whole simulation on a virtual clock, with every
+        Sender drawing from its own random stream split off `seed`
+    '''
+    seeds = np.random.SeedSequence(config.seed).spawn(len(config.sender_settings))
+    senders = [
+        VirtualSender(
+            batch_size=config.batch_size, 
+            sender_id=sender_id, 
+            seed=seeds[sender_id], 
+            **asdict(sender)
+        )
+        for sender_id, sender in enumerate(config.sender_settings)
+    ]
+    generator = Generator(num_messages=config.num_messages, seed=config.seed)
+
+    return run_virtual_simulation(generator, senders)
+
+def run_headless_simulation(config: SimulatorConfig) -> SimulationReport:
+    '''
+        Run the simulation without the Monitor, with Senders 
+        recording results in a statistics store in this process
+        (in shared memory for process mode), until every message 
+        has been sent
+    '''
+    if config.execution_mode == "process":
+        store = open_store("shared", f"sms_stats_{os.getpid()}", create=True, num_senders=config.num_senders)
+    else:
+        store = MemoryStore()
+
+    try:
+        queue = create_queue(config)
+        started_at = time.time()
+        start = time.perf_counter()
+
+        senders, sender_threads, generator_thread = launch_simulation(config, queue, store)
+
+        completed = wait_for_completion(queue, sender_threads)
+        if not completed:
+            print(f"Senders stopped early! Only {queue.acknowledged} messages were sent.")
+
+        for sender in senders:
+            sender.finish_consuming = True
+        for st in sender_threads:
+            st.join()
+        generator_thread.join()
+
+        report = simulation_report(store, started_at, time.time(), time.perf_counter() - start)
+        report.queue = QueueTelemetryReport(**queue.telemetry())
+        finish_queue(queue, completed)
+        return report
+    finally:
+        store.close()
+
+def print_report(report: SimulationReport, virtual: bool = False):
+    '''
+        Print the final statistics of a headless or virtual run
+    '''
+    stats = report.statistics
+    latency = report.latency.overall
+    unit = "second" if report.history.resolution == 1 else "minute"
+    peak = max((b.success_messages + b.failed_messages for b in report.history.buckets), default=0)
+
+    if virtual:
+        print(f"Simulated {report.duration:.1f}s in {report.elapsed:.1f}s of wall clock time")
+    else:
+        print(f"Completed in {report.elapsed:.1f}s")
+    print(f"Sent messages:   {stats.success_messages}")
+    print(f"Failed messages: {stats.failed_messages}")
+    print(f"Average delay:   {stats.average_delay}s (p50 {latency.p50}s, p99 {latency.p99}s)")
+    print(f"Throughput:      {report.throughput:.2f} messages per {'simulated ' if virtual else ''}second (peak {peak} in one {unit})")
+    if report.queue:
+        print_queue_telemetry(report.queue)
+
+def wait_quantile_bound(le: list[float], buckets: list[int], quantile: float) -> float:
+    '''
+        Upper bound of the histogram bucket holding the given
+        quantile of waits, infinite if it is the final bucket
+    '''
+    target = quantile * sum(buckets)
+    seen = 0
+    for bound, count in zip(le, buckets):
+        seen += count
+        if seen >= target:
+            return bound
+    return float("inf")
+
+def print_queue_telemetry(queue: QueueTelemetryReport):
+    '''
+        Print how long messages waited in the queue and for its
+        lock, next to the send delay, and how long messages of each
+        priority waited if more than one was used
+    '''
+    mean_wait = queue.wait_sum / queue.dequeued if queue.dequeued else 0.0
+    mean_lock_wait = queue.lock_wait_sum / queue.lock_acquisitions if queue.lock_acquisitions else 0.0
+    print(f"Queue wait:      {mean_wait:.4f}s average, {queue.wait_max:.4f}s longest (peak depth {queue.peak_depth})")
+
+    lanes = [lane for lane in queue.priorities if lane.dequeued or lane.depth]
+    if len(lanes) > 1:
+        for lane in lanes:
+            mean_wait = lane.wait_sum / lane.dequeued if lane.dequeued else 0.0
+            p99 = wait_quantile_bound(queue.wait_le, lane.wait_buckets, 0.99)
+            print(f"  {lane.priority + ':':<14} {mean_wait:.4f}s average, {lane.wait_max:.4f}s longest, p99 <= {p99}s over {lane.dequeued} messages")
+
+    print(f"Queue lock wait: {mean_lock_wait * 1e6:.1f}us average over {queue.lock_acquisitions} acquisitions, {queue.lock_wait_max * 1e6:.1f}us longest")
+
+def write_report(report: SimulationReport, path: str):
+    '''
+        Write the final statistics of a run to a JSON file
+    '''
+    with open(path, "w") as summary:
+        summary.write(report.model_dump_json(indent=4))
+
+def start_profiler(path: str) -> cProfile.Profile:
+    '''
+        Start profiling this process, with pyinstrument if `path`
+        is an HTML report, otherwise with cProfile
+    '''
+    if not path.endswith(".html"):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    try:
+        import pyinstrument
+    except ImportError:
+        raise ImportError("Writing an HTML profile needs pyinstrument! Install it, or write cProfile stats instead.")
+
+    profiler = pyinstrument.Profiler()
+    profiler.start()
+    return profiler
+
+def stop_profiler(profiler, path: str):
+    '''
+        Stop profiling and write the results to `path`
+    '''
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        with open(path, "w") as report:
+            report.write(profiler.output_html())
+    print(f"Profile written to {path}")
+
+def generate_corpus(argv):
+    '''
+        Write a corpus file to the path given first in `argv`, 
+        configured by the options after it
+    '''
+    if not argv or argv[0] in OPTIONS:
+        print("Must provide a path for the generate command to write the corpus to!\n")
+        print_help_message(code=1)
+
+    path = argv[0]
+    config = process_arguments(argv[1:])
+    generator = Generator(
+        num_messages=config.num_messages, 
+        batch_size=config.batch_size, 
+        seed=config.seed, 
+        priority_mix=config.priority_mix
+    )
+
+    start = time.perf_counter()
+    size = write_corpus(path, generator, config.num_messages)
+    print(f"Wrote {config.num_messages} messages ({size / 2**20:.1f} MiB) to {path} in {time.perf_counter() - start:.1f}s")
+
 def main(*args):
     '''
         Main function for Simulator.
@@ -218,6 +1053,10 @@ def main(*args):
 
     global monitor, api
 
+    if len(args) > 1 and args[1] == "generate":
+        generate_corpus(list(args)[2:])
+        return
+
     if len(args) == 1:
         print("No configuration options provided! Using default settings...")
         config = SimulatorConfig()
@@ -225,6 +1064,28 @@ def main(*args):
         config = process_arguments(list(args)[1:])
 
     config = adjust_senders(config)
+    profiler = start_profiler(config.profile_path) if config.profile_path else None
+
+    if config.execution_mode == "virtual" or config.monitor_mode == "headless":
+        if config.instrument:
+            stages.enable()
+        virtual = config.execution_mode == "virtual"
+        if virtual:
+            print("Configuration loaded, running simulation in virtual time...\n")
+            report = launch_virtual_simulation(config)
+        else:
+            print("Configuration loaded, running simulation without the monitor...\n")
+            report = run_headless_simulation(config)
+
+        print_report(report, virtual)
+        if config.summary_path:
+            write_report(report, config.summary_path)
+            print(f"Summary written to {config.summary_path}")
+        if config.instrument:
+            print(f"\nStage timings:\n{stages.format_stages()}")
+        if profiler:
+            stop_profiler(profiler, config.profile_path)
+        return
 
     print("Configuration loaded, launching monitor...\n")
 
@@ -233,14 +1094,27 @@ def main(*args):
     print("Simulation Progress Monitor is viewable at http://localhost:3000 !")
     print("Launching simulation... \n")
 
-    message_queue = MessageQueue()
+    if config.instrument:
+        stages.enable(url=config.monitor_url)
+        print(f"Stage timings are served from {config.monitor_url}/metrics")
+    pusher = stages.start_pushing()
+
+    message_queue = create_queue(config)
 
     senders, sender_threads, generator_thread = launch_simulation(config, message_queue)
 
     print("Simulation started! Waiting for all messages to be consumed...")
 
-    while message_queue.length() > 0:
-        time.sleep(0.5)
+    reporter = MonitorService(config.monitor_url)
+    def report_queue():
+        try:
+            reporter.report_queue(message_queue.telemetry())
+        except Exception:
+            pass # reports are cumulative, so the next one catches up
+
+    completed = wait_for_completion(message_queue, sender_threads, on_interval=report_queue)
+    if not completed:
+        print(f"Senders stopped early! Only {message_queue.acknowledged} messages were sent.")
     
     for sender in senders:
         sender.finish_consuming = True
@@ -250,6 +1124,14 @@ def main(*args):
 
     generator_thread.join()
 
+    if pusher:
+        pusher.stop()
+    if profiler:
+        stop_profiler(profiler, config.profile_path)
+
+    report_queue()
+    print_queue_telemetry(QueueTelemetryReport(**message_queue.telemetry()))
+    finish_queue(message_queue, completed)
     print("All messages have been consumed! You can browse the monitor for as long as you please, then use Ctrl+C to finish.")
     signal.signal(signal.SIGINT, finish_handler)
 
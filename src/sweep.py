@@ -0,0 +1,263 @@
+import csv
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Callable, Optional
+
+import numpy as np
+
+from simulator import (
+    SimulatorConfig,
+    adjust_senders,
+    launch_virtual_simulation,
+    process_arguments,
+    run_headless_simulation
+)
+
+SWEEP_OPTIONS = ["-m", "-S", "-d", "-e", "-o", "-j"]
+OUTPUT_FORMATS = [".csv", ".parquet"]
+RESULT_COLUMNS = [
+    "num_messages",
+    "num_senders",
+    "mean_delay",
+    "fail_rate",
+    "success_messages",
+    "failed_messages",
+    "average_delay",
+    "p50",
+    "p90",
+    "p99",
+    "p999",
+    "throughput",
+    "completion_time",
+    "elapsed"
+]
+
+def print_help_message(code: Optional[int] = 0):
+    '''
+        Print message on sweep runner usage and options.
+    '''
+
+    print("SMS Simulator Parameter Sweep")
+    print("Usage: python sweep.py <SWEEP OPTIONS> <SIMULATOR OPTIONS>")
+    print("")
+    print("Runs the simulator once for every combination of the swept values, in virtual time unless")
+    print("a thread or async execution mode is given with -x, in which case each run is headless.")
+    print("Writes one row of results per run. Values are given as a comma separated list, where")
+    print("each item is either a single value or an inclusive range <start>:<stop>:<step>.")
+    print("")
+    print("Sweep options:")
+    print("\t-m  <values>:                  Values for 'num_messages'")
+    print("\t-S  <values>:                  Values for 'num_senders'")
+    print("\t-d  <values>:                  Values for every Sender's 'mean_delay'")
+    print("\t-e  <values>:                  Values for every Sender's 'fail_rate'")
+    print("\t-o  <path/to/results>:         Write results to a .csv file, or a .parquet file if pyarrow is installed")
+    print("\t                                 Results are printed as CSV if not set.")
+    print("\t-j  <jobs>:                    Number of runs at once, each in its own process. Defaults to the number of CPUs.")
+    print("")
+    print("Any other options set the base configuration each run starts from, as for simulator.py,")
+    print("including -c to load it from a config file. Use 'python simulator.py -h' to list them.")
+    sys.exit(code)
+
+def parse_values(text: str, cast: Callable[[str], int | float]) -> list[int | float]:
+    '''
+        Parse a comma separated list of values and inclusive
+        <start>:<stop>:<step> ranges
+    '''
+    values = []
+    for item in text.split(","):
+        if ":" not in item:
+            values.append(cast(item))
+            continue
+
+        start, stop, step = (cast(part) for part in item.split(":"))
+        if step <= 0:
+            raise ValueError(f"Range step must be positive in '{item}'!")
+        # a little slack so float steps still reach `stop`, and
+        # rounding so they don't pick up representation error
+        values.extend(cast(round(v, 10)) for v in np.arange(start, stop + step / 1e6, step).tolist())
+
+    return values
+
+def process_sweep_arguments(argv) -> tuple[SimulatorConfig, dict[str, list], Optional[str], Optional[int]]:
+    '''
+        Handle command-line arguments, returning the base config,
+        the values to sweep, the output path and number of jobs.
+
+        Sweep options are taken out first and everything else is
+        passed on to the simulator's `process_arguments`.
+    '''
+    grid = {}
+    output = None
+    jobs = None
+    base_args = []
+
+    i = 0
+    while i < len(argv):
+        option = argv[i]
+        if option == "-h":
+            print_help_message()
+        if option not in SWEEP_OPTIONS:
+            base_args.append(option)
+            i += 1
+            continue
+
+        try:
+            if i + 1 >= len(argv):
+                raise SyntaxError(f"Must provide value for flag {option}!")
+            value = argv[i + 1]
+
+            match option:
+                case "-m":
+                    grid["num_messages"] = parse_values(value, int)
+                case "-S":
+                    grid["num_senders"] = parse_values(value, int)
+                case "-d":
+                    grid["mean_delay"] = parse_values(value, float)
+                case "-e":
+                    grid["fail_rate"] = parse_values(value, float)
+                case "-o":
+                    if os.path.splitext(value)[1] not in OUTPUT_FORMATS:
+                        raise ValueError(f"Results file must end in one of {OUTPUT_FORMATS}!")
+                    output = value
+                case "-j":
+                    jobs = int(value)
+                    if jobs < 1:
+                        raise ValueError("'jobs' must be a positive integer!")
+        except (SyntaxError, ValueError) as e:
+            print(f"Error while setting sweep values! {e}\n")
+            print_help_message(code=1)
+
+        i += 2
+
+    config = process_arguments(base_args)
+    if "-x" not in base_args:
+        config = replace(config, execution_mode="virtual")
+    elif config.execution_mode == "process":
+        print("Error while setting sweep values! Sweeps already run in a pool of processes, so can't use process mode!\n")
+        print_help_message(code=1)
+
+    return replace(config, monitor_mode="headless"), grid, output, jobs
+
+def sweep_configs(base: SimulatorConfig, grid: dict[str, list]) -> list[SimulatorConfig]:
+    '''
+        One config for every combination of swept values, each
+        starting from `base`. Swept Sender settings apply to every
+        Sender.
+    '''
+    names = list(grid)
+    configs = []
+
+    for values in itertools.product(*(grid[name] for name in names)):
+        point = dict(zip(names, values))
+
+        config = replace(
+            base,
+            num_messages=point.get("num_messages", base.num_messages),
+            num_senders=point.get("num_senders", base.num_senders),
+            sender_settings=[replace(sender) for sender in base.sender_settings]
+        )
+        if "num_senders" in point:
+            config.sender_settings = config.sender_settings[:config.num_senders]
+        config = adjust_senders(config)
+
+        for sender in config.sender_settings:
+            sender.mean_delay = point.get("mean_delay", sender.mean_delay)
+            sender.fail_rate = point.get("fail_rate", sender.fail_rate)
+        configs.append(config)
+
+    return configs
+
+def shared_setting(config: SimulatorConfig, name: str) -> Optional[float]:
+    '''
+        A Sender setting if every Sender has the same value
+    '''
+    values = {getattr(sender, name) for sender in config.sender_settings}
+    return values.pop() if len(values) == 1 else None
+
+def run_point(config: SimulatorConfig) -> dict:
+    '''
+        Run one config, in virtual time or headless, and return 
+        its results row
+    '''
+    if config.execution_mode == "virtual":
+        report = launch_virtual_simulation(config)
+    else:
+        report = run_headless_simulation(config)
+    latency = report.latency.overall
+
+    return {
+        "num_messages": config.num_messages,
+        "num_senders": config.num_senders,
+        "mean_delay": shared_setting(config, "mean_delay"),
+        "fail_rate": shared_setting(config, "fail_rate"),
+        "success_messages": report.statistics.success_messages,
+        "failed_messages": report.statistics.failed_messages,
+        "average_delay": report.statistics.average_delay,
+        "p50": latency.p50,
+        "p90": latency.p90,
+        "p99": latency.p99,
+        "p999": latency.p999,
+        "throughput": report.throughput,
+        "completion_time": round(report.duration, 4),
+        "elapsed": round(report.elapsed, 4)
+    }
+
+def run_sweep(configs: list[SimulatorConfig], jobs: Optional[int] = None) -> list[dict]:
+    '''
+        Run every config across a pool of `jobs` processes, one
+        per CPU by default, returning rows in the order given
+    '''
+    if jobs == 1:
+        return [run_point(config) for config in configs]
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(run_point, configs))
+
+def write_results(rows: list[dict], path: Optional[str] = None):
+    '''
+        Write result rows to a CSV or Parquet file by extension,
+        or print them as CSV if no path is given
+    '''
+    if path is None:
+        writer = csv.DictWriter(sys.stdout, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Writing Parquet results needs pyarrow! Install it, or write to a .csv file instead.")
+
+        table = pyarrow.Table.from_pylist(rows)
+        pyarrow.parquet.write_table(table, path)
+        return
+
+    with open(path, "w", newline="") as results:
+        writer = csv.DictWriter(results, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main(*args):
+    '''
+        Main function for the sweep runner.
+        Build every config to run, run them, then write results.
+    '''
+    base, grid, output, jobs = process_sweep_arguments(list(args)[1:])
+    configs = sweep_configs(base, grid)
+
+    mode = "in virtual time" if base.execution_mode == "virtual" else "headless"
+    print(f"Running {len(configs)} simulations {mode}...", file=sys.stderr)
+    rows = run_sweep(configs, jobs)
+    write_results(rows, output)
+
+    if output:
+        print(f"Results written to {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main(*sys.argv)
@@ -0,0 +1,88 @@
+import pytest
+
+import pickle
+
+from generator.corpus import Corpus, ReplayGenerator, write_corpus
+from generator.generator import Generator
+from msg_queue.msg_queue import MessageBatch, MessageQueue
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    path = str(tmp_path / "corpus.bin")
+    write_corpus(path, Generator(seed=3, priority_mix=[1, 2, 1]), 2500)
+    return path
+
+def expected_messages(count):
+    generator = Generator(seed=3, priority_mix=[1, 2, 1])
+    return [m for batch in generator.generate_batches(count) for m in batch]
+
+def test_write_corpus(corpus_path):
+
+    corpus = Corpus(corpus_path)
+    assert len(corpus) == 2500
+
+    batches = list(corpus.batches(0, len(corpus)))
+    assert all(type(batch.bodies) == memoryview for batch in batches)
+    # the corpus holds exactly what compact generation with the same seed draws
+    assert [m for batch in batches for m in batch] == expected_messages(2500)
+
+    # batches split at block bounds and wherever the priority changes
+    assert max(len(batch) for batch in corpus.batches(0, 2500, block_size=100)) <= 100
+    assert [m for batch in corpus.batches(990, 1010) for m in batch] == expected_messages(2500)[990:1010]
+
+def test_empty_corpus(tmp_path):
+
+    path = str(tmp_path / "empty.bin")
+    write_corpus(path, Generator(), 0)
+    corpus = Corpus(path)
+    assert len(corpus) == 0
+    assert list(corpus.batches(0, 0)) == []
+
+def test_incomplete_corpus(tmp_path, corpus_path):
+
+    with open(corpus_path, "r+b") as file:
+        file.write(bytes(8))
+    with pytest.raises(ValueError):
+        Corpus(corpus_path)
+
+    empty = tmp_path / "none.bin"
+    empty.write_bytes(b"")
+    with pytest.raises(ValueError):
+        Corpus(str(empty))
+
+def test_pickle_corpus_batch(corpus_path):
+
+    # only the batch's own bodies are pickled, not the whole mapping
+    batch = next(Corpus(corpus_path).batches(10, 20))
+    copy = pickle.loads(pickle.dumps(batch))
+    assert type(copy.bodies) == bytes
+    assert copy.offsets[0] == 0
+    assert copy.to_messages() == batch.to_messages()
+
+@pytest.mark.parametrize("compact,batch_size", [(True, 1), (False, 1), (False, 64)])
+def test_replay_generator(corpus_path, compact, batch_size):
+
+    queue = MessageQueue()
+    generator = ReplayGenerator(corpus_path, queue, batch_size=batch_size, compact=compact)
+    assert generator.num_messages == 2500
+
+    generator.start_generating()
+    assert queue.closed
+    assert queue.length() == 2500
+
+    pulled = []
+    while batch := queue.pull_many(500):
+        pulled.extend(batch)
+    assert sorted(pulled, key=repr) == sorted(expected_messages(2500), key=repr)
+
+def test_replay_generator_start(corpus_path):
+
+    queue = MessageQueue()
+    ReplayGenerator(corpus_path, queue, num_messages=100, start=2000).start_generating()
+    assert sorted(queue.pull_many(200), key=repr) == sorted(expected_messages(2500)[2000:2100], key=repr)
+
+    assert ReplayGenerator(corpus_path, start=2400).num_messages == 100
+    with pytest.raises(ValueError):
+        ReplayGenerator(corpus_path, num_messages=2501)
+    with pytest.raises(ValueError):
+        ReplayGenerator(corpus_path, num_messages=100, start=2401)
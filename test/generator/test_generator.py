@@ -1,8 +1,9 @@
 import pytest
+import string
 from unittest.mock import MagicMock
 
 from generator.generator import Generator
-from msg_queue.msg_queue import Message
+from msg_queue.msg_queue import DEFAULT_PRIORITY, Message, MessageBatch, MessageQueue
 
 MAX_STRING_LEN = 100
 MIN_STRING_LEN = 1
@@ -24,6 +25,11 @@ def test_constructor(default_gen):
     with pytest.raises(ValueError):
         gen_minus_one = Generator(num_messages=-1)       
 
+    assert default_gen.batch_size == 1
+
+    with pytest.raises(ValueError):
+        gen_no_batch = Generator(batch_size=0)
+
 def test_create_random_string(default_gen):
     rand_string = default_gen.create_random_string()
 
@@ -93,4 +99,136 @@ def test_start_generating(default_gen):
     generate_0.push_message = MagicMock()
 
     generate_0.start_generating()
-    assert generate_0.push_message.call_count == 0
\ No newline at end of file
+    assert generate_0.push_message.call_count == 0
+
+def test_start_generating_batches():
+
+    generate_batched = Generator(num_messages=25, batch_size=10)
+
+    generate_batched.push_messages = MagicMock()
+    generate_batched.start_generating()
+
+    batches = [c[0][0] for c in generate_batched.push_messages.call_args_list]
+
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert all(type(m) == Message for b in batches for m in b)
+
+def test_generate_messages_vectorized():
+
+    vec_gen = Generator(vectorized=True)
+
+    messages = vec_gen.generate_messages(500)
+
+    assert len(messages) == 500
+    for message in messages:
+        assert type(message) == Message
+        assert len(message.message) >= MIN_STRING_LEN and len(message.message) <= MAX_STRING_LEN
+        assert all(c in string.printable for c in message.message)
+        assert len(message.phone) == PHONE_LEN
+        assert message.phone.isdigit()
+
+    # lengths should cover the full range rather than a single value
+    assert len(set(len(m.message) for m in messages)) > 50
+
+    assert vec_gen.generate_messages(0) == []
+
+def test_seeded_generation():
+
+    for vectorized in [False, True]:
+        first = Generator(vectorized=vectorized, seed=42).generate_messages(20)
+        second = Generator(vectorized=vectorized, seed=42).generate_messages(20)
+        other = Generator(vectorized=vectorized, seed=43).generate_messages(20)
+
+        assert first == second
+        assert first != other
+
+def test_start_generating_vectorized():
+
+    vec_gen = Generator(num_messages=2500, batch_size=100, vectorized=True)
+
+    vec_gen.push_messages = MagicMock()
+    vec_gen.start_generating()
+
+    batches = [c[0][0] for c in vec_gen.push_messages.call_args_list]
+
+    assert len(batches) == 25
+    assert sum(len(b) for b in batches) == 2500
+
+def test_generate_batch():
+
+    batch = Generator(seed=1).generate_batch(500)
+
+    assert type(batch) == MessageBatch
+    assert len(batch) == 500
+
+    lengths = batch.lengths()
+    assert lengths.min() >= MIN_STRING_LEN and lengths.max() <= MAX_STRING_LEN
+    assert all(c in string.printable for c in batch.bodies.decode("ascii"))
+    assert (batch.phones < 10 ** PHONE_LEN).all()
+
+    # same seed gives the same messages whether compact or not
+    assert batch.to_messages() == Generator(seed=1, vectorized=True).generate_messages(500)
+
+def test_start_generating_compact():
+
+    queue = MessageQueue()
+    compact_gen = Generator(queue, num_messages=2500, batch_size=100, compact=True)
+
+    compact_gen.start_generating()
+
+    assert queue.length() == 2500
+    assert all(type(entry) == MessageBatch for entry in queue._lanes[DEFAULT_PRIORITY])
+
+def test_start_generating_compact_single():
+
+    queue = MessageQueue()
+    compact_gen = Generator(queue, num_messages=50, batch_size=1, compact=True)
+
+    compact_gen.start_generating()
+
+    # compact mode pushes whole blocks even when pulled one at a time
+    assert queue.length() == 50
+    assert len(queue._lanes[DEFAULT_PRIORITY]) == 1
+    assert type(queue._lanes[DEFAULT_PRIORITY][0]) == MessageBatch
+
+def test_start_generating_closes_queue():
+
+    queue = MessageQueue()
+    Generator(queue, num_messages=20, batch_size=5).start_generating()
+
+    assert queue.closed
+    assert queue.length() == 20
+
+    # the queue is closed even if generation fails part way
+    failing_queue = MessageQueue()
+    failing_gen = Generator(failing_queue, num_messages=20)
+    failing_gen.generate_message = MagicMock(side_effect=RuntimeError)
+
+    with pytest.raises(RuntimeError):
+        failing_gen.start_generating()
+    assert failing_queue.closed
+
+@pytest.mark.parametrize("mode", [{}, {"vectorized": True}, {"compact": True}])
+def test_priority_mix(mode):
+
+    queue = MessageQueue()
+    Generator(queue, num_messages=2000, priority_mix=[1, 2, 0], seed=0, **mode).start_generating()
+
+    # one high priority message in three, and no low
+    assert queue.length() == 2000
+    lanes = queue.telemetry()["priorities"]
+    assert 550 < lanes[0]["depth"] < 780
+    assert lanes[0]["depth"] + lanes[1]["depth"] == 2000
+    assert lanes[2]["depth"] == 0
+
+def test_priority_mix_validation():
+
+    assert Generator().draw_priorities(3) == [DEFAULT_PRIORITY] * 3
+    assert Generator(priority_mix=[2, 1, 1]).priority_mix == [0.5, 0.25, 0.25]
+
+    with pytest.raises(ValueError):
+        Generator(priority_mix=[1, 1])
+    with pytest.raises(ValueError):
+        Generator(priority_mix=[0, 0, 0])
+    with pytest.raises(ValueError):
+        Generator(priority_mix=[1, -1, 1])
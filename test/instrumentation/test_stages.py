@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import patch
+
+from instrumentation import stages
+from instrumentation.stages import STAGE_BUCKETS, Stage
+from generator.generator import Generator
+from monitor.backend.store import MemoryStore
+from msg_queue.msg_queue import MessageQueue
+from sender.sender import Sender
+
+@pytest.fixture
+def instrumented():
+    stages.reset()
+    stages.enable()
+    yield
+    stages.enable(False)
+    stages.reset()
+
+def test_disabled_stage():
+
+    stage = Stage("test", "Test stage")
+    stages.enable(False)
+
+    # nothing is timed, or even read from the clock
+    started = stage.begin()
+    assert started == 0
+    stage.end(started)
+    assert stage.count == 0
+
+def test_stage_histogram(instrumented):
+
+    stage = Stage("test", "Test stage")
+    for seconds in [5e-7, 2e-3, 2e-3, 100]:
+        stage.observe(seconds)
+
+    snapshot = stage.snapshot()
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(100.004 + 5e-7)
+    assert snapshot["le"] == list(STAGE_BUCKETS)
+    # one in the first bucket, two up to 0.01s and one above every bound
+    assert snapshot["buckets"] == [1, 0, 0, 0, 2, 0, 0, 0, 1]
+
+    stage.end(stage.begin())
+    assert stage.count == 5
+
+def test_simulation_stages(instrumented):
+
+    queue = MessageQueue()
+    generator = Generator(queue, num_messages=50, vectorized=True, batch_size=10)
+    generator.start_generating()
+
+    sender = Sender(queue, mean_delay=0, fail_rate=0, stats_store=MemoryStore())
+    sender.consume_messages()
+
+    timed = stages.snapshot()
+    assert timed["generate"]["count"] == 1
+    assert timed["queue_push"]["count"] == 5
+    assert timed["queue_pull"]["count"] >= 50
+    assert timed["queue_lock"]["count"] >= 55
+    assert timed["validate"]["count"] == 50
+    assert timed["send"]["count"] == 50
+    assert timed["report"]["count"] == 50
+    assert timed["report_http"]["count"] == 0
+
+    table = stages.format_stages()
+    assert "validate" in table
+    assert "report_http" not in table
+
+def test_stage_pusher(instrumented):
+
+    # not pushed anywhere unless there is a Monitor API
+    assert stages.start_pushing() is None
+
+    stages.enable(url="http://monitor")
+    with patch("instrumentation.stages.httpx.post") as post:
+        pusher = stages.start_pushing()
+        pusher.stop()
+
+    url = post.call_args.args[0]
+    body = post.call_args.kwargs["json"]
+    assert url == "http://monitor/metrics/stages"
+    assert body["source"] == pusher.source
+    assert set(body["stages"]) == set(stages.STAGES)
@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 import json
 
 from monitor.backend.main import app
+from monitor.backend.models import pack_result
 
 @pytest.fixture
 def client():
@@ -30,6 +31,109 @@ def test_report_message_success(client):
     # to remove unnecessary quotes
     assert json.loads(res.content) == "OK"
 
+def test_report_message_without_body(client):
+
+    # Senders sending MessageBatches report without message body or phone
+    res = client.post("/message", json={
+        "success": True,
+        "delay": 0.5
+    })
+
+    assert res.status_code == 200
+    assert json.loads(client.get("/statistics").content)["success_messages"] == 1
+
+def test_report_message_batch(client):
+
+    res = client.post("/messages/batch", json=[
+        {"message": "fake message", "phone": "1234567890", "success": True, "delay": 0.5},
+        {"success": True, "delay": 1.2},
+        {"success": False, "delay": 0.4},
+    ])
+
+    assert res.status_code == 200
+
+    res = client.post("/messages/batch", json=[])
+    assert res.status_code == 200
+
+    # one invalid result rejects the whole batch
+    res = client.post("/messages/batch", json=[
+        {"success": True, "delay": 1.0},
+        {"success": True},
+    ])
+    assert res.status_code == 422
+
+    stats = json.loads(client.get("/statistics").content)
+
+    assert stats["success_messages"] == 2
+    assert stats["failed_messages"] == 1
+    assert round(stats["average_delay"], 5) == 0.7
+
+def test_report_compact_results(client):
+
+    body = pack_result(True, 0.5, 0, 1.0) + pack_result(True, 1.2, 1, 2.0) + pack_result(False, 0.4, 1, 3.0)
+
+    res = client.post("/messages/compact", content=body)
+    assert res.status_code == 200
+
+    # truncated record
+    res = client.post("/messages/compact", content=body[:-1])
+    assert res.status_code == 400
+
+    stats = json.loads(client.get("/statistics").content)
+
+    assert stats["success_messages"] == 2
+    assert stats["failed_messages"] == 1
+    assert round(stats["average_delay"], 5) == 0.7
+
+def test_retrieve_latency(client):
+
+    for delay in [0.1, 0.2, 0.3, 0.4]:
+        client.post("/message", json={"success": True, "delay": delay, "sender_id": 2})
+    client.post("/messages/batch", json=[{"success": False, "delay": 2.0, "sender_id": 5}])
+    client.post("/messages/compact", content=pack_result(True, 0.05, 5, 1.0))
+
+    res = client.get("/statistics/latency")
+    assert res.status_code == 200
+
+    latency = json.loads(res.content)
+
+    assert latency["overall"]["count"] == 6
+    assert latency["overall"]["min_delay"] == 0.05
+    assert latency["overall"]["max_delay"] == 2.0
+    assert set(latency["senders"]) == {"2", "5"}
+    assert latency["senders"]["2"]["count"] == 4
+    assert latency["senders"]["2"]["p50"] == pytest.approx(0.2, rel=0.02)
+    assert latency["senders"]["5"]["p999"] == 2.0
+
+def test_retrieve_history(client):
+
+    client.post("/messages/compact", content=pack_result(True, 0.5, 0, 1000.5) + pack_result(False, 1.5, 0, 1000.7))
+    client.post("/messages/compact", content=pack_result(True, 0.2, 0, 1030.0))
+
+    res = client.get("/statistics/history", params={"start": 1000, "end": 1100})
+    assert res.status_code == 200
+
+    history = json.loads(res.content)
+    assert history["resolution"] == 1
+    assert history["buckets"] == [
+        {"time": 1000, "success_messages": 1, "failed_messages": 1, "average_delay": 1.0},
+        {"time": 1030, "success_messages": 1, "failed_messages": 0, "average_delay": 0.2}
+    ]
+
+    res = client.get("/statistics/history", params={"resolution": "minute", "start": 0, "end": 1100})
+    assert json.loads(res.content)["buckets"] == [
+        {"time": 960, "success_messages": 1, "failed_messages": 1, "average_delay": 1.0},
+        {"time": 1020, "success_messages": 1, "failed_messages": 0, "average_delay": 0.2}
+    ]
+
+    # reported just now, so within the default window
+    client.post("/message", json={"success": True, "delay": 0.3})
+    buckets = json.loads(client.get("/statistics/history").content)["buckets"]
+    assert sum(b["success_messages"] for b in buckets) == 1
+
+    res = client.get("/statistics/history", params={"resolution": "hour"})
+    assert res.status_code == 422
+
 def test_report_message_failure(client):
 
     # missing field
@@ -110,3 +214,51 @@ def test_retrieve_statistics(client):
         assert round(stats["average_delay"], 5) == round(expected_stats[idx]["average_delay"], 5)
 
 
+
+def test_retrieve_metrics(client):
+
+    client.post("/message", json={"success": True, "delay": 0.5})
+
+    res = client.post("/metrics/stages", json={
+        "source": "1234",
+        "stages": {"send": {"description": "Send", "le": [0.1, 1.0], "buckets": [0, 1, 0], "count": 1, "sum": 0.5}}
+    })
+    assert res.status_code == 200
+
+    res = client.post("/metrics/stages", json={"source": "../1234", "stages": {}})
+    assert res.status_code == 400
+
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    assert 'sms_messages_total{result="success"} 1' in res.text
+    assert 'sms_stage_seconds_count{stage="send"} 1' in res.text
+
+def test_queue_telemetry(client):
+
+    assert client.get("/statistics/queue").status_code == 404
+
+    telemetry = {
+        "depth": 0,
+        "peak_depth": 12,
+        "dequeued": 12,
+        "wait_sum": 0.6,
+        "wait_max": 0.2,
+        "wait_le": [0.1, 1.0],
+        "wait_buckets": [10, 2, 0],
+        "lock_acquisitions": 30,
+        "lock_wait_sum": 0.003,
+        "lock_wait_max": 0.001,
+        "priorities": [
+            {"priority": "high", "depth": 0, "dequeued": 2, "wait_sum": 0.01, "wait_max": 0.01, "wait_buckets": [2, 0, 0]},
+            {"priority": "normal", "depth": 0, "dequeued": 10, "wait_sum": 0.59, "wait_max": 0.2, "wait_buckets": [8, 2, 0]}
+        ]
+    }
+    res = client.post("/statistics/queue", json=telemetry)
+    assert res.status_code == 200
+
+    res = client.get("/statistics/queue")
+    assert res.status_code == 200
+    assert json.loads(res.content) == telemetry
+    assert "sms_queue_peak_depth 12" in client.get("/metrics").text
+    assert 'sms_queue_priority_wait_seconds_count{priority="high"} 2' in client.get("/metrics").text
@@ -0,0 +1,114 @@
+import pytest
+
+from monitor.backend.metrics import LatestReports, combine_stages, render_metrics
+from monitor.backend.models import LatencyStatistics, MessageStatistics, PriorityWaitReport, QueueTelemetryReport
+
+def timings(count: int) -> dict[str, dict]:
+    return {"send": {"description": "Send", "le": [0.1, 1.0], "buckets": [count, 0, 1], "count": count + 1, "sum": count * 0.05 + 2}}
+
+def test_latest_reports():
+
+    store = LatestReports()
+    store.put("100", timings(1))
+    store.put("101", timings(2))
+    # a source's latest timings replace its earlier ones
+    store.put("100", timings(3))
+
+    combined = combine_stages(store.sources())
+    assert combined["send"]["buckets"] == [5, 0, 2]
+    assert combined["send"]["count"] == 7
+    assert combined["send"]["sum"] == pytest.approx(4.25)
+
+    with pytest.raises(ValueError):
+        store.put("../outside", timings(1))
+
+    store.reset()
+    assert store.sources() == []
+
+def test_shared_latest_reports(tmp_path):
+
+    # API workers each have their own store on the same directory
+    workers = [LatestReports(str(tmp_path / "stages")) for _ in range(2)]
+    workers[0].put("100", timings(1))
+    workers[1].put("101", timings(2))
+
+    for worker in workers:
+        assert combine_stages(worker.sources())["send"]["count"] == 5
+
+    workers[0].reset()
+    assert workers[1].sources() == []
+
+def test_render_metrics():
+
+    text = render_metrics(
+        MessageStatistics(success_messages=3, failed_messages=1, average_delay=0.5),
+        LatencyStatistics(count=4, min_delay=0.1, max_delay=1.0, p50=0.4, p90=0.9, p99=1.0, p999=1.0),
+        timings(2)
+    )
+    lines = text.splitlines()
+
+    assert "# TYPE sms_messages_total counter" in lines
+    assert 'sms_messages_total{result="failed"} 1' in lines
+    assert 'sms_message_delay_seconds{quantile="0.9"} 0.9' in lines
+    assert "sms_message_delay_seconds_sum 2.0" in lines
+    assert "# TYPE sms_stage_seconds histogram" in lines
+    # buckets are cumulative in the exposition format
+    assert 'sms_stage_seconds_bucket{stage="send",le="1.0"} 2' in lines
+    assert 'sms_stage_seconds_bucket{stage="send",le="+Inf"} 3' in lines
+    assert 'sms_stage_seconds_count{stage="send"} 3' in lines
+    assert text.endswith("\n")
+
+def test_render_queue_metrics():
+
+    queue = QueueTelemetryReport(
+        depth=4,
+        peak_depth=20,
+        dequeued=3,
+        wait_sum=1.5,
+        wait_max=1.2,
+        wait_le=[0.1, 1.0],
+        wait_buckets=[1, 1, 1],
+        lock_acquisitions=10,
+        lock_wait_sum=0.002,
+        lock_wait_max=0.001
+    )
+    statistics = MessageStatistics(success_messages=0, failed_messages=0, average_delay=0)
+    latency = LatencyStatistics(count=0, min_delay=0, max_delay=0, p50=0, p90=0, p99=0, p999=0)
+
+    lines = render_metrics(statistics, latency, {}, queue).splitlines()
+
+    assert "sms_queue_depth 4" in lines
+    assert "sms_queue_peak_depth 20" in lines
+    assert 'sms_queue_wait_seconds_bucket{le="1.0"} 2' in lines
+    assert "sms_queue_wait_seconds_count 3" in lines
+    assert "sms_queue_lock_wait_seconds_count 10" in lines
+    # no stage timings pushed, so no stage histogram
+    assert "# TYPE sms_stage_seconds histogram" not in lines
+
+def test_render_priority_metrics():
+
+    queue = QueueTelemetryReport(
+        depth=1,
+        peak_depth=3,
+        dequeued=2,
+        wait_sum=0.3,
+        wait_max=0.2,
+        wait_le=[0.1, 1.0],
+        wait_buckets=[1, 1, 0],
+        lock_acquisitions=4,
+        lock_wait_sum=0.001,
+        lock_wait_max=0.001,
+        priorities=[
+            PriorityWaitReport(priority="high", depth=0, dequeued=1, wait_sum=0.1, wait_max=0.1, wait_buckets=[1, 0, 0]),
+            PriorityWaitReport(priority="low", depth=1, dequeued=1, wait_sum=0.2, wait_max=0.2, wait_buckets=[0, 1, 0])
+        ]
+    )
+    statistics = MessageStatistics(success_messages=0, failed_messages=0, average_delay=0)
+    latency = LatencyStatistics(count=0, min_delay=0, max_delay=0, p50=0, p90=0, p99=0, p999=0)
+
+    lines = render_metrics(statistics, latency, {}, queue).splitlines()
+
+    assert 'sms_queue_priority_depth{priority="low"} 1' in lines
+    assert 'sms_queue_priority_wait_seconds_bucket{priority="high",le="0.1"} 1' in lines
+    assert 'sms_queue_priority_wait_seconds_bucket{priority="low",le="0.1"} 0' in lines
+    assert 'sms_queue_priority_wait_seconds_count{priority="low"} 1' in lines
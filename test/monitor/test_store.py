@@ -0,0 +1,192 @@
+import pytest
+
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+
+from monitor.backend.histogram import LatencyHistogram
+from monitor.backend.store import MemoryStore, open_store
+
+@pytest.fixture(params=["memory", "shared", "sqlite"])
+def store(request, tmp_path):
+    path = str(tmp_path / "stats.db") if request.param == "sqlite" else f"tst_stats_{os.getpid()}"
+    store = open_store(request.param, path, create=True, num_senders=4)
+    yield store
+    store.close()
+
+def record(store, successes: list[bool], delays: list[float], sender_id: int = 0, timestamps: list[float] = None):
+    store.record(
+        np.array(successes), 
+        np.array(delays, dtype=np.float64), 
+        np.full(len(delays), sender_id), 
+        None if timestamps is None else np.array(timestamps, dtype=np.float64)
+    )
+
+def record_many(kind: str, path: str, count: int):
+    store = open_store(kind, path)
+    for i in range(count):
+        record(store, [i % 2 == 0], [0.5])
+    store.close()
+
+def test_record_and_reset(store):
+    stats = store.statistics()
+    assert stats.success_messages == 0
+    assert stats.failed_messages == 0
+    assert stats.average_delay == 0
+
+    record(store, [True, True], [0.7, 1.0])
+    record(store, [False, False], [0.5, 1.0], sender_id=1)
+
+    stats = store.statistics()
+    assert stats.success_messages == 2
+    assert stats.failed_messages == 2
+    assert stats.average_delay == 0.8
+
+    store.reset()
+    assert store.statistics().success_messages == 0
+    assert store.latency().overall.count == 0
+    assert store.latency().senders == {}
+
+def test_latency(store):
+    delays = np.linspace(0.001, 1.0, 1000)
+    record(store, [True] * 1000, delays, sender_id=1)
+    record(store, [True] * 10, [5.0] * 10, sender_id=3)
+
+    latency = store.latency()
+
+    assert latency.overall.count == 1010
+    assert latency.overall.min_delay == 0.001
+    assert latency.overall.max_delay == 5.0
+    assert latency.overall.p50 == pytest.approx(0.505, rel=0.02)
+    assert latency.overall.p999 == 5.0
+
+    assert sorted(latency.senders) == [1, 3]
+    sender = latency.senders[1]
+    assert sender.count == 1000
+    assert sender.p50 == pytest.approx(0.5, rel=0.02)
+    assert sender.p90 == pytest.approx(0.9, rel=0.02)
+    assert sender.p99 == pytest.approx(0.99, rel=0.02)
+    assert sender.max_delay == 1.0
+    assert latency.senders[3].p50 == 5.0
+
+def test_history(store):
+    record(store, [True, True, False], [0.5, 1.0, 2.0], timestamps=[1000.2, 1000.9, 1001.5])
+    record(store, [True], [0.4], timestamps=[1061.0])
+
+    history = store.history("second", 1000, 1061)
+    assert history.resolution == 1
+    assert [b.time for b in history.buckets] == [1000, 1001, 1061]
+    assert history.buckets[0].success_messages == 2
+    assert history.buckets[0].failed_messages == 0
+    assert history.buckets[0].average_delay == 0.75
+    assert history.buckets[1].failed_messages == 1
+
+    minutes = store.history("minute", 0, 1e12)
+    assert [b.time for b in minutes.buckets][:2] == [960, 1020]
+    assert minutes.buckets[0].success_messages == 2
+    assert minutes.buckets[0].failed_messages == 1
+    assert minutes.buckets[1].success_messages == 1
+
+    # results recorded without a time count as reported now, which 
+    # moves the window past everything above
+    now = time.time()
+    store.record_one(True, 0.1, 0)
+    record(store, [False], [0.3])
+    buckets = store.history("second", 0, now + 10).buckets
+    assert sum(b.success_messages for b in buckets) == 1
+    assert sum(b.failed_messages for b in buckets) == 1
+    assert buckets[0].time >= int(now)
+
+    store.reset()
+    assert store.history("second", 0, 1e12).buckets == []
+
+def test_history_window(store):
+    # Only the latest hour of seconds is kept, and results older 
+    # than that are dropped
+    record(store, [True], [1.0], timestamps=[5000.0])
+    record(store, [True], [1.0], timestamps=[5000.0 + 3600])
+    record(store, [True], [1.0], timestamps=[5000.0])
+    record(store, [True, True, False], [1.0, 1.0, 1.0], timestamps=[5001.0, 6000.0, 8601.5])
+
+    buckets = store.history("second", 0, 1e12).buckets
+    assert [b.time for b in buckets] == [6000, 8600, 8601]
+    assert buckets[-1].failed_messages == 1
+
+@pytest.mark.parametrize("kind", ["shared", "sqlite"])
+def test_cross_process_totals(kind, tmp_path):
+    path = str(tmp_path / "stats.db") if kind == "sqlite" else f"tst_stats_{os.getpid()}"
+    store = open_store(kind, path, create=True)
+
+    try:
+        procs = [multiprocessing.Process(target=record_many, args=(kind, path, 200)) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(timeout=60)
+
+        stats = store.statistics()
+        assert stats.success_messages == 400
+        assert stats.failed_messages == 400
+        assert stats.average_delay == 0.5
+    finally:
+        store.close()
+
+def test_memory_store_stress():
+    store = MemoryStore(num_shards=4)
+    start = threading.Barrier(32)
+
+    def report(thread: int):
+        start.wait()
+        for i in range(5000):
+            if i % 100 == 0:
+                store.statistics()
+            record(store, [thread % 2 == 1], [0.25 * (thread % 4)], sender_id=thread)
+
+    threads = [threading.Thread(target=report, args=(t,)) for t in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # every report from every thread is counted exactly once
+    stats = store.statistics()
+    assert stats.success_messages == 16 * 5000
+    assert stats.failed_messages == 16 * 5000
+    assert stats.average_delay == 0.375
+    assert store.latency().overall.count == 32 * 5000
+    assert store.latency().senders[5].count == 5000
+
+    # threads spread over every shard
+    assert all(shard.success_messages + shard.failed_messages > 0 for shard in store.shards)
+
+def test_average_rounded_on_read():
+    store = MemoryStore()
+
+    # rounding after every update gets stuck near 0.007 here, 
+    # as each update moves the average by less than the rounding
+    record(store, [True], [1.0])
+    for _ in range(100_000):
+        record(store, [True], [0.0])
+
+    assert store.statistics().average_delay == 0.0
+
+def test_histogram_merge():
+    first, second, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    delays = np.random.default_rng(1).exponential(0.5, 10_000)
+
+    first.record(delays[:5000])
+    second.record(delays[5000:])
+    both.record(delays)
+    first.merge(second)
+
+    assert (first.counts == both.counts).all()
+    assert first.summary() == both.summary()
+    assert both.percentile(99) == pytest.approx(np.percentile(delays, 99), rel=0.02)
+    assert both.percentile(100) == delays.max()
+
+def test_unknown_store():
+    with pytest.raises(ValueError):
+        open_store("redis")
@@ -0,0 +1,55 @@
+import pytest
+
+import asyncio
+
+from monitor.backend.stream import StatisticsBroadcaster
+
+def test_broadcast_changes():
+    reads = []
+    value = {"count": 0}
+
+    def read():
+        reads.append(value["count"])
+        return str(value["count"])
+
+    async def run():
+        broadcaster = StatisticsBroadcaster(read, lambda: 0.01)
+        events = broadcaster.events()
+
+        assert await anext(events) == "retry: 10\n\n"
+        assert await anext(events) == "data: 0\n\n"
+
+        # unchanged statistics are not pushed again
+        value["count"] = 1
+        assert await anext(events) == "data: 1\n\n"
+
+        # a late subscriber gets the latest event straight away
+        late = broadcaster.events()
+        await anext(late)
+        assert await anext(late) == "data: 1\n\n"
+
+        assert len(broadcaster.subscribers) == 2
+        await events.aclose()
+        await late.aclose()
+        assert len(broadcaster.subscribers) == 0
+
+    asyncio.run(run())
+
+    # one read per interval, however many subscribers
+    assert len(reads) >= 2
+
+def test_slow_subscriber_coalesces():
+
+    async def run():
+        broadcaster = StatisticsBroadcaster(lambda: "unused", lambda: 60)
+        queue = asyncio.Queue(maxsize=1)
+        broadcaster.subscribers.add(queue)
+
+        for i in range(5):
+            broadcaster.publish(f"data: {i}\n\n")
+
+        # only the newest event is waiting
+        assert queue.qsize() == 1
+        assert queue.get_nowait() == "data: 4\n\n"
+
+    asyncio.run(run())
@@ -0,0 +1,138 @@
+import pytest
+
+import os
+import threading
+
+from msg_queue import durable_queue
+from msg_queue.durable_queue import DurableMessageQueue
+from msg_queue.msg_queue import Message, MessageBatch
+
+@pytest.fixture
+def queue(tmp_path):
+    return DurableMessageQueue(str(tmp_path / "queue"))
+
+def messages(start, stop, priority=1):
+    return [Message(message=f"message {i}", phone="1234567890", priority=priority) for i in range(start, stop)]
+
+def test_push_pull(queue):
+
+    queue.push(Message(message="single ✓", phone="0123456789"))
+    queue.push_many(messages(0, 5))
+    queue.push_batch(MessageBatch.from_messages(messages(5, 10)))
+    assert queue.length() == 11
+
+    msg = queue.pull()
+    assert msg == Message(message="single ✓", phone="0123456789")
+    assert [m.message for m in queue.pull_many(3)] == ["message 0", "message 1", "message 2"]
+
+    # a batch within one block views the mapped file rather than copying it
+    batch = queue.pull_batch(2)
+    assert type(batch.bodies) == memoryview
+    assert batch.to_messages() == messages(3, 5)
+
+    # a batch across blocks is joined
+    assert queue.pull_batch(10).to_messages() == messages(5, 10)
+    assert queue.pull() is None
+    assert queue.length() == 0
+
+    with pytest.raises(ValueError):
+        queue.push(Message(message="bad phone", phone="123"))
+
+def test_priority_lanes(queue):
+
+    queue.push_many(messages(0, 2, priority=2) + messages(2, 4, priority=0))
+
+    assert [m.message for m in queue.pull_many(5)] == ["message 2", "message 3"]
+    assert queue.pull().priority == 2
+
+def test_segments(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(durable_queue, "SEGMENT_SIZE", 1024)
+    path = str(tmp_path / "queue")
+    queue = DurableMessageQueue(path)
+
+    for i in range(0, 100, 5):
+        queue.push_many(messages(i, i + 5))
+    # a block larger than a segment gets one of its own
+    queue.push_batch(MessageBatch.from_messages(messages(100, 200)))
+    segments = os.listdir(os.path.join(path, "normal"))
+    assert len(segments) > 3
+
+    pulled = []
+    while batch := queue.pull_batch(7):
+        pulled.extend(batch.to_messages())
+        queue.ack(len(batch))
+    assert pulled == messages(0, 200)
+
+    # segments behind the first unacknowledged message are deleted
+    assert len(os.listdir(os.path.join(path, "normal"))) == 1
+
+def test_resume(tmp_path):
+
+    path = str(tmp_path / "queue")
+    queue = DurableMessageQueue(path)
+    queue.push_many(messages(0, 10))
+    queue.push(Message(message="urgent", phone="1234567890", priority=0))
+
+    assert queue.pull().message == "urgent"
+    queue.ack()
+    queue.ack(len(queue.pull_many(4)))
+    # pulled but never acknowledged, as if the simulator died sending them
+    queue.pull_many(3)
+    del queue
+
+    resumed = DurableMessageQueue(path)
+    assert resumed.resumed == 6
+    assert resumed.previously_pushed == 11
+    assert not resumed.closed
+    assert resumed.pull_many(10) == messages(4, 10)
+
+    # new pushes follow on from the resumed messages
+    resumed.push_many(messages(10, 12))
+    resumed.close()
+    assert [m.message for m in resumed.pull_many(10)] == ["message 10", "message 11"]
+    resumed.ack(8)
+    assert resumed.wait_until_complete(timeout=1)
+
+def test_resume_closed(tmp_path):
+
+    path = str(tmp_path / "queue")
+    queue = DurableMessageQueue(path)
+    queue.push_many(messages(0, 3))
+    queue.close()
+    del queue
+
+    # a closed queue stays closed, and completes once the rest are sent
+    resumed = DurableMessageQueue(path)
+    assert resumed.closed
+    assert not resumed.drained
+    resumed.ack(len(resumed.pull_many(3)))
+    assert resumed.drained
+    assert resumed.wait_until_complete(timeout=0)
+
+    resumed.destroy()
+    assert not os.path.exists(path)
+
+def test_concurrent_consumers(queue):
+
+    pulled = []
+    lock = threading.Lock()
+
+    def consume():
+        while not queue.drained:
+            batch = queue.pull_many(10, timeout=0.1)
+            with lock:
+                pulled.extend(m.message for m in batch)
+            queue.ack(len(batch))
+
+    consumers = [threading.Thread(target=consume) for _ in range(4)]
+    for consumer in consumers:
+        consumer.start()
+    for i in range(0, 1000, 50):
+        queue.push_many(messages(i, i + 50))
+    queue.close()
+
+    assert queue.wait_until_complete(timeout=10)
+    for consumer in consumers:
+        consumer.join()
+    assert sorted(pulled) == sorted(m.message for m in messages(0, 1000))
@@ -4,7 +4,7 @@ import threading
 import time
 import random
 
-from msg_queue.msg_queue import Message, MessageQueue
+from msg_queue.msg_queue import LaneScheduler, Message, MessageBatch, MessageQueue
 
 @pytest.fixture
 def queue():
@@ -88,4 +88,369 @@ def test_pull_multiple_consumers(queue):
     for msg in [m for tcm in thread_consumed_msgs for m in tcm]:
         msgs_left.remove(msg.message)
 
-    assert len(msgs_left) == 0
\ No newline at end of file
+    assert len(msgs_left) == 0
+
+def test_pull_timeout(queue):
+
+    # empty queue should give up after roughly the timeout
+    start = time.time()
+    assert queue.pull(timeout=0.2) == None
+    assert time.time() - start >= 0.2
+    assert time.time() - start < 1
+
+    msg = Message(message="late message", phone="1234567890")
+
+    def push_later():
+        time.sleep(0.1)
+        queue.push(msg)
+
+    pusher = threading.Thread(target=push_later)
+    pusher.start()
+
+    # waiting consumer should be woken as soon as a message is pushed
+    start = time.time()
+    pulled_msg = queue.pull(timeout=5)
+    assert time.time() - start < 1
+    assert pulled_msg.message == msg.message
+
+    pusher.join()
+
+def test_pull_order(queue):
+
+    for i in range(1000):
+        queue.push(Message(message=f"{i}", phone="1234567890"))
+
+    pulled = [queue.pull().message for _ in range(1000)]
+
+    assert pulled == [f"{i}" for i in range(1000)]
+    assert queue.length() == 0
+
+def test_push_many(queue):
+
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(10)])
+    assert queue.length() == 10
+
+    # generators are accepted too
+    queue.push_many(Message(message=f"{i}", phone="1234567890") for i in range(10, 15))
+    assert queue.length() == 15
+
+    # nothing is pushed if any message is invalid
+    with pytest.raises(ValueError):
+        queue.push_many([Message(message="valid", phone="1234567890"), "not a message"])
+    assert queue.length() == 15
+
+    assert [queue.pull().message for _ in range(15)] == [f"{i}" for i in range(15)]
+
+def test_pull_many(queue):
+
+    assert queue.pull_many(5) == []
+
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(12)])
+
+    first = queue.pull_many(5)
+    assert [m.message for m in first] == [f"{i}" for i in range(5)]
+
+    rest = queue.pull_many(100)
+    assert [m.message for m in rest] == [f"{i}" for i in range(5, 12)]
+
+    assert queue.length() == 0
+
+    start = time.time()
+    assert queue.pull_many(5, timeout=0.1) == []
+    assert time.time() - start >= 0.1
+
+def test_bounded_queue():
+
+    with pytest.raises(ValueError):
+        MessageQueue(max_size=0)
+
+    bounded = MessageQueue(max_size=3)
+    msg = Message(message="fake message", phone="1234567890")
+
+    for _ in range(3):
+        bounded.push(msg)
+
+    # full queue times out rather than growing
+    with pytest.raises(TimeoutError):
+        bounded.push(msg, timeout=0.1)
+    assert bounded.length() == 3
+
+    def pull_later():
+        time.sleep(0.1)
+        bounded.pull()
+
+    puller = threading.Thread(target=pull_later)
+    puller.start()
+
+    # blocked producer resumes once a consumer makes room
+    bounded.push(msg, timeout=5)
+    assert bounded.length() == 3
+
+    puller.join()
+
+def test_bounded_push_many():
+
+    bounded = MessageQueue(max_size=5)
+    num_test_messages = 50
+    pulled = []
+
+    def pull_msgs():
+        while len(pulled) < num_test_messages:
+            pulled.extend(bounded.pull_many(2, timeout=1))
+
+    puller = threading.Thread(target=pull_msgs)
+    puller.start()
+
+    # a batch bigger than the queue is fed in as room frees up
+    bounded.push_many([Message(message=f"{i}", phone="1234567890") for i in range(num_test_messages)])
+
+    puller.join()
+
+    assert [m.message for m in pulled] == [f"{i}" for i in range(num_test_messages)]
+    assert bounded.high_water_mark == 5
+
+def test_high_water_mark(queue):
+
+    msg = Message(message="fake message", phone="1234567890")
+
+    assert queue.high_water_mark == 0
+
+    queue.push_many([msg for _ in range(4)])
+    queue.pull_many(3)
+    queue.push(msg)
+
+    assert queue.length() == 2
+    assert queue.high_water_mark == 4
+
+def test_queue_telemetry(queue):
+
+    msg = Message(message="fake message", phone="1234567890")
+
+    queue.push_many([msg for _ in range(3)])
+    time.sleep(0.05)
+    queue.push_batch(MessageBatch.from_messages([msg for _ in range(4)]))
+    assert len(queue.pull_many(2)) == 2
+
+    telemetry = queue.telemetry()
+    assert telemetry["depth"] == 5
+    assert telemetry["peak_depth"] == 7
+    assert telemetry["dequeued"] == 2
+    # both pulled messages were pushed before the sleep
+    assert telemetry["wait_max"] >= 0.05
+    assert telemetry["wait_sum"] >= 0.1
+    assert sum(telemetry["wait_buckets"]) == 2
+    assert telemetry["lock_acquisitions"] == 3
+
+    # the rest of the first push, then part of the batch
+    assert len(queue.pull_batch(3)) == 3
+    telemetry = queue.telemetry()
+    assert telemetry["dequeued"] == 5
+    assert telemetry["wait_sum"] >= 0.15
+    assert telemetry["wait_sum"] < telemetry["wait_max"] * 5
+
+def test_message_slots():
+
+    msg = Message(message="fake message", phone="1234567890")
+
+    assert not hasattr(msg, "__dict__")
+    with pytest.raises(AttributeError):
+        msg.extra = "not allowed"
+
+def test_message_batch():
+
+    messages = [Message(message=f"message {i}", phone=f"{i:010d}") for i in range(10)]
+    batch = MessageBatch.from_messages(messages)
+
+    assert len(batch) == 10
+    assert batch.to_messages() == messages
+    assert batch.phone(3) == "0000000003"
+    assert list(batch.lengths()) == [len(m.message) for m in messages]
+
+    # slices share the underlying buffer
+    middle = batch.slice(2, 5)
+    assert middle.bodies is batch.bodies
+    assert middle.to_messages() == messages[2:5]
+
+    joined = MessageBatch.concat([batch.slice(0, 3), batch.slice(7, 10)])
+    assert joined.to_messages() == messages[:3] + messages[7:]
+
+    with pytest.raises(ValueError):
+        MessageBatch.from_messages([Message(message="fake", phone="123456789AB")])
+
+    # short or signed phone numbers are rejected rather than zero-padded
+    with pytest.raises(ValueError):
+        MessageBatch.from_messages([Message(message="fake", phone="12345")])
+    with pytest.raises(ValueError):
+        MessageBatch.from_messages([Message(message="fake", phone="+123456789")])
+
+    # lengths are in characters, not encoded bytes
+    accented = MessageBatch.from_messages([Message(message="é" * 100, phone="1234567890")])
+    assert list(accented.lengths()) == [100]
+    assert accented.slice(0, 1).to_messages()[0].message == "é" * 100
+
+def test_push_pull_batch(queue):
+
+    messages = [Message(message=f"{i}", phone="1234567890") for i in range(10)]
+    batch = MessageBatch.from_messages(messages)
+
+    with pytest.raises(ValueError):
+        queue.push_batch(messages)
+
+    queue.push_batch(batch)
+    assert queue.length() == 10
+    assert queue.high_water_mark == 10
+
+    # a whole batch comes back out as one entry, without copying
+    pulled = queue.pull_batch(10)
+    assert pulled.bodies is batch.bodies
+    assert pulled.to_messages() == messages
+    assert queue.pull_batch(10) == None
+
+    # batches are split as needed and mix with single messages in order
+    queue.push(Message(message="single", phone="5555555555"))
+    queue.push_batch(batch)
+
+    assert queue.pull().message == "single"
+    assert queue.pull().message == "0"
+    assert [m.message for m in queue.pull_many(3)] == ["1", "2", "3"]
+    assert queue.pull_batch(4).to_messages() == messages[4:8]
+
+    queue.push(Message(message="last", phone="5555555555"))
+    rest = queue.pull_batch(100)
+    assert [m.message for m in rest] == ["8", "9", "last"]
+    assert queue.length() == 0
+
+def test_bounded_push_batch():
+
+    bounded = MessageQueue(max_size=4)
+    batch = MessageBatch.from_messages([Message(message=f"{i}", phone="1234567890") for i in range(6)])
+
+    # only the part of the batch that fits is pushed before timing out
+    with pytest.raises(TimeoutError):
+        bounded.push_batch(batch, timeout=0.1)
+
+    assert bounded.length() == 4
+    assert [m.message for m in bounded.pull_many(10)] == ["0", "1", "2", "3"]
+
+def test_close_and_complete(queue):
+
+    msg = Message(message="fake message", phone="1234567890")
+    queue.push_many([msg] * 3)
+
+    assert not queue.closed
+    assert not queue.wait_until_complete(timeout=0)
+
+    queue.close()
+    assert queue.closed
+    assert not queue.drained
+
+    with pytest.raises(ValueError):
+        queue.push(msg)
+
+    assert len(queue.pull_many(3)) == 3
+    assert queue.drained
+    assert not queue.wait_until_complete(timeout=0)
+
+    queue.ack(2)
+    assert not queue.wait_until_complete(timeout=0)
+    queue.ack()
+    assert queue.acknowledged == 3
+    assert queue.wait_until_complete(timeout=0)
+
+def test_close_wakes_consumers(queue):
+
+    pulled = []
+    consumer = threading.Thread(target=lambda: pulled.append(queue.pull(timeout=10)))
+    consumer.start()
+
+    start = time.time()
+    queue.close()
+    consumer.join()
+
+    assert time.time() - start < 1
+    assert pulled == [None]
+    assert queue.wait_until_complete(timeout=0)
+
+def test_complete_event(queue):
+
+    msg = Message(message="fake message", phone="1234567890")
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(queue.wait_until_complete(timeout=10)))
+    waiter.start()
+
+    queue.push(msg)
+    queue.close()
+    queue.pull()
+    queue.ack()
+
+    waiter.join()
+    assert waited == [True]
+
+def test_close_multiple_producers():
+
+    queue = MessageQueue(producers=2)
+    queue.close()
+    assert not queue.closed
+    queue.push(Message(message="fake message", phone="1234567890"))
+    queue.close()
+    assert queue.closed
+
+    with pytest.raises(ValueError):
+        MessageQueue(producers=0)
+
+def test_priority_lanes(queue):
+
+    queue.push_many([
+        Message(message="normal 1", phone="1234567890"),
+        Message(message="low", phone="1234567890", priority=2),
+        Message(message="high", phone="1234567890", priority=0),
+        Message(message="normal 2", phone="1234567890")
+    ])
+    queue.push_batch(MessageBatch.from_messages([Message(message="high batch", phone="1234567890", priority=0)]))
+
+    # most urgent lane first, oldest first within each lane
+    assert queue.pull().message == "high"
+    assert [m.message for m in queue.pull_many(5)] == ["high batch"]
+    assert [m.message for m in queue.pull_many(5)] == ["normal 1", "normal 2"]
+    assert queue.pull_batch(5).priority == 2
+    assert queue.length() == 0
+
+    with pytest.raises(ValueError):
+        queue.push(Message(message="fake message", phone="1234567890", priority=3))
+    with pytest.raises(ValueError):
+        MessageBatch.from_messages([
+            Message(message="high", phone="1234567890", priority=0),
+            Message(message="low", phone="1234567890", priority=2)
+        ])
+
+def test_weighted_lanes():
+
+    queue = MessageQueue(lane_weights=[3, 1, 1])
+    queue.push_many([Message(message="high", phone="1234567890", priority=0) for _ in range(100)])
+    queue.push_many([Message(message="low", phone="1234567890", priority=2) for _ in range(100)])
+
+    # low priority gets one pull in four while high has messages
+    pulled = [queue.pull().message for _ in range(40)]
+    assert pulled.count("high") == 30
+    assert pulled.count("low") == 10
+
+    with pytest.raises(ValueError):
+        MessageQueue(lane_weights=[1, 0, 1])
+    with pytest.raises(ValueError):
+        LaneScheduler([1, 1])
+
+def test_priority_telemetry(queue):
+
+    queue.push(Message(message="high", phone="1234567890", priority=0))
+    time.sleep(0.05)
+    queue.push_many([Message(message="normal", phone="1234567890") for _ in range(3)])
+    queue.pull_many(2)
+
+    telemetry = queue.telemetry()
+    high, normal, low = telemetry["priorities"]
+    assert (high["priority"], high["dequeued"], high["depth"]) == ("high", 1, 0)
+    assert high["wait_max"] >= 0.05
+    assert (normal["dequeued"], normal["depth"]) == (0, 3)
+    assert low["dequeued"] == 0
+    assert telemetry["dequeued"] == 1
+    assert telemetry["wait_buckets"] == high["wait_buckets"]
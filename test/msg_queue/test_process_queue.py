@@ -0,0 +1,169 @@
+import pytest
+
+import multiprocessing
+import time
+
+from msg_queue.msg_queue import Message, MessageBatch
+from msg_queue.process_queue import ProcessMessageQueue
+
+@pytest.fixture
+def queue():
+    return ProcessMessageQueue()
+
+def push_range(queue, start, stop):
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(start, stop)])
+
+def pull_all(queue, num_messages, results):
+    pulled = []
+    while len(pulled) < num_messages:
+        pulled.extend(m.message for m in queue.pull_many(num_messages - len(pulled), timeout=1))
+    results.put(pulled)
+
+def push_and_close(queue, start, stop):
+    push_range(queue, start, stop)
+    queue.close()
+
+def consume_and_ack(queue):
+    while not queue.drained:
+        queue.ack(len(queue.pull_many(10, timeout=0.1)))
+
+def test_push_pull(queue):
+
+    msg = Message(message="fake message", phone="1234567890")
+
+    queue.push(msg)
+    queue.push(Message(message="second fake", phone="2345678901"))
+    assert queue.length() == 2
+
+    assert queue.pull(timeout=1) == msg
+    assert queue.pull(timeout=1).message == "second fake"
+    assert queue.length() == 0
+    assert queue.pull(timeout=0.1) == None
+
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(10)])
+    assert queue.length() == 10
+
+    # a pull smaller than the pushed chunk keeps the rest for later pulls
+    assert [m.message for m in queue.pull_many(3, timeout=1)] == ["0", "1", "2"]
+    assert queue.length() == 7
+    assert [m.message for m in queue.pull_many(10, timeout=1)] == [f"{i}" for i in range(3, 10)]
+
+    batch = MessageBatch.from_messages([Message(message=f"{i}", phone="1234567890") for i in range(5)])
+    queue.push_batch(batch)
+    assert queue.pull_batch(5, timeout=1).to_messages() == batch.to_messages()
+
+    assert queue.high_water_mark == 10
+
+def test_process_queue_telemetry():
+
+    queue = ProcessMessageQueue(chunk_size=10)
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(10)])
+
+    time.sleep(0.05)
+    assert len(queue.pull_many(3, timeout=1)) == 3
+
+    # the leftovers go back on the queue with the time they were first queued
+    time.sleep(0.05)
+    assert len(queue.pull_many(7, timeout=1)) == 7
+
+    telemetry = queue.telemetry()
+    assert telemetry["depth"] == 0
+    assert telemetry["peak_depth"] == 10
+    assert telemetry["dequeued"] == 10
+    assert telemetry["wait_max"] >= 0.1
+    assert telemetry["wait_sum"] >= 3 * 0.05 + 7 * 0.1
+    # one push, then each pull claims and releases its messages
+    assert telemetry["lock_acquisitions"] == 5
+
+def test_cross_process(queue):
+
+    num_test_messages = 1000
+    num_test_procs = 3
+    results = multiprocessing.Queue()
+
+    producers = [
+        multiprocessing.Process(target=push_range, args=(queue, i * 500, (i + 1) * 500))
+        for i in range(2)
+    ]
+    consumers = [
+        multiprocessing.Process(target=pull_all, args=(queue, num_test_messages // num_test_procs, results))
+        for _ in range(num_test_procs)
+    ]
+
+    # producers can only exit once their messages are read from the
+    # underlying pipe, so consumers must be running before joining them
+    for proc in producers + consumers:
+        proc.start()
+
+    pulled = [m for _ in consumers for m in results.get(timeout=20)]
+
+    for proc in producers + consumers:
+        proc.join(timeout=20)
+        assert not proc.is_alive()
+
+    # whatever a consumer took beyond its share was put back,
+    # so the rest is still reachable from here
+    while len(pulled) < num_test_messages:
+        leftover = queue.pull_many(num_test_messages, timeout=1)
+        assert leftover
+        pulled.extend(m.message for m in leftover)
+
+    assert sorted(pulled, key=int) == [f"{i}" for i in range(num_test_messages)]
+    assert queue.length() == 0
+
+def test_bounded(queue):
+
+    bounded = ProcessMessageQueue(max_size=2)
+    msg = Message(message="fake message", phone="1234567890")
+
+    bounded.push(msg)
+    bounded.push(msg)
+
+    with pytest.raises(TimeoutError):
+        bounded.push(msg, timeout=0.1)
+
+    assert bounded.pull(timeout=1) == msg
+    bounded.push(msg, timeout=1)
+    assert bounded.length() == 2
+
+def test_complete_across_processes():
+
+    queue = ProcessMessageQueue(chunk_size=10, producers=2)
+
+    procs = [
+        multiprocessing.Process(target=push_and_close, args=(queue, 0, 100)),
+        multiprocessing.Process(target=push_and_close, args=(queue, 100, 150)),
+        multiprocessing.Process(target=consume_and_ack, args=(queue,)),
+        multiprocessing.Process(target=consume_and_ack, args=(queue,))
+    ]
+    for proc in procs:
+        proc.start()
+
+    assert queue.wait_until_complete(timeout=20)
+    assert queue.closed
+    assert queue.acknowledged == 150
+
+    for proc in procs:
+        proc.join(timeout=20)
+        assert not proc.is_alive()
+
+    with pytest.raises(ValueError):
+        queue.push(Message(message="fake message", phone="1234567890"))
+
+def test_priority_lanes(queue):
+
+    queue.push_many([
+        Message(message="low", phone="1234567890", priority=2),
+        Message(message="normal", phone="1234567890"),
+        Message(message="high", phone="1234567890", priority=0)
+    ])
+
+    assert [queue.pull(timeout=1).message for _ in range(3)] == ["high", "normal", "low"]
+    assert queue.telemetry()["priorities"][0]["dequeued"] == 1
+
+def test_close_wakes_consumers(queue):
+
+    queue.close()
+
+    # an indefinite wait ends once the queue is closed
+    assert queue.pull(timeout=None) is None
@@ -0,0 +1,121 @@
+import pytest
+from unittest.mock import AsyncMock
+
+import asyncio
+import threading
+import time
+
+from sender.async_sender import AsyncSender
+from monitor.backend.store import MemoryStore
+from msg_queue.msg_queue import Message, MessageQueue
+
+def test_invalid_async_sender_config():
+
+    with pytest.raises(ValueError):
+        AsyncSender(concurrency=0)
+
+    # validation shared with Sender still applies
+    with pytest.raises(ValueError):
+        AsyncSender(fail_rate=2)
+
+def test_send_message_async():
+
+    sdr = AsyncSender(mean_delay=0, fail_rate=0)
+
+    success, delay = asyncio.run(sdr.send_message(Message(message="not random", phone="5555555555")))
+
+    assert success == True
+    assert delay == 0
+
+    with pytest.raises(ValueError):
+        asyncio.run(sdr.send_message(Message(message="fake", phone="12345")))
+
+def run_consumer(sdr, queue):
+    '''
+        Run `sdr` until the queue is drained, returning 
+        the elapsed time
+    '''
+    consume_thread = threading.Thread(target=asyncio.run, args=(sdr.consume_messages(),))
+
+    start = time.time()
+    consume_thread.start()
+
+    while queue.length() > 0:
+        time.sleep(0.01)
+
+    sdr.finish_consuming = True
+    consume_thread.join()
+
+    return time.time() - start
+
+def test_consume_messages_concurrently():
+
+    num_test_messages = 40
+    delay = 0.1
+
+    queue = MessageQueue()
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(num_test_messages)])
+
+    sdr = AsyncSender(queue=queue, mean_delay=delay, fail_rate=0, concurrency=num_test_messages)
+    sdr.report_result = AsyncMock()
+
+    elapsed = run_consumer(sdr, queue)
+
+    # one at a time this would take about num_test_messages * delay seconds
+    assert elapsed < num_test_messages * delay / 4
+
+    # in-flight messages are finished before returning
+    assert sdr.report_result.await_count == num_test_messages
+    reported = sorted(int(c[0][0].message) for c in sdr.report_result.await_args_list)
+    assert reported == list(range(num_test_messages))
+
+def test_concurrency_limit():
+
+    queue = MessageQueue()
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(20)])
+
+    sdr = AsyncSender(queue=queue, mean_delay=0.02, fail_rate=0, concurrency=4)
+
+    in_flight = 0
+    peak = 0
+
+    async def track(message, result, delay):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    sdr.report_result = track
+
+    run_consumer(sdr, queue)
+
+    assert peak <= 4
+
+def test_consume_until_queue_drained():
+
+    queue = MessageQueue()
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(10)])
+    queue.close()
+
+    sdr = AsyncSender(queue=queue, mean_delay=0.01, fail_rate=0, concurrency=3)
+    sdr.report_result = AsyncMock()
+
+    # returns without being told to stop, once every message is acknowledged
+    asyncio.run(asyncio.wait_for(sdr.consume_messages(), timeout=10))
+
+    assert sdr.report_result.await_count == 10
+    assert queue.acknowledged == 10
+    assert queue.wait_until_complete(timeout=0)
+
+def test_consume_messages_local_store():
+
+    store = MemoryStore()
+    queue = MessageQueue()
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(10)])
+    queue.close()
+
+    sdr = AsyncSender(queue=queue, mean_delay=0, fail_rate=1, concurrency=3, stats_store=store)
+    asyncio.run(asyncio.wait_for(sdr.consume_messages(), timeout=10))
+
+    assert store.statistics().failed_messages == 10
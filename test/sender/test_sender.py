@@ -1,11 +1,16 @@
 import pytest
 from unittest.mock import MagicMock
 
+import json
 import time
 import threading
 
-from sender.sender import Sender
-from msg_queue.msg_queue import Message
+import httpx
+
+from sender.sender import LocalMonitorService, MonitorService, Sender, shared_client
+from monitor.backend.models import unpack_results
+from monitor.backend.store import MemoryStore
+from msg_queue.msg_queue import Message, MessageBatch, MessageQueue
 
 
 @pytest.fixture
@@ -25,6 +30,10 @@ def test_invalid_sender_config():
     with pytest.raises(ValueError):
         sdr = Sender(mean_delay=-1)
 
+    # batch size must be positive
+    with pytest.raises(ValueError):
+        sdr = Sender(batch_size=0)
+
 def test_send_message_instant():
 
     sdr = Sender(mean_delay=0, fail_rate=0)
@@ -135,3 +144,255 @@ def test_consume_messages():
     assert successes <= expected_successes_high
     
 
+
+def test_consume_messages_batched():
+
+    queue = MessageQueue()
+    queue.push_many([Message(message=f"{i}", phone="1234567890") for i in range(25)])
+
+    sdr = Sender(queue=queue, mean_delay=0, fail_rate=0, batch_size=10)
+    sdr.report_result = MagicMock()
+
+    consume_thread = threading.Thread(target=sdr.consume_messages)
+    consume_thread.start()
+
+    while queue.length() > 0:
+        time.sleep(0.01)
+
+    sdr.finish_consuming = True
+    consume_thread.join()
+
+    results = sdr.report_result.call_args_list
+
+    # every message is reported once, in queue order
+    assert [r[0][0].message for r in results] == [f"{i}" for i in range(25)]
+    assert all(r[0][1] == True for r in results)
+
+def test_send_batch():
+
+    batch = MessageBatch.from_messages([Message(message="valid message", phone="1234567890") for _ in range(100)])
+
+    results, delays = Sender(mean_delay=0, fail_rate=0).send_batch(batch)
+    assert len(results) == 100 and results.all()
+    assert len(delays) == 100 and (delays == 0).all()
+
+    results, _ = Sender(mean_delay=0, fail_rate=1).send_batch(batch)
+    assert not results.any()
+
+    invalid = MessageBatch.from_messages([Message(message="", phone="1234567890")])
+    with pytest.raises(ValueError):
+        Sender().send_batch(invalid)
+
+    # phones that are not 10 digits can't be packed into a batch at all
+    with pytest.raises(ValueError):
+        MessageBatch.from_messages([Message(message="fake", phone="12345678901")])
+
+def test_consume_messages_compact():
+
+    queue = MessageQueue()
+    messages = [Message(message=f"{i}", phone="1234567890") for i in range(25)]
+    queue.push_batch(MessageBatch.from_messages(messages))
+    queue.close()
+
+    sdr = Sender(queue=queue, mean_delay=0, fail_rate=0, batch_size=10, compact=True)
+    sdr.report_outcome = MagicMock()
+    sdr.send_batch = MagicMock(wraps=sdr.send_batch)
+
+    consume_thread = threading.Thread(target=sdr.consume_messages)
+    consume_thread.start()
+    consume_thread.join(timeout=10)
+    assert not consume_thread.is_alive()
+    assert queue.acknowledged == 25
+
+    batches = [c[0][0] for c in sdr.send_batch.call_args_list]
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert [m for b in batches for m in b] == messages
+
+    # every message is reported as it finishes, without its body
+    assert sdr.report_outcome.call_count == 25
+    assert all(c[0] == (True, 0.0) for c in sdr.report_outcome.call_args_list)
+
+def test_send_batch_reports_each_message():
+
+    batch = MessageBatch.from_messages([Message(message="valid message", phone="1234567890") for _ in range(5)])
+    sdr = Sender(mean_delay=0.02, fail_rate=0)
+
+    report_times = []
+    start = time.time()
+    sdr.send_batch(batch, on_result=lambda result, delay: report_times.append(time.time() - start))
+
+    # results arrive spread over the batch rather than all at the end
+    assert len(report_times) == 5
+    assert report_times == sorted(report_times)
+    assert report_times[0] < report_times[-1]
+
+def test_send_batch_matches_message_validation():
+
+    sdr = Sender(mean_delay=0, fail_rate=0)
+
+    # 100 characters is valid even when the encoded body is longer
+    accented = Message(message="é" * 100, phone="1234567890")
+    sdr.send_message(accented)
+    sdr.send_batch(MessageBatch.from_messages([accented]))
+
+    too_long = Message(message="é" * 101, phone="1234567890")
+    with pytest.raises(ValueError):
+        sdr.send_message(too_long)
+    with pytest.raises(ValueError):
+        sdr.send_batch(MessageBatch.from_messages([too_long]))
+
+def test_monitor_reuses_client():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={})
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monitor = MonitorService("http://monitor", client=client)
+
+    for _ in range(3):
+        monitor.report_message(Message(message="hello", phone="5555555555"), True, 0.1)
+    monitor.report_outcome(False, 0.2)
+
+    # probe plus four reports, all through the one client
+    assert len(requests) == 5
+    assert all(r.url.path == "/message" for r in requests[1:])
+    assert b"message" not in requests[-1].content
+    assert json.loads(requests[-1].content)["sender_id"] == 0
+
+def test_shared_client():
+    assert shared_client(3) is shared_client(3)
+    assert shared_client(3) is not shared_client(4)
+
+    with pytest.raises(ValueError):
+        MonitorService(pool_size=0)
+
+def mock_monitor_client(requests):
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json="OK")
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+def test_monitor_buffers_reports():
+    requests = []
+    monitor = MonitorService(
+        "http://monitor", 
+        client=mock_monitor_client(requests), 
+        buffer_size=4, 
+        flush_interval=60
+    )
+
+    for i in range(10):
+        monitor.report_outcome(True, i)
+
+    # full buffers are flushed by size, without waiting for the interval
+    deadline = time.time() + 5
+    while len(requests) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(requests) >= 3
+
+    # the rest is flushed on close
+    monitor.close()
+
+    batches = [json.loads(r.content) for r in requests[1:]]
+    assert all(r.url.path == "/messages/batch" for r in requests[1:])
+    assert all(len(b) <= 4 for b in batches)
+    assert [report["delay"] for b in batches for report in b] == list(range(10))
+
+    # after closing, reports are posted right away
+    monitor.report_outcome(False, 1)
+    assert requests[-1].url.path == "/message"
+
+def test_monitor_flushes_by_age():
+    requests = []
+    monitor = MonitorService(
+        "http://monitor", 
+        client=mock_monitor_client(requests), 
+        buffer_size=100, 
+        flush_interval=0.05
+    )
+
+    monitor.report_outcome(True, 0.1)
+    time.sleep(0.5)
+
+    assert len(requests) == 2
+    assert requests[-1].url.path == "/messages/batch"
+    monitor.close()
+
+def test_consume_messages_reports_everything():
+    requests = []
+    queue = MessageQueue()
+    for _ in range(25):
+        queue.push(Message(message="hello", phone="5555555555"))
+
+    sdr = Sender(queue, mean_delay=0, fail_rate=0)
+    sdr.monitor = MonitorService(
+        "http://monitor", 
+        client=mock_monitor_client(requests), 
+        buffer_size=10, 
+        flush_interval=60
+    )
+
+    queue.close()
+
+    # the Sender stops by itself once the closed queue is empty
+    consumer = threading.Thread(target=sdr.consume_messages)
+    consumer.start()
+    consumer.join(timeout=10)
+    assert not consumer.is_alive()
+
+    # nothing left in the buffer once the Sender has stopped
+    reported = [report for r in requests[1:] for report in json.loads(r.content)]
+    assert len(reported) == 25
+    assert queue.acknowledged == 25
+    assert queue.wait_until_complete(timeout=0)
+
+def test_monitor_compact_reports():
+    requests = []
+    monitor = MonitorService(
+        "http://monitor", 
+        client=mock_monitor_client(requests), 
+        report_format="compact",
+        sender_id=7
+    )
+
+    monitor.report_message(Message(message="hello", phone="5555555555"), True, 0.5)
+    monitor.report_outcome(False, 1.5)
+
+    results = [unpack_results(r.content) for r in requests[1:]]
+    assert all(r.url.path == "/messages/compact" for r in requests[1:])
+    assert [len(r) for r in results] == [1, 1]
+    assert results[0]["success"][0] and not results[1]["success"][0]
+    assert results[1]["delay"][0] == 1.5
+    assert (results[0]["sender_id"] == 7).all()
+
+    with pytest.raises(ValueError):
+        MonitorService(report_format="xml")
+
+
+def test_consume_messages_local_store():
+    store = MemoryStore()
+    queue = MessageQueue()
+    for _ in range(20):
+        queue.push(Message(message="hello", phone="5555555555"))
+    queue.close()
+
+    # results go straight to the store, with no Monitor to report to
+    sdr = Sender(queue, mean_delay=0, fail_rate=0, sender_id=3, stats_store=store)
+    assert isinstance(sdr.monitor, LocalMonitorService)
+    sdr.consume_messages()
+
+    assert store.statistics().success_messages == 20
+    assert list(store.latency().senders) == [3]
+    assert queue.acknowledged == 20
+
+def test_monitor_reports_queue():
+    requests = []
+    monitor = MonitorService("http://monitor", client=mock_monitor_client(requests))
+
+    monitor.report_queue({"depth": 3, "peak_depth": 5})
+
+    assert requests[-1].url.path == "/statistics/queue"
+    assert json.loads(requests[-1].content) == {"depth": 3, "peak_depth": 5}
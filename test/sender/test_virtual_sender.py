@@ -0,0 +1,97 @@
+import pytest
+
+import numpy as np
+
+from generator.generator import Generator
+from monitor.backend.store import MemoryStore
+from sender.virtual_sender import VirtualSender, run_virtual_simulation
+
+def test_invalid_virtual_sender_config():
+
+    # validation shared with Sender still applies
+    with pytest.raises(ValueError):
+        VirtualSender(fail_rate=2)
+
+    with pytest.raises(ValueError):
+        VirtualSender(batch_size=0)
+
+    with pytest.raises(ValueError):
+        run_virtual_simulation(Generator(num_messages=10), [])
+
+def test_outcomes():
+
+    sdr = VirtualSender(mean_delay=0.5, fail_rate=0.25, seed=3)
+    outcomes = [outcome for _, outcome in zip(range(10_000), sdr.outcomes())]
+
+    results = np.array([r for r, _ in outcomes])
+    delays = np.array([d for _, d in outcomes])
+
+    assert delays.min() >= 0 and delays.max() <= 1.0
+    assert delays.mean() == pytest.approx(0.5, rel=0.05)
+    assert results.mean() == pytest.approx(0.75, rel=0.05)
+
+    # seeded streams repeat
+    again = VirtualSender(mean_delay=0.5, fail_rate=0.25, seed=3).outcomes()
+    assert [next(again) for _ in range(100)] == outcomes[:100]
+
+def test_single_sender_runs_back_to_back():
+
+    store = MemoryStore()
+    sdr = VirtualSender(mean_delay=0.2, fail_rate=0, seed=1)
+    expected = [d for _, (_, d) in zip(range(50), VirtualSender(mean_delay=0.2, seed=1).outcomes())]
+
+    report = run_virtual_simulation(Generator(num_messages=50, seed=1), [sdr], store)
+
+    # one Sender sends every message in turn, so the run lasts as
+    # long as all the delays together
+    assert report.duration == pytest.approx(sum(expected))
+    assert report.statistics.success_messages == 50
+    assert report.statistics.average_delay == round(sum(expected) / 50, 4)
+    assert report.elapsed < 5
+
+    buckets = report.history.buckets
+    assert report.history.resolution == 1
+    assert sum(b.success_messages for b in buckets) == 50
+    assert buckets[0].time == 0
+    assert buckets[-1].time == int(report.duration)
+
+def test_senders_share_messages():
+
+    senders = [
+        VirtualSender(mean_delay=0.1, fail_rate=0, sender_id=0, seed=1),
+        VirtualSender(mean_delay=0.4, fail_rate=1, sender_id=1, seed=2)
+    ]
+
+    report = run_virtual_simulation(Generator(num_messages=10_000, seed=1), senders)
+
+    # the faster Sender frees up, and so takes messages, four times as often
+    assert report.statistics.success_messages == pytest.approx(8000, rel=0.05)
+    assert report.statistics.failed_messages == pytest.approx(2000, rel=0.1)
+    assert report.latency.senders[0].count == report.statistics.success_messages
+    assert report.throughput == pytest.approx(1 / 0.1 + 1 / 0.4, rel=0.05)
+
+    # long runs report throughput per minute
+    assert report.duration > 3600 or report.history.resolution == 1
+
+def test_batches():
+
+    senders = [VirtualSender(mean_delay=0.1, fail_rate=0, batch_size=7, sender_id=i, seed=i) for i in range(3)]
+
+    report = run_virtual_simulation(Generator(num_messages=1000, seed=1), senders)
+
+    assert report.statistics.success_messages == 1000
+    # each Sender finishes its batch before taking another, so none
+    # is ever more than one batch's worth of work behind the others
+    free = sorted(sdr.free_at for sdr in senders)
+    assert free[-1] - free[0] < 7 * 0.2
+    assert report.duration == free[-1]
+
+def test_invalid_generated_messages():
+
+    generator = Generator(num_messages=10, seed=1)
+    generated = generator.generate_batch(10)
+    generated.phones[0] = 10 ** 11
+    generator.generate_batch = lambda count: generated
+
+    with pytest.raises(ValueError):
+        run_virtual_simulation(generator, [VirtualSender(seed=1)])
@@ -1,10 +1,13 @@
 import pytest
 from unittest.mock import MagicMock
 
+import os
 import time
 import threading
 
 from simulator import *
+from msg_queue.msg_queue import Message
+from msg_queue.durable_queue import DurableMessageQueue
 
 def test_adjust_senders():
 
@@ -50,6 +53,8 @@ def test_set_cfg_from_file():
             "num_messages": 100,
             "num_senders": 2,
             "monitor_update_interval": 1.1,
+            "batch_size": 20,
+            "max_queue_size": 500,
             "sender_settings": [
                 {
                     "mean_delay": 0.2,
@@ -67,6 +72,8 @@ def test_set_cfg_from_file():
     assert test_config.num_messages == 100
     assert test_config.num_senders == 2
     assert test_config.monitor_update_interval == 1.1
+    assert test_config.batch_size == 20
+    assert test_config.max_queue_size == 500
     assert len(test_config.sender_settings) == 2
     assert test_config.sender_settings[0].mean_delay == 0.2
     assert test_config.sender_settings[0].fail_rate == 0.1
@@ -146,6 +153,40 @@ def test_process_arguments():
             ],
             monitor_update_interval=1.1
         ), None),
+        (["-b", "50", "-m", "500"], SimulatorConfig(num_messages=500, batch_size=50), None),
+        (["-b"], None, SystemExit),
+        (["-b", "0"], None, SystemExit),
+        (["-q", "0"], None, SystemExit),
+        (["-q", "100"], SimulatorConfig(max_queue_size=100), None),
+        (["-g", "numpy", "-r", "7"], SimulatorConfig(generation_mode="numpy", seed=7), None),
+        (["-g", "compact"], SimulatorConfig(generation_mode="compact"), None),
+        (["-g", "fortran"], None, SystemExit),
+        (["-x", "process", "-P", "4", "-G", "2"], SimulatorConfig(execution_mode="process", num_processes=4, generator_shards=2), None),
+        (["-x", "fibers"], None, SystemExit),
+        (["-x", "async", "-C", "500"], SimulatorConfig(execution_mode="async", sender_concurrency=500), None),
+        (["-x", "virtual"], SimulatorConfig(execution_mode="virtual"), None),
+        (["-C", "0"], None, SystemExit),
+        (["-k", "32"], SimulatorConfig(monitor_pool_size=32), None),
+        (["-k", "0"], None, SystemExit),
+        (["-B", "1", "-F", "0.5"], SimulatorConfig(report_buffer_size=1, report_flush_interval=0.5), None),
+        (["-F", "0"], None, SystemExit),
+        (["-f", "json"], SimulatorConfig(report_format="json"), None),
+        (["-f", "xml"], None, SystemExit),
+        (["-W", "4"], SimulatorConfig(monitor_workers=4), None),
+        (["-W", "4", "-T", "sqlite"], SimulatorConfig(monitor_workers=4, stats_store="sqlite"), None),
+        (["-W", "4", "-T", "memory"], None, SystemExit),
+        (["-T", "redis"], None, SystemExit),
+        (["-M", "headless", "-J", "summary.json"], SimulatorConfig(monitor_mode="headless", summary_path="summary.json"), None),
+        (["-M", "tui"], None, SystemExit),
+        (["-I", "on", "-p", "run.prof"], SimulatorConfig(instrument=True, profile_path="run.prof"), None),
+        (["-I", "yes"], None, SystemExit),
+        (["-y", "1,8,1", "-w", "4,2,1"], SimulatorConfig(priority_mix=[1, 8, 1], lane_weights=[4, 2, 1]), None),
+        (["-y", "1,1"], None, SystemExit),
+        (["-y", "0,0,0"], None, SystemExit),
+        (["-w", "1,0,1"], None, SystemExit),
+        (["-D", "queue_dir"], SimulatorConfig(queue_path="queue_dir"), None),
+        (["-D", "queue_dir", "-x", "process"], None, SystemExit),
+        (["-R", "missing_corpus.bin"], None, SystemExit),
         (["-a"], None, SystemExit),
         (["-m"], None, SystemExit),
         (["-m", "abc"], None, SystemExit),
@@ -180,6 +221,11 @@ def test_launch_monitor():
         assert interval_res.status_code == 200
         assert json.loads(interval_res.content)["interval"] == 1
 
+        with httpx.stream("GET", "http://localhost:8000/statistics/stream") as stream_res:
+            assert stream_res.headers["content-type"].startswith("text/event-stream")
+            events = (line for line in stream_res.iter_lines() if line.startswith("data: "))
+            assert "success_messages" in json.loads(next(events)[len("data: "):])
+
         passed = True
     except AssertionError as e:
         err = e
@@ -188,4 +234,303 @@ def test_launch_monitor():
         api_proc.kill()
         if not passed:
             raise err
-        
\ No newline at end of file
+        
+def test_launch_monitor_workers():
+    import httpx
+    import simulator
+
+    config = SimulatorConfig(monitor_workers=3)
+    api_proc, monitor_proc = launch_monitor(config)
+
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                httpx.get("http://localhost:8000/")
+                break
+            except httpx.TransportError:
+                time.sleep(0.2)
+
+        # reports spread across workers all land in the shared store
+        def report():
+            with httpx.Client() as client:
+                for _ in range(50):
+                    client.post("http://localhost:8000/message", json={"success": True, "delay": 0.5}, headers={"Connection": "close"})
+
+        reporters = [threading.Thread(target=report) for _ in range(4)]
+        for r in reporters:
+            r.start()
+        for r in reporters:
+            r.join()
+
+        stats = json.loads(httpx.get("http://localhost:8000/statistics").content)
+        assert stats["success_messages"] == 200
+        assert stats["average_delay"] == 0.5
+    finally:
+        monitor_proc.kill()
+        api_proc.terminate()
+        api_proc.join()
+        simulator.stats_store.close()
+
+def test_launch_process_simulation():
+
+    config = adjust_senders(SimulatorConfig(
+        num_messages=200,
+        num_senders=3,
+        sender_settings=[SenderSettings(mean_delay=0, fail_rate=0)] * 3,
+        monitor_url=None,
+        batch_size=10,
+        execution_mode="process",
+        num_processes=2,
+        generator_shards=2,
+        seed=1
+    ))
+
+    queue = create_queue(config)
+    assert type(queue) == ProcessMessageQueue
+
+    workers, worker_procs, generator_proc = launch_simulation(config, queue)
+
+    assert len(workers) == 2
+    assert type(generator_proc) == GeneratorShards
+
+    assert queue.wait_until_complete(timeout=30)
+    assert queue.acknowledged == 200
+
+    for worker in workers:
+        worker.finish_consuming = True
+    for proc in worker_procs:
+        proc.join()
+    generator_proc.join()
+
+    assert queue.length() == 0
+    assert all(not worker.process.is_alive() for worker in workers)
+
+def test_launch_async_simulation():
+
+    config = adjust_senders(SimulatorConfig(
+        num_messages=100,
+        num_senders=2,
+        sender_settings=[SenderSettings(mean_delay=0.05, fail_rate=0)] * 2,
+        monitor_url=None,
+        execution_mode="async",
+        sender_concurrency=50
+    ))
+
+    queue = create_queue(config)
+    senders, loop_threads, generator_thread = launch_simulation(config, queue)
+
+    assert all(type(sender) == AsyncSender for sender in senders)
+
+    assert wait_for_completion(queue, loop_threads)
+    assert queue.acknowledged == 100
+
+    for sender in senders:
+        sender.finish_consuming = True
+    for thread in loop_threads:
+        thread.join()
+    generator_thread.join()
+
+    assert queue.length() == 0
+
+def test_wait_for_completion():
+
+    config = adjust_senders(SimulatorConfig(
+        num_messages=50,
+        num_senders=3,
+        sender_settings=[SenderSettings(mean_delay=0, fail_rate=0)] * 3,
+        monitor_url=None,
+        batch_size=5
+    ))
+
+    queue = create_queue(config)
+    senders, sender_threads, generator_thread = launch_simulation(config, queue)
+
+    assert wait_for_completion(queue, sender_threads)
+    assert queue.acknowledged == 50
+
+    # Senders stop by themselves once everything is consumed
+    for st in sender_threads:
+        st.join(timeout=10)
+        assert not st.is_alive()
+    generator_thread.join()
+
+    # if every Sender stops early, waiting gives up
+    stalled = MessageQueue()
+    stalled.push(Message(message="fake message", phone="1234567890"))
+    stalled.close()
+    assert not wait_for_completion(stalled, [])
+
+    # called back while waiting
+    intervals = []
+    assert not wait_for_completion(stalled, [], on_interval=lambda: intervals.append(1))
+    assert intervals == [1]
+
+def test_launch_virtual_simulation(capsys):
+
+    config = adjust_senders(SimulatorConfig(
+        num_messages=5000,
+        num_senders=4,
+        execution_mode="virtual",
+        seed=11
+    ))
+
+    report = launch_virtual_simulation(config)
+
+    assert report.statistics.success_messages + report.statistics.failed_messages == 5000
+    assert report.latency.overall.count == 5000
+    # 4 Senders averaging 0.5s each get through about 8 messages a second
+    assert report.throughput == pytest.approx(8, rel=0.05)
+
+    # the same seed gives the same run
+    assert launch_virtual_simulation(config).statistics == report.statistics
+
+    print_report(report, virtual=True)
+    assert "Sent messages:   " in capsys.readouterr().out
+
+def test_run_headless_simulation(capsys):
+
+    for mode in ["thread", "async"]:
+        config = adjust_senders(SimulatorConfig(
+            num_messages=500,
+            num_senders=4,
+            sender_settings=[SenderSettings(mean_delay=0, fail_rate=0.2) for _ in range(4)],
+            execution_mode=mode,
+            monitor_mode="headless",
+            seed=3
+        ))
+
+        report = run_headless_simulation(config)
+
+        # every result reaches the store without a Monitor running
+        assert report.statistics.success_messages + report.statistics.failed_messages == 500
+        assert report.queue.dequeued == 500
+        assert report.queue.peak_depth > 0
+        assert report.latency.overall.count == 500
+        assert sum(b.success_messages + b.failed_messages for b in report.history.buckets) == 500
+        assert report.throughput > 0
+
+    print_report(report)
+    out = capsys.readouterr().out
+    assert "Completed in" in out
+    assert "Queue wait:" in out
+
+def test_run_headless_process_simulation():
+
+    config = adjust_senders(SimulatorConfig(
+        num_messages=300,
+        num_senders=2,
+        sender_settings=[SenderSettings(mean_delay=0, fail_rate=0) for _ in range(2)],
+        execution_mode="process",
+        num_processes=2,
+        monitor_mode="headless"
+    ))
+
+    report = run_headless_simulation(config)
+
+    assert report.statistics.success_messages == 300
+    assert report.latency.overall.count == 300
+
+def test_run_headless_priority_simulation(capsys):
+
+    for mode in ["thread", "process"]:
+        config = adjust_senders(SimulatorConfig(
+            num_messages=400,
+            num_senders=2,
+            sender_settings=[SenderSettings(mean_delay=0, fail_rate=0) for _ in range(2)],
+            generation_mode="compact",
+            execution_mode=mode,
+            num_processes=2,
+            monitor_mode="headless",
+            priority_mix=[1, 2, 1],
+            lane_weights=[4, 2, 1],
+            seed=5
+        ))
+
+        report = run_headless_simulation(config)
+
+        assert report.statistics.success_messages == 400
+        lanes = report.queue.priorities
+        assert [lane.priority for lane in lanes] == ["high", "normal", "low"]
+        assert sum(lane.dequeued for lane in lanes) == 400
+        assert all(lane.dequeued > 0 for lane in lanes)
+
+    print_report(report)
+    assert "high:" in capsys.readouterr().out
+
+def test_run_headless_durable_simulation(tmp_path):
+
+    path = str(tmp_path / "queue")
+    config = adjust_senders(SimulatorConfig(
+        num_messages=300,
+        num_senders=2,
+        sender_settings=[SenderSettings(mean_delay=0, fail_rate=0) for _ in range(2)],
+        generation_mode="compact",
+        monitor_mode="headless",
+        queue_path=path
+    ))
+
+    # an earlier run pushed 100 messages before dying, sending none
+    earlier = DurableMessageQueue(path)
+    earlier.push_many([Message(message="from earlier", phone="1234567890") for _ in range(100)])
+    del earlier
+
+    report = run_headless_simulation(config)
+
+    # the rest are generated, and the queue's files removed once all are sent
+    assert report.statistics.success_messages == 300
+    assert not os.path.exists(path)
+
+def test_run_headless_replay_simulation(tmp_path, capsys):
+
+    path = str(tmp_path / "corpus.bin")
+    main("simulator.py", "generate", path, "-m", "500", "-r", "2", "-y", "1,2,1")
+    assert "Wrote 500 messages" in capsys.readouterr().out
+
+    assert process_arguments(["-R", path, "-m", "500"]) == SimulatorConfig(num_messages=500, corpus_path=path)
+    for args in [["-R", path, "-m", "501"], ["-R", path, "-x", "virtual"]]:
+        with pytest.raises(SystemExit):
+            process_arguments(args)
+
+    expected = np.bincount(Corpus(path).priorities[:400], minlength=3).tolist()
+    for mode, generation_mode in [("thread", "compact"), ("async", "numpy"), ("process", "compact")]:
+        config = adjust_senders(SimulatorConfig(
+            num_messages=400,
+            num_senders=2,
+            sender_settings=[SenderSettings(mean_delay=0, fail_rate=0) for _ in range(2)],
+            generation_mode=generation_mode,
+            execution_mode=mode,
+            num_processes=2,
+            generator_shards=2,
+            monitor_mode="headless",
+            corpus_path=path
+        ))
+
+        report = run_headless_simulation(config)
+
+        # every run replays the same messages, with the priorities they were written with
+        assert report.statistics.success_messages == 400
+        assert [lane.dequeued for lane in report.queue.priorities] == expected
+
+def test_write_report(tmp_path):
+
+    config = adjust_senders(SimulatorConfig(num_messages=100, execution_mode="virtual", seed=1))
+    report = launch_virtual_simulation(config)
+
+    path = tmp_path / "summary.json"
+    write_report(report, str(path))
+
+    with open(path) as summary:
+        written = json.load(summary)
+    assert written["statistics"]["success_messages"] == report.statistics.success_messages
+    assert written["throughput"] == report.throughput
+
+def test_profiler(tmp_path):
+    import pstats
+
+    path = str(tmp_path / "run.prof")
+    profiler = start_profiler(path)
+    adjust_senders(SimulatorConfig())
+    stop_profiler(profiler, path)
+
+    assert "adjust_senders" in str(pstats.Stats(path).stats)
@@ -0,0 +1,105 @@
+import pytest
+
+import csv
+import importlib.util
+
+from simulator import SenderSettings, SimulatorConfig, adjust_senders
+from sweep import *
+
+def test_parse_values():
+
+    assert parse_values("5", int) == [5]
+    assert parse_values("5,10,20", int) == [5, 10, 20]
+    assert parse_values("10:40:10", int) == [10, 20, 30, 40]
+    assert parse_values("0.1:0.3:0.1,0.5", float) == [0.1, 0.2, 0.3, 0.5]
+
+    with pytest.raises(ValueError):
+        parse_values("1:5:0", int)
+
+    with pytest.raises(ValueError):
+        parse_values("ten", int)
+
+def test_process_sweep_arguments(tmp_path):
+
+    base, grid, output, jobs = process_sweep_arguments(
+        ["-S", "5,10", "-d", "0.1:0.2:0.1", "-b", "10", "-r", "3", "-o", str(tmp_path / "out.csv"), "-j", "2"]
+    )
+
+    assert grid == {"num_senders": [5, 10], "mean_delay": [0.1, 0.2]}
+    assert base.batch_size == 10
+    assert base.seed == 3
+    assert base.execution_mode == "virtual"
+    assert base.monitor_mode == "headless"
+    assert output == str(tmp_path / "out.csv")
+    assert jobs == 2
+
+    base, _, _, _ = process_sweep_arguments(["-x", "async"])
+    assert base.execution_mode == "async"
+    assert base.monitor_mode == "headless"
+
+    for argv in [["-o", "results.txt"], ["-j", "0"], ["-S"], ["-x", "process"], ["-q", "0"]]:
+        with pytest.raises(SystemExit):
+            process_sweep_arguments(argv)
+
+def test_sweep_configs():
+
+    base = adjust_senders(SimulatorConfig(
+        num_senders=3,
+        sender_settings=[SenderSettings(mean_delay=0.1, fail_rate=0.2), SenderSettings(mean_delay=0.3, fail_rate=0.4)]
+    ))
+
+    configs = sweep_configs(base, {"num_senders": [1, 4], "fail_rate": [0, 0.5], "num_messages": [100]})
+
+    assert len(configs) == 4
+    assert [(c.num_senders, len(c.sender_settings)) for c in configs] == [(1, 1), (1, 1), (4, 4), (4, 4)]
+    assert all(c.num_messages == 100 for c in configs)
+    assert [s.fail_rate for s in configs[3].sender_settings] == [0.5] * 4
+
+    # unswept settings come from the base config, which is unchanged
+    assert [s.mean_delay for s in configs[2].sender_settings] == [0.1, 0.3, 0.5, 0.5]
+    assert base.sender_settings[0].fail_rate == 0.2
+    assert shared_setting(configs[2], "mean_delay") is None
+    assert shared_setting(configs[2], "fail_rate") == 0
+
+    assert sweep_configs(base, {}) == [base]
+
+def test_run_sweep(tmp_path):
+
+    base = SimulatorConfig(execution_mode="virtual", seed=5)
+    configs = sweep_configs(base, {"num_senders": [2, 4], "mean_delay": [0.1], "num_messages": [2000]})
+
+    rows = run_sweep(configs, jobs=2)
+
+    assert [row["num_senders"] for row in rows] == [2, 4]
+    assert all(row["success_messages"] + row["failed_messages"] == 2000 for row in rows)
+    # twice the Senders finish in about half the time
+    assert rows[1]["completion_time"] == pytest.approx(rows[0]["completion_time"] / 2, rel=0.1)
+    assert rows[1]["throughput"] == pytest.approx(40, rel=0.1)
+
+    # runs are reproducible however they are spread across processes
+    assert [row["success_messages"] for row in run_sweep(configs, jobs=1)] == [row["success_messages"] for row in rows]
+
+    path = tmp_path / "results.csv"
+    write_results(rows, str(path))
+    with open(path) as results:
+        written = list(csv.DictReader(results))
+    assert list(written[0]) == RESULT_COLUMNS
+    assert [int(row["num_senders"]) for row in written] == [2, 4]
+
+@pytest.mark.skipif(importlib.util.find_spec("pyarrow") is not None, reason="pyarrow is installed")
+def test_parquet_needs_pyarrow(tmp_path):
+
+    with pytest.raises(ImportError):
+        write_results([], str(tmp_path / "results.parquet"))
+
+def test_run_headless_sweep():
+
+    base = SimulatorConfig(execution_mode="thread", monitor_mode="headless", seed=5)
+    configs = sweep_configs(base, {"num_senders": [2], "mean_delay": [0, 0.005], "num_messages": [200]})
+
+    rows = run_sweep(configs, jobs=2)
+
+    assert all(row["success_messages"] + row["failed_messages"] == 200 for row in rows)
+    # real delays take real time
+    assert rows[1]["completion_time"] >= 200 * 0.005 / 2 * 0.5
+    assert rows[0]["completion_time"] < rows[1]["completion_time"]